@@ -10,13 +10,34 @@ app_license = "mit"
 # Document Events
 doc_events = {
     "Employee": {
-        "on_update": "sut_app_datev_export.sut_app_datev_export.server_scripts.employee.employee_on_update"
+        "before_save": "sut_app_datev_export.sut_app_datev_export.server_scripts.employee.employee_before_save"
     } ,
     "Personalerfassungsbogen" : {
+        "before_save": "sut_app_datev_export.sut_app_datev_export.server_scripts.personal.personal_before_save",
         "on_update": "sut_app_datev_export.sut_app_datev_export.server_scripts.personal.employee_on_update"
 
+    },
+    # Invalidate the cached export schema when the source DocTypes change
+    "DocType": {
+        "on_update": "sut_app_datev_export.sut_app_datev_export.utils.export_cache.clear_schema_cache_on_change"
+    },
+    "Custom Field": {
+        "on_update": "sut_app_datev_export.sut_app_datev_export.utils.export_cache.clear_schema_cache_on_change",
+        "on_trash": "sut_app_datev_export.sut_app_datev_export.utils.export_cache.clear_schema_cache_on_change"
+    },
+    # Invalidate the cached department code lookup
+    "Abteilung fuer DATEV Lodas Export": {
+        "on_update": "sut_app_datev_export.sut_app_datev_export.utils.export_cache.clear_department_codes",
+        "on_trash": "sut_app_datev_export.sut_app_datev_export.utils.export_cache.clear_department_codes",
+        "after_rename": "sut_app_datev_export.sut_app_datev_export.utils.export_cache.clear_department_codes"
     }
 }
+
+after_migrate = [
+    "sut_app_datev_export.sut_app_datev_export.utils.export_cache.clear_schema_cache",
+    "sut_app_datev_export.sut_app_datev_export.utils.export_context.clear_export_context"
+]
+
 # Custom fields
 fixtures = [
     {
@@ -29,7 +50,7 @@ fixtures = [
                             "Employee-custom_steueridentnummer" , "Employee-custom_straße" , "Employee-custom_summe_gehalt_bei_offener_vertragsverhandlung" ,
                             "Employee-custom_summe_wochenarbeitszeit" , "Employee-custom_lohnart_gg" , "Employee-custom_lohnart_p1" ,
                             "Employee-custom_lohnart_p2" , "Employee-custom_lohnart_p3" , "Employee-custom_lohnart_p4" , "Employee-custom_lohnart_z1" ,
-                            "Employee-custom_lohnart_z2" , "Employee-custom_summe_gehalt"
+                            "Employee-custom_lohnart_z2" , "Employee-custom_summe_gehalt" , "Employee-custom_datev_fingerprint"
                             ]]
         ]
     } ,
@@ -69,7 +90,7 @@ fixtures = [
 
 # include js, css files in header of desk.html
 # app_include_css = "/assets/sut_app_datev_export/css/sut_app_datev_export.css"
-# app_include_js = "/assets/sut_app_datev_export/js/sut_app_datev_export.js"
+app_include_js = "/assets/sut_app_datev_export/js/datev_export_progress.js"
 
 # include js, css files in header of web template
 # web_include_css = "/assets/sut_app_datev_export/css/sut_app_datev_export.css"
@@ -87,7 +108,7 @@ fixtures = [
 
 # include js in doctype views
 doctype_js = {"Employee" : "sut_app_datev_export/client_script/employee.js"}
-# doctype_list_js = {"doctype" : "public/js/doctype_list.js"}
+doctype_list_js = {"Employee" : "sut_app_datev_export/client_script/employee_list.js"}
 # doctype_tree_js = {"doctype" : "public/js/doctype_tree.js"}
 # doctype_calendar_js = {"doctype" : "public/js/doctype_calendar.js"}
 
@@ -0,0 +1,28 @@
+import frappe
+
+def execute():
+    """Move the export history rows of DATEV Export SUT Settings to DATEV Export Run documents."""
+    if not frappe.db.table_exists('DATEV Export History'):
+        return
+
+    rows = frappe.db.sql("""
+        SELECT `export_date`, `creation`, `employee_count`, `status`, `message`
+        FROM `tabDATEV Export History`
+        WHERE `parenttype` = %(settings)s AND `parent` = %(settings)s
+        ORDER BY `idx`
+    """, {'settings': 'DATEV Export SUT Settings'}, as_dict=True)
+
+    for row in rows:
+        frappe.get_doc({
+            'doctype': 'DATEV Export Run',
+            'export_date': row.export_date or row.creation,
+            'status': row.status,
+            'employee_count': row.employee_count,
+            'message': row.message
+        }).insert(ignore_permissions=True)
+
+    # The settings no longer have the history table, drop the moved rows
+    frappe.db.delete('DATEV Export History', {
+        'parenttype': 'DATEV Export SUT Settings',
+        'parent': 'DATEV Export SUT Settings'
+    })
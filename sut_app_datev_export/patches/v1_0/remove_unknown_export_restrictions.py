@@ -0,0 +1,23 @@
+import frappe
+
+from sut_app_datev_export.sut_app_datev_export.utils.export_restrictions import is_restrictable_field
+
+def execute():
+    """Remove export restrictions naming fields that are written to no LODAS column.
+
+    The restrictions are validated against the record spec when the settings are saved.
+    Rows naming other fields (e.g. basislohn) never changed the export, but would now
+    block saving the settings.
+    """
+    rows = frappe.get_all(
+        'Mehrfach Export unterdruecken',
+        filters={'parenttype': 'DATEV Export SUT Settings', 'parent': 'DATEV Export SUT Settings'},
+        fields=['name', 'field_name']
+    )
+
+    unknown = [row for row in rows if row.field_name and not is_restrictable_field(row.field_name)]
+    if not unknown:
+        return
+
+    frappe.db.delete('Mehrfach Export unterdruecken', {'name': ['in', [row.name for row in unknown]]})
+    print("Removed export restrictions of fields not written to DATEV: " + ", ".join(row.field_name for row in unknown))
@@ -0,0 +1,39 @@
+frappe.provide('sut_app_datev_export');
+
+// Shared by the settings form and the Employee list: follows the background export
+// through realtime events and calls on_done once the export succeeded
+sut_app_datev_export.track_export_progress = function(on_done) {
+  const title = __('Exporting employee data...');
+  frappe.show_progress(title, 0, 100, __('Export queued'));
+
+  frappe.realtime.off('datev_export_progress');
+  frappe.realtime.on('datev_export_progress', function(data) {
+    const message = data.company ? `${data.message} (${data.company})` : data.message;
+    frappe.show_progress(title, data.percent, 100, message);
+  });
+
+  frappe.realtime.off('datev_export_done');
+  frappe.realtime.on('datev_export_done', function(data) {
+    frappe.realtime.off('datev_export_progress');
+    frappe.realtime.off('datev_export_done');
+    frappe.hide_progress();
+
+    if (data.error) {
+      frappe.msgprint({
+        title: __('Export Failed'),
+        indicator: 'red',
+        message: data.error
+      });
+      return;
+    }
+
+    frappe.msgprint({
+      title: __('Export Complete'),
+      indicator: 'green',
+      message: __('Exported {0} employees. Email sent to {1}', [data.count, data.email])
+    });
+    if (on_done) {
+      on_done(data);
+    }
+  });
+};
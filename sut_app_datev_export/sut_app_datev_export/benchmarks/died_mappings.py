@@ -0,0 +1,95 @@
+"""Micro-benchmark for map_value_to_died().
+
+Compares the precompiled lookup tables against the former linear scan over
+the mapping dicts, and checks that both return identical values.
+
+Run with:
+    python -m sut_app_datev_export.sut_app_datev_export.benchmarks.died_mappings
+"""
+import timeit
+
+from sut_app_datev_export.sut_app_datev_export.utils.died_mappings import (
+    DATE_FIELDS,
+    DIED_MAPPINGS,
+    PASSTHROUGH_FIELDS,
+    format_date,
+    map_value_to_died
+)
+
+def linear_map_value_to_died(field_name, value):
+    """Reference implementation: the linear scan used before the lookup tables were compiled."""
+    if value is None:
+        return ""
+
+    value_lower = str(value).lower() if value else ""
+
+    if field_name in list(DATE_FIELDS):
+        return format_date(value)
+
+    if field_name in list(PASSTHROUGH_FIELDS):
+        return value
+
+    if field_name in DIED_MAPPINGS:
+        mapping = DIED_MAPPINGS[field_name]
+        result = ""
+        for key, mapped_value in mapping.items():
+            if key.lower() == value_lower:
+                result = mapped_value
+                break
+        if not result and value_lower:
+            result = mapping.get('', "")
+            if not result:
+                result = value
+        if not result and not value_lower:
+            result = mapping.get('', "")
+    else:
+        result = value
+
+    return result
+
+def get_sample_values(field_name):
+    """All mapping keys in several spellings plus unknown and empty values."""
+    values = [None, "", 0, "unbekannt", "NICHT VORHANDEN"]
+    for key in DIED_MAPPINGS[field_name]:
+        values.extend([key, key.upper(), key.title()])
+    return values
+
+def check_equivalence():
+    """Raise AssertionError if the compiled lookup differs from the linear scan."""
+    for field_name in DIED_MAPPINGS:
+        for value in get_sample_values(field_name):
+            expected = linear_map_value_to_died(field_name, value)
+            actual = map_value_to_died(field_name, value)
+            assert actual == expected, (field_name, value, expected, actual)
+
+def run(number=20):
+    """Time both implementations on the country tables and on all DIED tables."""
+    check_equivalence()
+
+    cases = {
+        "country tables": ("geburtsland", "staatsangehoerigkeit", "custom_land"),
+        "all DIED tables": tuple(DIED_MAPPINGS),
+    }
+    results = {}
+    for label, field_names in cases.items():
+        samples = [(field_name, value) for field_name in field_names for value in get_sample_values(field_name)]
+        timings = {}
+        for name, function in (("linear", linear_map_value_to_died), ("compiled", map_value_to_died)):
+            seconds = min(timeit.repeat(
+                lambda: [function(field_name, value) for field_name, value in samples],
+                number=number,
+                repeat=3
+            ))
+            timings[name] = seconds / (number * len(samples))
+        results[label] = timings
+        print(
+            f"{label}: {len(samples)} values, "
+            f"linear {timings['linear'] * 1e6:.2f} us/call, "
+            f"compiled {timings['compiled'] * 1e6:.2f} us/call, "
+            f"speedup {timings['linear'] / timings['compiled']:.1f}x"
+        )
+
+    return results
+
+if __name__ == "__main__":
+    run()
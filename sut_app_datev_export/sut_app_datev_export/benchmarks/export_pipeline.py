@@ -0,0 +1,156 @@
+"""Offline benchmark suite for the export pipeline.
+
+Runs without a site or database: if frappe cannot be imported, the in-memory stand-in
+(see frappe_standin) is installed and filled with synthetic Employee, Personalerfassungsbogen
+and Kinder Tabelle rows (see synthetic.make_rows). Reports throughput and peak traced
+memory for each stage and size, so every performance change can be compared.
+
+Run with:
+    python -m sut_app_datev_export.sut_app_datev_export.benchmarks.export_pipeline [--no-memory] [100 1000 ...]
+
+With frappe installed, run it on a site instead (the fetch stage is skipped there):
+    bench --site <site> execute sut_app_datev_export.sut_app_datev_export.benchmarks.export_pipeline.run --kwargs "{'sizes': [1000]}"
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+from sut_app_datev_export.sut_app_datev_export.benchmarks import frappe_standin
+
+# Must run before the app modules below import frappe
+STANDIN = frappe_standin.install()
+
+import frappe
+
+from sut_app_datev_export.sut_app_datev_export.benchmarks.synthetic import (
+    COMPANIES,
+    DEPARTMENTS,
+    make_employees_by_company,
+    make_rows
+)
+from sut_app_datev_export.sut_app_datev_export.utils.died_mappings import map_value_to_died
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+    DEFAULT_EXPORT_CHUNK_SIZE,
+    DIED,
+    LODAS_FIELD_MAPPING,
+    get_employees_for_export,
+    get_export_company_counts,
+    iter_employees_for_export,
+    map_employee_to_lodas
+)
+from sut_app_datev_export.sut_app_datev_export.utils.file_builder import (
+    generate_employee_data,
+    generate_lodas_files,
+    generate_lodas_files_streamed
+)
+
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+# Source fields mapped through the DIED tables
+DIED_SOURCE_FIELDS = tuple(source for _, source, conversion in LODAS_FIELD_MAPPING if conversion == DIED)
+
+def get_settings():
+    """Export settings with a client number for every synthetic company."""
+    return frappe._dict(
+        consultant_number='123456',
+        company_client_mapping=[
+            frappe._dict(company=company, client_number=f"{10001 + index}")
+            for index, company in enumerate(COMPANIES)
+        ],
+        mehrfach_export_unterdruecken=[],
+        delta_export=0,
+        parallel_export=0
+    )
+
+def measure(function, memory=True):
+    """Return (seconds, peak traced memory in bytes or None, result) for `function()`.
+
+    Time and memory are measured in separate runs, since tracing slows the function down.
+    """
+    start = time.perf_counter()
+    result = function()
+    seconds = time.perf_counter() - start
+
+    peak = None
+    if memory:
+        tracemalloc.start()
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak, result
+
+def write_files(employees_by_company, settings):
+    """Generate the LODAS files, remove them and return their total size in bytes."""
+    file_paths = generate_lodas_files(employees_by_company, settings)
+    total_bytes = 0
+    for file_info in file_paths:
+        total_bytes += os.path.getsize(file_info['path'])
+        os.remove(file_info['path'])
+    return total_bytes
+
+def write_files_streamed(settings, chunk_size=DEFAULT_EXPORT_CHUNK_SIZE):
+    """Fetch and write the LODAS files chunk by chunk, remove them and return their total size in bytes."""
+    company_chunks = ((company, iter_employees_for_export(company, chunk_size)) for company in get_export_company_counts())
+    file_paths = generate_lodas_files_streamed(company_chunks, settings)
+    total_bytes = 0
+    for file_info in file_paths:
+        total_bytes += os.path.getsize(file_info['path'])
+        os.remove(file_info['path'])
+    return total_bytes
+
+def run_size(size, memory=True):
+    """Run all stages for `size` employees; returns {stage: result}."""
+    settings = get_settings()
+    results = {}
+
+    def record(stage, items, unit, seconds, peak):
+        results[stage] = {'items': items, 'seconds': seconds, 'per_second': items / seconds if seconds else 0, 'peak_bytes': peak}
+        peak_text = f"{peak / 1024 / 1024:8.1f} MiB" if peak is not None else "       - MiB"
+        print(f"{size:>7} {stage:<24} {seconds:9.3f} s {items / seconds if seconds else 0:>12,.0f} {unit}/s  peak {peak_text}")
+
+    if STANDIN:
+        # Fetch from the stand-in tables, so merging the Personalerfassungsbogen is included
+        frappe_standin.load_tables(make_rows(size))
+        seconds, peak, employees_by_company = measure(get_employees_for_export, memory)
+        record('fetch (stand-in)', size, 'employees', seconds, peak)
+    else:
+        employees_by_company = make_employees_by_company(size)
+
+    employees = [employee for employees in employees_by_company.values() for employee in employees]
+    department_codes = dict(DEPARTMENTS) if STANDIN else None
+
+    died_values = [(field, employee.get(field)) for employee in employees for field in DIED_SOURCE_FIELDS]
+    seconds, peak, _ = measure(lambda: [map_value_to_died(field, value) for field, value in died_values], memory)
+    record('map_value_to_died', len(died_values), 'calls', seconds, peak)
+
+    seconds, peak, _ = measure(lambda: [map_employee_to_lodas(employee, department_codes) for employee in employees], memory)
+    record('map_employee_to_lodas', len(employees), 'employees', seconds, peak)
+
+    seconds, peak, _ = measure(lambda: generate_employee_data(employees, settings, department_codes), memory)
+    record('generate_employee_data', len(employees), 'employees', seconds, peak)
+
+    seconds, peak, total_bytes = measure(lambda: write_files(employees_by_company, settings), memory)
+    record('generate_lodas_files', len(employees), 'employees', seconds, peak)
+    results['generate_lodas_files']['file_bytes'] = total_bytes
+
+    if STANDIN:
+        # Fetch and write in chunks: the peak memory is bounded by the chunk size, not the size
+        del employees, employees_by_company, died_values
+        seconds, peak, total_bytes = measure(lambda: write_files_streamed(settings), memory)
+        record('fetch + files (streamed)', size, 'employees', seconds, peak)
+        results['fetch + files (streamed)']['file_bytes'] = total_bytes
+
+    return results
+
+def run(sizes=DEFAULT_SIZES, memory=True):
+    """Run the suite for each size; returns {size: {stage: result}}."""
+    print(f"frappe: {'offline stand-in' if STANDIN else frappe.__file__}")
+    print(f"{'size':>7} {'stage':<24} {'time':>11} {'throughput':>22}  peak memory")
+    return {int(size): run_size(int(size), memory) for size in sizes}
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    memory = '--no-memory' not in args
+    sizes = [int(arg) for arg in args if arg != '--no-memory'] or DEFAULT_SIZES
+    run(sizes, memory)
@@ -0,0 +1,253 @@
+"""Minimal in-memory stand-in for frappe, so the offline benchmarks run without a site.
+
+Only what the export pipeline uses is provided: `_dict`, `_`, `get_all` over in-memory
+tables (`in` and `>` filters, `group_by` with counts), `db` (exists, get_table_columns, no-op writes), `cache`, `local`, `session` and
+the few `frappe.utils` date and conversion helpers. It is installed only if frappe cannot be imported;
+with frappe installed, run the benchmarks on a site through `bench execute` instead.
+
+Usage (before importing any module of the app):
+    from sut_app_datev_export.sut_app_datev_export.benchmarks import frappe_standin
+    frappe_standin.install()
+    frappe_standin.load_tables({'Employee': [...], ...})
+"""
+import json
+import secrets
+import sys
+import types
+from datetime import datetime
+
+# doctype -> list of row dicts
+TABLES = {}
+
+# (doctype, field) -> {value: [rows]}, built on the first `in` or equality filter on the field
+_INDEXES = {}
+
+class _dict(dict):
+    """Attribute access to dict keys, like frappe._dict."""
+
+    def __getattr__(self, key):
+        return self.get(key)
+
+    def __setattr__(self, key, value):
+        self[key] = value
+
+    def copy(self):
+        return _dict(self)
+
+class ValidationError(Exception):
+    pass
+
+class _Cache:
+    """Process-local replacement for the Redis cache."""
+
+    def __init__(self):
+        self.values = {}
+
+    def get_value(self, key, generator=None):
+        if key not in self.values and generator:
+            self.values[key] = generator()
+        return self.values.get(key)
+
+    def set_value(self, key, value):
+        self.values[key] = value
+
+    def delete_value(self, key):
+        self.values.pop(key, None)
+
+class _Database:
+    """Reads go to TABLES; writes and raw SQL are accepted and ignored."""
+
+    def exists(self, doctype, name=None):
+        if doctype == 'DocType':
+            return name if name in TABLES else None
+        return name if any(row.get('name') == name for row in TABLES.get(doctype, ())) else None
+
+    def get_table_columns(self, doctype):
+        columns = set()
+        for row in TABLES.get(doctype, ()):
+            columns.update(row)
+        return list(columns)
+
+    def count(self, doctype, filters=None):
+        return sum(1 for row in TABLES.get(doctype, ()) if _matches(row, filters))
+
+    def sql(self, query, values=None, as_dict=False, **kwargs):
+        return []
+
+    def get_single_value(self, doctype, fieldname):
+        return None
+
+    def delete(self, doctype, filters=None):
+        pass
+
+    def bulk_insert(self, doctype, fields, values, **kwargs):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self, **kwargs):
+        pass
+
+def _matches(row, filters):
+    for field, condition in (filters or {}).items():
+        if isinstance(condition, (list, tuple)):
+            operator, value = condition
+            if operator == 'in':
+                if row.get(field) not in value:
+                    return False
+            elif operator == '>':
+                if row.get(field) is None or not row.get(field) > value:
+                    return False
+            else:
+                raise NotImplementedError(f"Filter operator {operator} is not supported by the stand-in")
+        elif row.get(field) != condition:
+            return False
+    return True
+
+def _sort_rows(rows, order_by):
+    # Stable sorts from the last to the first key
+    for part in reversed([part.split() for part in order_by.split(',')]):
+        field = part[0]
+        reverse = len(part) > 1 and part[1].lower() == 'desc'
+        rows.sort(key=lambda row: (row.get(field) is not None, row.get(field)), reverse=reverse)
+    return rows
+
+def get_all(doctype, filters=None, fields=None, order_by=None, pluck=None, limit=None, distinct=False, group_by=None, **kwargs):
+    fields = [pluck] if pluck else list(fields or ['name'])
+    filters = dict(filters or {})
+
+    # Resolve an `in` or equality filter through an index, so chunked lookups don't scan the table
+    candidates = TABLES.get(doctype, ())
+    for field, condition in filters.items():
+        if isinstance(condition, (list, tuple)) and condition[0] == 'in':
+            index = _get_index(doctype, field)
+            candidates = [row for value in dict.fromkeys(condition[1]) for row in index.get(value, ())]
+            del filters[field]
+            break
+    else:
+        # Otherwise start from the most selective equality filter
+        equal = [(field, _get_index(doctype, field).get(condition, ())) for field, condition in filters.items()
+            if not isinstance(condition, (list, tuple))]
+        if equal:
+            field, candidates = min(equal, key=lambda item: len(item[1]))
+            del filters[field]
+
+    rows = [row for row in candidates if _matches(row, filters)]
+    if group_by:
+        rows = _group_rows(rows, group_by, fields)
+        fields = [field.split(' as ')[-1] for field in fields]
+    if order_by:
+        rows = _sort_rows(rows, order_by)
+    rows = [_dict((field, row.get(field)) for field in fields) for row in rows]
+    if distinct:
+        unique = {}
+        for row in rows:
+            unique.setdefault(tuple(row.values()), row)
+        rows = list(unique.values())
+    if limit:
+        rows = rows[:int(limit)]
+    if pluck:
+        return [row.get(pluck) for row in rows]
+    return rows
+
+def _group_rows(rows, group_by, fields):
+    """Group rows by one field; supports `count(...) as alias` fields."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.get(group_by), []).append(row)
+
+    grouped = []
+    for value, members in groups.items():
+        row = _dict({group_by: value})
+        for field in fields:
+            if field.startswith('count('):
+                row[field.split(' as ')[-1]] = len(members)
+        grouped.append(row)
+    return grouped
+
+def _get_index(doctype, field):
+    key = (doctype, field)
+    if key not in _INDEXES:
+        index = _INDEXES[key] = {}
+        for row in TABLES.get(doctype, ()):
+            index.setdefault(row.get(field), []).append(row)
+    return _INDEXES[key]
+
+def throw(msg, exc=ValidationError, title=None):
+    raise exc(msg)
+
+def parse_json(value):
+    return json.loads(value) if isinstance(value, str) else value
+
+def generate_hash(txt=None, length=56):
+    return secrets.token_hex(length // 2 + 1)[:length]
+
+def format_datetime(value, format_string=None):
+    """Supports the ICU-style patterns used by the export (e.g. yyyyMMddHHmmss)."""
+    for token, directive in (('yyyy', '%Y'), ('MM', '%m'), ('dd', '%d'), ('HH', '%H'), ('mm', '%M'), ('ss', '%S')):
+        format_string = format_string.replace(token, directive)
+    return value.strftime(format_string)
+
+def now_datetime():
+    return datetime.now()
+
+def now():
+    return now_datetime().strftime('%Y-%m-%d %H:%M:%S.%f')
+
+def cint(value):
+    try:
+        return int(float(value or 0))
+    except (TypeError, ValueError):
+        return 0
+
+def is_installed():
+    """True if the stand-in (and not frappe) is imported as `frappe`."""
+    return getattr(sys.modules.get('frappe'), '__standin__', False)
+
+def install():
+    """Register the stand-in as `frappe` unless frappe is importable. Returns True if installed."""
+    if is_installed():
+        return True
+    try:
+        import frappe  # noqa: F401
+        return False
+    except ImportError:
+        pass
+
+    frappe = types.ModuleType('frappe')
+    frappe.__standin__ = True
+    frappe.__path__ = []
+    frappe._dict = _dict
+    frappe._ = lambda message, *args, **kwargs: message
+    frappe.ValidationError = ValidationError
+    frappe.get_all = frappe.get_list = get_all
+    frappe.db = _Database()
+    frappe.cache = _Cache()
+    frappe.local = _dict(site='offline-benchmark')
+    frappe.session = _dict(user='Administrator')
+    frappe.throw = throw
+    frappe.msgprint = lambda *args, **kwargs: None
+    frappe.log_error = lambda *args, **kwargs: None
+    frappe.parse_json = parse_json
+    frappe.generate_hash = generate_hash
+
+    utils = types.ModuleType('frappe.utils')
+    utils.now = now
+    utils.now_datetime = now_datetime
+    utils.format_datetime = format_datetime
+    utils.cint = cint
+    frappe.utils = utils
+
+    sys.modules['frappe'] = frappe
+    sys.modules['frappe.utils'] = utils
+    return True
+
+def load_tables(tables):
+    """Replace the in-memory tables (doctype -> list of row dicts) and clear the cache."""
+    TABLES.clear()
+    _INDEXES.clear()
+    for doctype, rows in tables.items():
+        TABLES[doctype] = [_dict(row) for row in rows]
+    if is_installed():
+        sys.modules['frappe'].cache.values.clear()
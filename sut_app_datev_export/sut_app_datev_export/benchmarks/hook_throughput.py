@@ -0,0 +1,87 @@
+"""Benchmark: save throughput with the previous and the current export flag hooks.
+
+Works on a temporary copy of an existing employee, which is deleted at the end.
+The previous hooks commit on every save, so this must not run inside a transaction
+that should be rolled back.
+
+Run on a site with:
+    bench --site <site> execute sut_app_datev_export.sut_app_datev_export.benchmarks.hook_throughput.run --kwargs "{'saves': 200}"
+"""
+import time
+
+import frappe
+
+from sut_app_datev_export.sut_app_datev_export.server_scripts.personal import employee_on_update as personal_on_update
+
+def legacy_employee_on_update(doc, method=None):
+    """Previous Employee on_update hook: extra UPDATE and commit inside the save."""
+    if not doc.custom_for_next_export:
+        frappe.db.set_value("Employee", doc.name, "custom_for_next_export", 1, update_modified=False)
+        frappe.db.commit()
+
+def legacy_personal_on_update(doc, method=None):
+    """Previous Personalerfassungsbogen on_update hook: load the Employee, db_set and commit."""
+    get_emp_doc = frappe.get_doc("Employee", doc.employee)
+    if not get_emp_doc.custom_for_next_export:
+        get_emp_doc.db_set('custom_for_next_export', 1, update_modified=False)
+        frappe.db.commit()
+
+def reset_flag(employee_name):
+    frappe.db.sql("UPDATE `tabEmployee` SET `custom_for_next_export` = 0 WHERE `name` = %s", employee_name)
+
+def measure_employee_saves(doc, saves, legacy):
+    """Save the employee `saves` times with the flag reset before each save."""
+    start = time.perf_counter()
+    for _ in range(saves):
+        reset_flag(doc.name)
+        doc.custom_for_next_export = 0
+        doc.save(ignore_permissions=True)
+        if legacy:
+            # Clear the flag in memory, so the old hook runs its UPDATE and commit as it did
+            doc.custom_for_next_export = 0
+            legacy_employee_on_update(doc)
+    frappe.db.commit()
+    return time.perf_counter() - start
+
+def measure_personal_hook(employee_name, calls, hook):
+    """Call a Personalerfassungsbogen hook `calls` times with the flag reset before each call."""
+    # Changed fingerprint, so the current hook always runs its UPDATE
+    doc = frappe._dict(
+        doctype='Personalerfassungsbogen',
+        employee=employee_name,
+        flags=frappe._dict(datev_fingerprint_changed=True)
+    )
+    start = time.perf_counter()
+    for _ in range(calls):
+        reset_flag(employee_name)
+        hook(doc)
+    frappe.db.commit()
+    return time.perf_counter() - start
+
+def run(saves=200):
+    """Compare the previous and the current hooks on a temporary employee."""
+    saves = int(saves)
+    template = frappe.get_all('Employee', filters={'status': 'Active'}, pluck='name', limit=1)
+    if not template:
+        print("No active employee found to copy")
+        return
+
+    doc = frappe.copy_doc(frappe.get_doc('Employee', template[0]))
+    doc.user_id = None
+    doc.first_name = f"DATEV Benchmark {frappe.generate_hash(length=6)}"
+    doc.insert(ignore_permissions=True)
+    frappe.db.commit()
+
+    results = {}
+    try:
+        results["employee_save_legacy"] = measure_employee_saves(doc, saves, legacy=True)
+        results["employee_save"] = measure_employee_saves(doc, saves, legacy=False)
+        results["personal_hook_legacy"] = measure_personal_hook(doc.name, saves, legacy_personal_on_update)
+        results["personal_hook"] = measure_personal_hook(doc.name, saves, personal_on_update)
+    finally:
+        frappe.delete_doc('Employee', doc.name, ignore_permissions=True, force=True)
+        frappe.db.commit()
+
+    for name, seconds in results.items():
+        print(f"{name}: {saves} calls, {seconds:.2f} s, {saves / seconds:.0f} per second")
+    return results
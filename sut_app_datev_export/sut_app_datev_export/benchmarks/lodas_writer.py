@@ -0,0 +1,66 @@
+"""Benchmark: whole-file string concatenation vs. the streaming LODAS writer.
+
+Run on a site with:
+    bench --site <site> execute sut_app_datev_export.sut_app_datev_export.benchmarks.lodas_writer.run
+"""
+import os
+import tempfile
+import time
+import tracemalloc
+
+from sut_app_datev_export.sut_app_datev_export.benchmarks.synthetic import make_employees
+from sut_app_datev_export.sut_app_datev_export.utils.file_builder import (
+    generate_complete_employee_records,
+    generate_lodas_file_header,
+    generate_record_description,
+    write_lodas_file
+)
+
+def write_concatenated(path, consultant_number, client_number, employees, settings):
+    """Reference implementation: build the whole file with `+=`, then write it at once."""
+    content = generate_lodas_file_header(consultant_number, client_number)
+    content += generate_record_description()
+    content += "[Stammdaten]\n"
+    for employee in employees:
+        content += generate_complete_employee_records(employee, settings)
+
+    with open(path, 'w', encoding='cp1252', newline='\r\n') as f:
+        f.write(content)
+
+def measure(writer, path, employees, settings):
+    """Return (seconds, peak traced memory in bytes) for a writer.
+    
+    Time and memory are measured in separate runs, since tracing slows the writer down.
+    """
+    start = time.perf_counter()
+    writer(path, "123456", "10001", employees, settings)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    writer(path, "123456", "10001", employees, settings)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+def run(employee_count=10000):
+    """Write the same synthetic company file with both writers and compare."""
+    employee_count = int(employee_count)
+    employees = make_employees(employee_count)
+    settings = {'mehrfach_export_unterdruecken': []}
+
+    # Warm up caches (department codes, serializers) outside the measurement
+    generate_complete_employee_records(employees[0], settings)
+
+    results = {}
+    outputs = {}
+    for name, writer in (("concatenated", write_concatenated), ("streamed", write_lodas_file)):
+        path = os.path.join(tempfile.gettempdir(), f"datev_lodas_benchmark_{name}.txt")
+        seconds, peak = measure(writer, path, employees, settings)
+        with open(path, 'rb') as f:
+            outputs[name] = f.read()
+        os.remove(path)
+        results[name] = {"seconds": seconds, "peak_bytes": peak, "file_bytes": len(outputs[name])}
+        print(f"{name}: {employee_count} employees, {seconds:.2f} s, peak {peak / 1024 / 1024:.1f} MiB, file {len(outputs[name]) / 1024 / 1024:.1f} MiB")
+
+    assert outputs["concatenated"] == outputs["streamed"], "Writers produced different files"
+    return results
@@ -0,0 +1,196 @@
+"""Deterministic synthetic employees for the benchmarks.
+
+Employees are returned in the shape produced by get_employees_for_export():
+Employee fields merged with Personalerfassungsbogen fields and a `children` list.
+make_rows() splits them into Employee, Personalerfassungsbogen and Kinder Tabelle rows.
+"""
+import random
+
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+    CHILD_FIELDS,
+    EMPLOYEE_FIELDS,
+    PERSONALERFASSUNGSBOGEN_FIELDS,
+    PERSONALERFASSUNGSBOGEN_WAGE_FIELDS
+)
+
+COMPANIES = ('Muster GmbH', 'Beispiel AG', 'Test KG')
+
+DEPARTMENTS = {
+    '100-Verwaltung': '100',
+    '200-Entwicklung': '200',
+    '300-Vertrieb': '300',
+}
+
+_COUNTRIES = ('deutschland', 'österreich', 'frankreich', 'polen', 'türkei', 'italien', 'spanien', 'ukraine')
+_NATIONALITIES = ('Deutschland', 'Österreich', 'Frankreich', 'Polen', 'Türkei', 'Italien', 'Spanien', 'Ukraine')
+_YES_NO = ('ja', 'nein', None)
+
+def make_employee(index, company=None, rnd=None):
+    """Build one enriched employee dict."""
+    rnd = rnd or random.Random(index)
+    company = company or COMPANIES[index % len(COMPANIES)]
+    last_name = f"Müller{index}"
+
+    employee = {
+        'name': f"HR-EMP-{index:06d}",
+        'company': company,
+        'employee_name': f"Jörg {last_name}",
+        'designation': rnd.choice(('Entwickler', 'Buchhaltung', None)),
+        'custom_land': rnd.choice(_NATIONALITIES),
+        'custom_anschriftenzusatz': rnd.choice(('', 'c/o Schmidt')),
+        'custom_befristung_arbeitserlaubnis': None,
+        'custom_arbeitsverhältnis': rnd.choice(('befristet', 'unbefristet')),
+        'custom_befristung_aufenthaltserlaubnis': None,
+        'relieving_date': rnd.choice((None, '2026-12-31')),
+        'date_of_joining': '2020-04-01',
+        'personal_email': f"mitarbeiter{index}@example.com",
+        'custom_ersteintritt_ins_unternehmen_': '2020-04-01',
+        'last_name': last_name,
+        'date_of_birth': f"19{60 + index % 40}-0{1 + index % 9}-1{index % 10}",
+        'gender': rnd.choice(('Männlich', 'Weiblich', 'Divers')),
+        'custom_hausnummer': str(1 + index % 120),
+        'custom_höchste_berufsausbildung': 'Bachelor',
+        'custom_höchster_schulabschluss': 'Abitur/Fachabitur',
+        'custom_steueridentnummer': str(10000000000 + index),
+        'custom_summe_wochenarbeitszeit': rnd.choice((40, 38.5, 20)),
+        'custom_ort': 'Köln',
+        'employee_number': str(index % 100000),
+        'custom_plz': '50667',
+        'custom_befristung_gdb_bescheid': rnd.choice((None, None, None, '2027-06-30')),
+        'custom_schwerbehinderung': rnd.choice(('nein', 'nein', 'ja')),
+        'custom_straße': 'Hauptstraße',
+        'cell_number': '0170 1234567',
+        'first_name': 'Jörg',
+        'custom_summe_gehalt': 3500 + index % 1000,
+        'employment_type': 'Vollzeit',
+        'custom_stored_value_of_summe_wochenarbeitszeit': rnd.choice((None, 40)),
+        'custom_lohnart_gg': 200,
+        'custom_lohnart_p1': 201,
+        'custom_lohnart_p2': 202,
+        'custom_lohnart_p3': None,
+        'custom_lohnart_p4': None,
+        'custom_lohnart_z1': 300,
+        'custom_lohnart_z2': None,
+        'custom_gehalt_des_grundvertrags': 3500,
+        'custom_gehalt_projekt_1': rnd.choice((None, 500)),
+        'custom_gehalt_projekt_2': None,
+        'custom_gehalt_projekt_3': None,
+        'custom_gehalt_projekt_4': None,
+        'custom_zulage_zulage_1': rnd.choice((None, 150.5)),
+        'custom_zulage_zulage_2': None,
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt': rnd.choice((0, 1)),
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1': 0,
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2': 0,
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3': 0,
+
+        # Personalerfassungsbogen fields
+        'abweichender_kontoinhaber': None,
+        'akademischer_grad': rnd.choice((None, 'Dr.')),
+        'alleinerziehend': rnd.choice(_YES_NO),
+        'anzahl_kinderfreibeträge': rnd.choice((None, 0.5, 1)),
+        'arbeits_ausbildungsbeginn_tt_mm_jjjj': None,
+        'arbeits_ausbildungsende_tt_mm_jjjj': None,
+        'arbeitsbescheinigung_im_austrittsmonat_elektr_ueberm': rnd.choice(_YES_NO),
+        'arbeitszeit_18_std_mit_zulassung_aa': None,
+        'ausstellende_dienststelle': None,
+        'ausweis_nr_aktenzeichen': None,
+        'automatische_loeschung_nach_austritt_unterdruecken': rnd.choice(_YES_NO),
+        'bescheinigung_nach_313_sgb_iii_elektronisch_ueberm': rnd.choice(_YES_NO),
+        'bic': 'COLSDE33XXX',
+        'datum_des_todes': None,
+        'eel_meldung_nach_austritt_des_arbeitnehmers': rnd.choice(_YES_NO),
+        'ehrenamtliche_taetigkeit': rnd.choice(_YES_NO),
+        'einmalbezuege_nach_austritt_d_arbeitnehmers_berechnen': rnd.choice(_YES_NO),
+        'entlohnungsform': rnd.choice(('Gehalt', 'Stundenlohn')),
+        'erstbeschaeftigung': rnd.choice(_YES_NO),
+        'ersteintrittsdatum_fuer_aag_und_brutto_netto_verwenden': rnd.choice(_YES_NO),
+        'geburtsland': rnd.choice(_COUNTRIES).title(),
+        'geburtsname': None,
+        'geburtsort': 'Bonn',
+        'grundurlaubsanspruch': 30,
+        'iban': f"DE{index:020d}",
+        'jobticket_hoehe_des_geldwerten_vorteils': rnd.choice((None, 49)),
+        'kennzeichnung_arbeitgeber_haupt_nebenarbeitgeber': 'Hauptarbeitgeber',
+        'konfessionszugehoerigkeit_steuerpflichtiger': rnd.choice((
+            'konfessionslos / keine Kirchensteuerberechnung',
+            'ev - evangelische Kirchensteuer',
+            'rk - römisch-katholische Kirchensteuer'
+        )),
+        'namenszusatz_geburtsname': None,
+        'namenszusatz_mitarbeitername': None,
+        'ort_der_dienststelle': None,
+        'pauschalsteuer_berechnen': 'nein',
+        'abteilung_datev_lodas': rnd.choice(tuple(DEPARTMENTS) + (None,)),
+        'sb_ausweis_gueltig_ab_tt_mm_jjjj': None,
+        'staatsangehoerigkeit': rnd.choice(_COUNTRIES),
+        'steuerklasse_personaldaten_steuer_steuerkarte_allgemeine_daten': rnd.choice((1, 3, 4)),
+        'studienbescheinigung': None,
+        'stundenlohn': None,
+        'stundenlohn_1': None,
+        'tatsaechliches_ende_der_ausbildung': None,
+        'urlaubsanspruch_aktuelles_jahr': 30,
+        'verheiratet': rnd.choice(_YES_NO),
+        'versicherungsnummer': f"12{index:06d}M{index % 1000:03d}",
+        'beginn_der_ausbildung': None,
+        'voraussichtliches_ende_der_ausbildung_gem_vertrag': None,
+        'vorsatzwort_geburtsname': None,
+        'vorsatzwort_mitarbeitername': None,
+    }
+
+    children = [
+        {
+            'kind_nummer': number,
+            'vorname_personaldaten_kinderdaten_allgemeine_angaben': f"Kind{number}",
+            'familienname_personaldaten_kinderdaten_allgemeine_angaben': last_name,
+            'geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben': f"201{number}-05-0{number}",
+        }
+        for number in range(1, rnd.choice((0, 0, 1, 2, 3)) + 1)
+    ]
+    if children:
+        employee['children'] = children
+
+    return employee
+
+def make_employees(count, seed=0):
+    """Build `count` enriched employees, spread over COMPANIES."""
+    rnd = random.Random(seed)
+    return [make_employee(index, rnd=rnd) for index in range(count)]
+
+def make_employees_by_company(count, seed=0):
+    """Build `count` enriched employees grouped by company, like get_employees_for_export()."""
+    employees_by_company = {}
+    for employee in make_employees(count, seed):
+        employees_by_company.setdefault(employee['company'], []).append(employee)
+    return employees_by_company
+
+def make_rows(count, seed=0):
+    """Build the database rows of `count` synthetic employees (doctype -> list of rows).
+
+    Every employee is marked for export and has one Personalerfassungsbogen; the
+    Abteilung table holds the DEPARTMENTS codes.
+    """
+    tables = {
+        'Employee': [],
+        'Personalerfassungsbogen': [],
+        'Kinder Tabelle': [],
+        'Abteilung fuer DATEV Lodas Export': [
+            {'name': name, 'abteilungscode': code} for name, code in DEPARTMENTS.items()
+        ],
+    }
+
+    for employee in make_employees(count, seed):
+        row = {field: employee.get(field) for field in EMPLOYEE_FIELDS}
+        row['custom_for_next_export'] = 1
+        tables['Employee'].append(row)
+
+        peb_name = f"PEB-{employee['name']}"
+        peb = {field: employee.get(field) for field in PERSONALERFASSUNGSBOGEN_FIELDS + PERSONALERFASSUNGSBOGEN_WAGE_FIELDS}
+        peb.update(name=peb_name, employee=employee['name'], modified='2026-01-01 00:00:00')
+        tables['Personalerfassungsbogen'].append(peb)
+
+        for idx, child in enumerate(employee.get('children', ()), 1):
+            child_row = {field: child.get(field) for field in CHILD_FIELDS}
+            child_row.update(parent=peb_name, parenttype='Personalerfassungsbogen', idx=idx)
+            tables['Kinder Tabelle'].append(child_row)
+
+    return tables
@@ -0,0 +1,47 @@
+"""Benchmark: per-employee set_value vs. the chunked bulk writeback after an export.
+
+Uses existing employees of the site and rolls every run back, so no data is changed.
+
+Run on a site with:
+    bench --site <site> execute sut_app_datev_export.sut_app_datev_export.benchmarks.writeback.run --kwargs "{'employee_count': 10000}"
+"""
+import time
+
+import frappe
+
+from sut_app_datev_export.sut_app_datev_export.utils.export_writeback import write_back_exported_employees
+
+def write_back_per_employee(employees):
+    """Reference implementation: two single-row UPDATEs per employee."""
+    start = time.perf_counter()
+    for employee in employees:
+        frappe.db.set_value('Employee', employee.name,
+                          'custom_stored_value_of_summe_wochenarbeitszeit',
+                          employee.custom_summe_wochenarbeitszeit, update_modified=False)
+    for employee in employees:
+        frappe.db.set_value('Employee', employee.name, 'custom_for_next_export', 0, update_modified=False)
+    return {'rows': len(employees), 'statements': 2 * len(employees), 'lock_seconds': time.perf_counter() - start}
+
+def run(employee_count=10000):
+    """Run both writebacks on the same employees, each inside a rolled back transaction."""
+    employees = frappe.get_all(
+        'Employee',
+        fields=['name', 'custom_summe_wochenarbeitszeit'],
+        order_by='name asc',
+        limit=int(employee_count)
+    )
+
+    results = {}
+    for name, writer in (
+        ("per_employee", write_back_per_employee),
+        ("bulk", lambda employees: write_back_exported_employees(employees, commit=False))
+    ):
+        frappe.db.rollback()
+        try:
+            results[name] = writer(employees)
+        finally:
+            frappe.db.rollback()
+        print(f"{name}: {results[name]['rows']} employees, {results[name]['statements']} statements, "
+              f"locks held {results[name]['lock_seconds'] * 1000:.0f} ms")
+
+    return results
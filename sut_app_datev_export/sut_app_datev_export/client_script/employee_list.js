@@ -0,0 +1,38 @@
+// Extend the Employee list settings of HRMS instead of replacing them
+frappe.listview_settings['Employee'] = frappe.listview_settings['Employee'] || {};
+
+frappe.listview_settings['Employee'].onload = (function(onload) { return function(listview) {
+    if (onload) {
+        onload(listview);
+    }
+
+    // One background export for all selected employees: one file per company, one email
+    listview.page.add_action_item(__('Export selected to DATEV'), function() {
+        const employees = listview.get_checked_items(true);
+        if (!employees.length) {
+            frappe.msgprint(__('Please select at least one employee.'));
+            return;
+        }
+
+        frappe.confirm(
+            __('Export {0} employees to DATEV LODAS?', [employees.length]),
+            function() {
+                frappe.call({
+                    method: 'sut_app_datev_export.sut_app_datev_export.doctype.datev_export_sut_settings.datev_export_sut_settings.export_selected_employees',
+                    args: {
+                        employees: employees
+                    },
+                    callback: function(r) {
+                        if (r.message && r.message.job_id) {
+                            sut_app_datev_export.track_export_progress(function() {
+                                listview.clear_checked_items();
+                                listview.refresh();
+                            });
+                        }
+                    }
+                });
+            }
+        );
+    });
+}; })(frappe.listview_settings['Employee'].onload);
+
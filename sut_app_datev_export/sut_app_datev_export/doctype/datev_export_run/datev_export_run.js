@@ -0,0 +1,8 @@
+// Copyright (c) 2026, ahmad900mohammad@gmail.com and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("DATEV Export Run", {
+// 	refresh(frm) {
+
+// 	},
+// });
@@ -0,0 +1,41 @@
+# Copyright (c) 2026, ahmad900mohammad@gmail.com and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sut_app_datev_export.sut_app_datev_export.doctype.datev_export_sut_settings.datev_export_sut_settings import (
+	record_export_run
+)
+from sut_app_datev_export.sut_app_datev_export.utils.export_metrics import ExportTimer
+
+
+class TestDATEVExportRun(FrappeTestCase):
+	def test_export_run_records_the_company_files_and_timings(self):
+		timer = ExportTimer()
+		with timer.stage("generate"):
+			pass
+		file_paths = [
+			{"company": "_Test Company", "client_number": "10001", "employee_count": 2, "children_count": 1,
+				"file_size": 100, "filename": "LODAS_10001.txt"},
+			{"company": "_Test Company 1", "client_number": "10002", "employee_count": 3, "children_count": 0,
+				"file_size": 50, "filename": "LODAS_10002.txt"}
+		]
+
+		name = record_export_run(
+			file_paths, "Bulk", timer, record_types={1, 5}, export_filter={"companies": ["_Test Company"]}
+		)
+		run = frappe.get_doc("DATEV Export Run", name)
+
+		self.assertEqual(
+			(run.status, run.employee_count, run.children_count, run.company_count, run.total_bytes),
+			("Success", 5, 1, 2, 150)
+		)
+		self.assertEqual(
+			run.message,
+			"Exported 5 employees and 1 children from 2 companies (record types 1, 5) (filter: companies _Test Company)"
+		)
+		self.assertEqual(
+			[(row.company, row.employee_count) for row in run.companies], [("_Test Company", 2), ("_Test Company 1", 3)]
+		)
+		self.assertGreaterEqual(run.duration, run.generate_seconds)
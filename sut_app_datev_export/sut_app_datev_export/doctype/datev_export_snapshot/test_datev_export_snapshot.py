@@ -0,0 +1,41 @@
+# Copyright (c) 2026, ahmad900mohammad@gmail.com and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from sut_app_datev_export.sut_app_datev_export.utils.export_snapshot import (
+	SNAPSHOT_DOCTYPE,
+	get_export_snapshots,
+	save_export_snapshots,
+	serialize_main_record
+)
+
+BANK_DATA = {
+	"pnr": "1001", "ma_iban": "DE02120300000000202051", "ma_bic": "BYLADEM1001", "ma_bank_kto_inhaber_abw": ""
+}
+
+
+class TestDATEVExportSnapshot(FrappeTestCase):
+	def test_snapshot_is_replaced_on_re_export(self):
+		save_export_snapshots({"HR-EMP-SNAP-1": {"5.ma_iban": "a"}, "HR-EMP-SNAP-2": {"5.ma_iban": "b"}})
+		save_export_snapshots({"HR-EMP-SNAP-1": {"5.ma_iban": "c"}})
+
+		self.assertEqual(
+			get_export_snapshots(["HR-EMP-SNAP-1", "HR-EMP-SNAP-2"]),
+			{"HR-EMP-SNAP-1": {"5.ma_iban": "c"}, "HR-EMP-SNAP-2": {"5.ma_iban": "b"}}
+		)
+		self.assertEqual(frappe.db.count(SNAPSHOT_DOCTYPE, {"employee": "HR-EMP-SNAP-1"}), 1)
+
+	def test_delta_export_skips_an_unchanged_bank_record(self):
+		snapshot = {}
+		self.assertEqual(
+			serialize_main_record(5, BANK_DATA, snapshot), '5;"1001";"DE02120300000000202051";"BYLADEM1001";;\n'
+		)
+
+		self.assertEqual(serialize_main_record(5, BANK_DATA, {}, previous=snapshot), "")
+		# Only the changed column is sent, with the personnel number
+		self.assertEqual(
+			serialize_main_record(5, dict(BANK_DATA, ma_bic="BYLADEM1002"), {}, previous=snapshot),
+			'5;"1001";;"BYLADEM1002";;\n'
+		)
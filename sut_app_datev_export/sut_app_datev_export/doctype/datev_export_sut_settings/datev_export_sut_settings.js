@@ -11,18 +11,153 @@ frappe.ui.form.on('DATEV Export SUT Settings', {
       frm.add_custom_button(__('Export all marked employees'), function() {
         frappe.call({
           method: 'sut_app_datev_export.sut_app_datev_export.doctype.datev_export_sut_settings.datev_export_sut_settings.export_employees',
-          freeze: true,
-          freeze_message: __('Exporting employee data...'),
+          callback: function(r) {
+            if (r.message && r.message.job_id) {
+              // Export runs as background job, follow its progress
+              track_export_progress(frm);
+            }
+          }
+        });
+      }, __('Actions'));
+
+      frm.add_custom_button(__('Export selected record types'), function() {
+        select_record_types(frm);
+      }, __('Actions'));
+
+      frm.add_custom_button(__('Export filtered employees'), function() {
+        select_export_filter(frm);
+      }, __('Actions'));
+
+      frm.add_custom_button(__('Show export plan'), function() {
+        frappe.call({
+          method: 'sut_app_datev_export.sut_app_datev_export.doctype.datev_export_sut_settings.datev_export_sut_settings.get_export_plan_explanation',
           callback: function(r) {
             if (r.message) {
-              frappe.msgprint({
-                title: __('Export Complete'),
-                indicator: 'green',
-                message: __('Exported {0} employees. Email sent to {1}', [r.message.count, r.message.email])
-              });
+              show_export_plan(r.message);
             }
           }
         });
       }, __('Actions'));
+
+      frm.add_custom_button(__('Export Runs'), function() {
+        frappe.set_route('List', 'DATEV Export Run');
+      });
+    }
+  });
+
+// LODAS record types (see utils/record_spec.py)
+const RECORD_TYPES = [
+  [1, 'Mitarbeiter'], [2, 'Tätigkeit'], [3, 'Beschäftigung'], [4, 'Steuer'],
+  [5, 'Bank'], [6, 'Schwerbehinderung'], [7, 'Arbeitszeit'], [8, 'Lohn/Gehalt'],
+  [9, 'Fahrtkostenzuschuss'], [10, 'Besonderheiten'], [11, 'Kinder'], [12, 'Festbezüge']
+];
+
+function select_record_types(frm) {
+  // Preselect the record types of the settings, all if none are set
+  const selected = (frm.doc.export_record_types || '').split(/[,;\s]+/).filter(Boolean).map(Number);
+  const dialog = new frappe.ui.Dialog({
+    title: __('Export selected record types'),
+    fields: [{
+      fieldname: 'record_types',
+      fieldtype: 'MultiCheck',
+      label: __('Record types'),
+      columns: 2,
+      options: RECORD_TYPES.map(([number, label]) => ({
+        label: `${number} - ${__(label)}`,
+        value: String(number),
+        checked: !selected.length || selected.includes(number)
+      }))
+    }],
+    primary_action_label: __('Export'),
+    primary_action(values) {
+      if (!values.record_types.length) {
+        frappe.msgprint(__('Please select at least one record type.'));
+        return;
+      }
+      dialog.hide();
+      frappe.call({
+        method: 'sut_app_datev_export.sut_app_datev_export.doctype.datev_export_sut_settings.datev_export_sut_settings.export_employees',
+        args: { record_types: values.record_types.join(',') },
+        callback: function(r) {
+          if (r.message && r.message.job_id) {
+            track_export_progress(frm);
+          }
+        }
+      });
     }
-  });
\ No newline at end of file
+  });
+  dialog.show();
+}
+
+function select_export_filter(frm) {
+  // Only the marked employees matching all given filters are exported and unmarked
+  const dialog = new frappe.ui.Dialog({
+    title: __('Export filtered employees'),
+    fields: [
+      { fieldname: 'companies', fieldtype: 'MultiSelectList', label: __('Companies'), options: 'Company' },
+      {
+        fieldname: 'departments', fieldtype: 'MultiSelectList', label: __('Departments (DATEV Lodas)'),
+        options: 'Abteilung fuer DATEV Lodas Export'
+      },
+      { fieldname: 'employment_types', fieldtype: 'MultiSelectList', label: __('Employment Types'), options: 'Employment Type' },
+      {
+        fieldname: 'employees', fieldtype: 'MultiSelectList', label: __('Employees'), options: 'Employee',
+        get_data: function(txt) {
+          return frappe.db.get_link_options('Employee', txt, { custom_for_next_export: 1 });
+        }
+      }
+    ],
+    primary_action_label: __('Export'),
+    primary_action(values) {
+      const export_filter = {};
+      ['companies', 'departments', 'employment_types', 'employees'].forEach(key => {
+        if (values[key] && values[key].length) {
+          export_filter[key] = values[key];
+        }
+      });
+      if (!Object.keys(export_filter).length) {
+        frappe.msgprint(__('Please select at least one filter.'));
+        return;
+      }
+      dialog.hide();
+      frappe.call({
+        method: 'sut_app_datev_export.sut_app_datev_export.doctype.datev_export_sut_settings.datev_export_sut_settings.export_employees',
+        args: { export_filter: export_filter },
+        callback: function(r) {
+          if (r.message && r.message.job_id) {
+            track_export_progress(frm);
+          }
+        }
+      });
+    }
+  });
+  dialog.show();
+}
+
+function show_export_plan(rows) {
+  // Fetched fields first, then the pruned ones
+  rows = rows.slice().sort((a, b) => b.fetched - a.fetched);
+  const fetched = rows.filter(row => row.fetched).length;
+  const body = rows.map(row => `
+    <tr>
+      <td>${frappe.utils.escape_html(row.doctype)}</td>
+      <td><code>${frappe.utils.escape_html(row.field)}</code></td>
+      <td>${row.fetched ? __('Fetched') : __('Pruned')}</td>
+      <td>${frappe.utils.escape_html(row.reason)}</td>
+    </tr>`).join('');
+
+  frappe.msgprint({
+    title: __('Export plan: {0} of {1} fields fetched', [fetched, rows.length]),
+    wide: true,
+    message: `<table class="table table-bordered table-sm">
+      <thead><tr><th>${__('DocType')}</th><th>${__('Field')}</th><th>${__('Status')}</th><th>${__('Reason')}</th></tr></thead>
+      <tbody>${body}</tbody>
+    </table>`
+  });
+}
+
+function track_export_progress(frm) {
+  sut_app_datev_export.track_export_progress(function() {
+    frm.reload_doc();
+  });
+}
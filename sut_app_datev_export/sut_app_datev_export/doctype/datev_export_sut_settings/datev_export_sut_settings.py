@@ -7,15 +7,42 @@ import os
 from frappe import _
 from datetime import datetime
 from frappe.utils import now_datetime, get_datetime  # Add these imports for timezone handling
-from sut_app_datev_export.sut_app_datev_export.utils.employee_data import get_employees_for_export, validate_employee_data, map_employee_to_lodas
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+    EMPLOYEE_FIELDS,
+    get_employee_validation_errors,
+    get_employees_for_export,
+    get_export_company_counts,
+    get_export_filter_chunks,
+    iter_employees_for_export,
+    map_employee_to_lodas,
+    parse_export_filter,
+    throw_employee_validation_errors,
+    validate_employee_data
+)
 from sut_app_datev_export.sut_app_datev_export.utils.file_builder import (
     generate_lodas_files,
+    generate_lodas_files_streamed,
     generate_lodas_file_header,
     generate_record_description,
     generate_employee_data,
     generate_single_employee_file
 )
 from sut_app_datev_export.sut_app_datev_export.utils.email_sender import send_export_email
+from sut_app_datev_export.sut_app_datev_export.utils.export_writeback import write_back_exported_employees
+from sut_app_datev_export.sut_app_datev_export.utils.export_snapshot import (
+    attach_export_snapshots,
+    save_export_snapshots,
+    save_spooled_export_snapshots
+)
+from sut_app_datev_export.sut_app_datev_export.utils.export_metrics import ExportTimer
+from sut_app_datev_export.sut_app_datev_export.utils.export_context import (
+    clear_export_context,
+    get_export_context,
+    with_record_types
+)
+from sut_app_datev_export.sut_app_datev_export.utils.export_restrictions import validate_export_restrictions
+from sut_app_datev_export.sut_app_datev_export.utils.export_plan import explain_export_plan, get_export_plan
+from sut_app_datev_export.sut_app_datev_export.utils.record_spec import ALL_RECORD_TYPES, parse_record_types
 
 class DATEVExportSUTSettings(Document):
     def validate(self):
@@ -29,70 +56,358 @@ class DATEVExportSUTSettings(Document):
             if not mapping.client_number or not mapping.client_number.isdigit() or len(mapping.client_number) != 5:
                 frappe.throw(_("Client number must be exactly 5 digits for company: {0}").format(mapping.company))
 
+        # Export restrictions must name LODAS fields, they are compiled into suppressed columns
+        validate_export_restrictions(self.mehrfach_export_unterdruecken)
+
+        # Record types written by the bulk export, empty = all
+        get_record_type_selection(self.export_record_types)
+
+    def on_update(self):
+        """Invalidate the cached export context in all workers."""
+        clear_export_context()
+
+# Background job for the bulk export; a fixed job id prevents two exports running at once
+EXPORT_JOB_ID = 'datev_lodas_export'
+EXPORT_JOB_TIMEOUT = 3600
+
+# Realtime events published to the user who started the export
+EXPORT_PROGRESS_EVENT = 'datev_export_progress'
+EXPORT_DONE_EVENT = 'datev_export_done'
+
 @frappe.whitelist()
-def export_employees():
-    """Main export function."""
+def export_employees(record_types=None, export_filter=None):
+    """Start the export of all marked employees as a background job.
+
+    `record_types` selects the record types written in this run (e.g. [5] or "1,3"),
+    by default the selection of the settings is used. `export_filter` limits the run to the
+    marked employees of some companies, departments, employment types or to a list of
+    employees (see employee_data.parse_export_filter); only they are unmarked afterwards.
+    """
+    if isinstance(record_types, str) and record_types.startswith('['):
+        record_types = frappe.parse_json(record_types)
+    if record_types:
+        record_types = sorted(get_record_type_selection(record_types))
+    export_filter = parse_export_filter(export_filter)
+
+    # Nothing to do, don't start a job
+    if export_filter:
+        marked = sum(get_export_company_counts(export_filter).values())
+    else:
+        marked = frappe.db.count('Employee', {'custom_for_next_export': 1})
+    if not marked:
+        frappe.msgprint(_("No employees match the export filter.") if export_filter else _("No employees marked for export."))
+        return {"count": 0, "email": frappe.db.get_single_value('DATEV Export SUT Settings', 'export_email')}
+
+    job = frappe.enqueue(
+        'sut_app_datev_export.sut_app_datev_export.doctype.datev_export_sut_settings.datev_export_sut_settings.run_export_job',
+        queue='long',
+        timeout=EXPORT_JOB_TIMEOUT,
+        job_id=EXPORT_JOB_ID,
+        deduplicate=True,
+        record_types=record_types or None,
+        export_filter=export_filter
+    )
+
+    if not job:
+        frappe.throw(_("An export is already running. Please wait until it has finished."))
+
+    return {"job_id": job.id}
+
+@frappe.whitelist()
+def export_selected_employees(employees):
+    """Export the employees selected in the Employee list in one background job.
+
+    Runs the bulk export over the selected names (marked for export or not, like the single
+    employee export): one file per company, one email and one export run for all of them.
+    """
+    if isinstance(employees, str):
+        employees = frappe.parse_json(employees) if employees.startswith('[') else employees.split(',')
+    if not employees:
+        frappe.throw(_("Please select at least one employee."))
+
+    return export_employees(export_filter={'employees': employees, 'include_unmarked': 1})
+
+@frappe.whitelist()
+def get_export_plan_explanation():
+    """Explain which Employee and Personalerfassungsbogen fields the export fetches under the saved settings."""
+    context = get_export_context()
+    return explain_export_plan(context.suppressed_columns, context.record_types)
+
+def get_record_type_selection(value):
+    """Parse a selection of record types (see record_spec.parse_record_types), throwing for unknown ones."""
+    try:
+        return parse_record_types(value)
+    except ValueError as e:
+        frappe.throw(_("Unknown record types: {0}. Use the record numbers 1 to 12, e.g. 5 or 1,3.").format(str(e)))
+
+def run_export_job(record_types=None, export_filter=None):
+    """Background job: run the export and publish the result to the user."""
+    try:
+        result = run_export(publish_export_progress, record_types, export_filter)
+    except Exception as e:
+        frappe.publish_realtime(EXPORT_DONE_EVENT, {"error": str(e)}, user=frappe.session.user)
+        raise
+
+    frappe.publish_realtime(EXPORT_DONE_EVENT, result, user=frappe.session.user)
+    return result
+
+def publish_export_progress(percent, message, company=None):
+    """Publish the export progress to the user who started the export."""
+    frappe.publish_realtime(
+        EXPORT_PROGRESS_EVENT,
+        {"percent": percent, "message": message, "company": company},
+        user=frappe.session.user
+    )
+
+def run_export(progress=None, record_types=None, export_filter=None):
+    """Main export function.
+
+    `progress(percent, message, company=None)` is called at each stage and for each company file.
+    `record_types` overrides the record types selected in the settings for this run. If not
+    all record types are written, the employees stay marked for the next full export.
+    `export_filter` limits the run to some of the marked employees, the filter is part of the
+    queries; the other marked employees stay marked.
+    The time spent in each stage is stored on the export run and returned as `timings`.
+    With a chunk size set in the settings (and no parallel export), the employees are
+    streamed chunk by chunk (see generate_export_streamed), otherwise loaded at once.
+    """
+    progress = progress or (lambda percent, message, company=None: None)
+    timer = ExportTimer()
+    export = None
+
     try:
-        settings = frappe.get_single('DATEV Export SUT Settings')
+        # Settings derived once per settings version (client numbers, restrictions, delivery)
+        settings = get_export_context()
+        if record_types:
+            settings = with_record_types(settings, record_types)
+        export_filter = parse_export_filter(export_filter)
         export_email = settings.export_email
+        full_export = settings.record_types == ALL_RECORD_TYPES
+
+        # Opt-in: count the queries of this export per call site
+        if settings.query_accounting:
+            timer.count_queries(settings.query_warning_threshold)
 
-        # Get employees marked for export
-        employees_by_company = get_employees_for_export()
+        # Get employees marked for export and generate the LODAS files
+        progress(0, _("Loading employees"))
+        if settings.export_chunk_size and not settings.parallel_export:
+            export = generate_export_streamed(settings, timer, progress, export_filter)
+        else:
+            export = generate_export_in_memory(settings, timer, progress, export_filter)
 
         # If no employees to export
-        if not employees_by_company:
+        if export is None:
             frappe.msgprint(_("No employees marked for export."))
             return {"count": 0, "email": export_email}
 
-        # Validate company mappings
-        validate_company_mapping(settings, employees_by_company)
-
-        # Validate employee data
-        validate_employee_data(employees_by_company)
-
-        # NEW: Apply export restrictions and handle special field logic
-        process_export_restrictions(employees_by_company, settings)
-
-        # Generate LODAS files (now with settings parameter for dynamic restrictions)
-        file_paths = generate_lodas_files(employees_by_company, settings)
+        file_paths = export.file_paths
 
         # Send email with attachments
         if file_paths:
-            send_export_email(export_email, file_paths)
-
-            # Record export in history
-            record_export_history(settings, file_paths)
-
-            # NEW: Update stored values after successful export
-            update_employee_stored_values([emp for emps in employees_by_company.values() for emp in emps])
-
-            # Reset export flags
-            reset_export_flags([emp for emps in employees_by_company.values() for emp in emps])
+            progress(80, _("Sending email to {0}").format(export_email))
+            with timer.stage('email'):
+                send_export_email(export_email, file_paths)
+
+            progress(90, _("Updating employees"))
+            with timer.stage('writeback'):
+                # Store the exported values for the next delta export; committed with the writeback
+                if export.snapshot_spool:
+                    save_spooled_export_snapshots(export.snapshot_spool)
+                else:
+                    save_export_snapshots({name: snapshot for f in file_paths for name, snapshot in f['snapshots'].items()})
+
+                # Update stored values and reset export flags in one bulk writeback; after a
+                # partial export the employees stay marked for the records not written
+                write_back_exported_employees(
+                    export.employees,
+                    reset_flags=full_export,
+                    update_stored_values=7 in settings.record_types
+                )
+
+            # Record the export run with one row per company file
+            export_run = record_export_run(
+                file_paths, 'Bulk', timer, record_types=settings.record_types, export_filter=export_filter
+            )
 
             # Return success
-            total_employees = sum(len(emps) for emps in employees_by_company.values())
-            total_children = sum(len(emp.get('children', [])) for emps in employees_by_company.values() for emp in emps)
+            progress(100, _("Export complete"))
+            total_employees = sum(f['employee_count'] for f in file_paths)
+            total_children = sum(f['children_count'] for f in file_paths)
             return {
                 "count": total_employees,
                 "children_count": total_children,
-                "email": export_email
+                "email": export_email,
+                "export_run": export_run,
+                "record_types": sorted(settings.record_types),
+                "export_filter": export_filter,
+                "timings": timer.as_dict(total_employees)
             }
         else:
             frappe.throw(_("No files were generated. Check error logs."))
 
     except Exception as e:
         # frappe.log_error(frappe.get_traceback(), "DATEV Export Error")
+        record_failed_export_run('Bulk', timer, str(e))
         frappe.throw(_("Export failed: {0}").format(str(e)))
 
+    finally:
+        timer.stop()
+        if export and export.snapshot_spool:
+            os.remove(export.snapshot_spool)
+
+def generate_export_in_memory(settings, timer, progress, export_filter=None):
+    """Load all employees marked for export (and matching `export_filter`) at once and generate the LODAS files.
+
+    Returns the files and the exported employees, or None if no employee is marked.
+    """
+    with timer.stage('fetch'):
+        employees_by_company = get_employees_for_export(
+            get_export_plan(settings.suppressed_columns, settings.record_types),
+            export_filter
+        )
+
+    if not employees_by_company:
+        return None
+
+    # Validate company mappings
+    progress(10, _("Validating employee data"))
+    with timer.stage('validate'):
+        validate_company_mapping(settings, employees_by_company)
+
+        # Validate employee data
+        validate_employee_data(employees_by_company, settings)
+
+    # NEW: Apply export restrictions and handle special field logic
+    with timer.stage('restrictions'):
+        process_export_restrictions(employees_by_company, settings)
+
+    # Delta export: compare with the values of the last export; a partial export keeps
+    # the last exported values of the records it does not write
+    if settings.delta_export or settings.record_types != ALL_RECORD_TYPES:
+        with timer.stage('fetch'):
+            attach_export_snapshots(employees_by_company)
+
+    # Generate LODAS files (now with settings parameter for dynamic restrictions)
+    progress(15, _("Generating LODAS files"))
+    company_count = len(employees_by_company)
+
+    def file_generated(company, index):
+        progress(15 + 65 * index // company_count, _("Generated file {0} of {1}").format(index, company_count), company)
+
+    with timer.stage('generate'):
+        file_paths = generate_lodas_files(employees_by_company, settings, file_generated)
+
+    return frappe._dict(
+        file_paths=file_paths,
+        employees=[emp for emps in employees_by_company.values() for emp in emps],
+        snapshot_spool=None
+    )
+
+def generate_export_streamed(settings, timer, progress, export_filter=None):
+    """Generate the LODAS files chunk by chunk, so memory use is bounded by the chunk size.
+
+    Each chunk of `settings.export_chunk_size` employees is fetched, validated, prepared,
+    written and released before the next one (see file_builder.generate_lodas_files_streamed).
+    Validation errors are collected over all chunks; if there are any, the files are removed
+    and the export stops before the email. The export snapshots are spooled to a temporary
+    file; if generating fails, the files and the spool are removed. Only the employees
+    matching `export_filter` are exported, the filter is resolved once. Returns the files and
+    the exported employees, or None if no employee is marked.
+    """
+    with timer.stage('fetch'):
+        # Resolve the filter (e.g. the employees of the departments) once for all companies
+        filter_chunks = list(get_export_filter_chunks(export_filter, settings.export_chunk_size))
+        company_counts = get_export_company_counts(filter_chunks=filter_chunks)
+
+    if not company_counts:
+        return None
+
+    # Validate company mappings before anything is written
+    progress(10, _("Validating employee data"))
+    with timer.stage('validate'):
+        validate_company_mapping(settings, company_counts)
+
+    progress(15, _("Generating LODAS files"))
+    company_count = len(company_counts)
+    validation_errors = []
+
+    def file_generated(company, index):
+        progress(15 + 65 * index // company_count, _("Generated file {0} of {1}").format(index, company_count), company)
+
+    # Only fetch the fields that can reach the files under the restrictions
+    plan = get_export_plan(settings.suppressed_columns, settings.record_types)
+
+    def prepared_chunks(company):
+        chunks = iter_employees_for_export(company, settings.export_chunk_size, plan, filter_chunks)
+        while True:
+            with timer.stage('fetch'):
+                employees = next(chunks, None)
+            if employees is None:
+                return
+
+            employees_by_company = {company: employees}
+            with timer.stage('validate'):
+                validation_errors.extend(get_employee_validation_errors(employees_by_company, settings))
+            with timer.stage('restrictions'):
+                process_export_restrictions(employees_by_company, settings)
+
+            # Delta export: compare with the values of the last export; a partial export
+            # keeps the last exported values of the records it does not write
+            if settings.delta_export or settings.record_types != ALL_RECORD_TYPES:
+                with timer.stage('fetch'):
+                    attach_export_snapshots(employees_by_company)
+
+            yield employees
+
+    with tempfile.NamedTemporaryFile('w', encoding='utf-8', suffix='.jsonl', prefix='datev_snapshots_', delete=False) as snapshot_file:
+        export = frappe._dict(file_paths=[], employees=[], snapshot_spool=snapshot_file.name)
+        try:
+            with timer.stage('generate'):
+                export.file_paths = generate_lodas_files_streamed(
+                    ((company, prepared_chunks(company)) for company in company_counts),
+                    settings,
+                    file_generated,
+                    snapshot_file
+                )
+        except Exception:
+            # The files written so far are removed by generate_lodas_files_streamed, the
+            # spool is not returned, so run_export can't remove it
+            remove_export_files(export.file_paths)
+            snapshot_file.close()
+            os.remove(export.snapshot_spool)
+            raise
+
+    if validation_errors:
+        remove_export_files(export.file_paths)
+        os.remove(export.snapshot_spool)
+        throw_employee_validation_errors(validation_errors)
+
+    export.employees = [row for f in export.file_paths for row in f['exported']]
+    return export
+
+def remove_export_files(file_paths):
+    """Remove the generated LODAS files, e.g. if the export stops after they were written."""
+    for file_info in file_paths:
+        if os.path.exists(file_info['path']):
+            os.remove(file_info['path'])
+
 @frappe.whitelist()
 def export_single_employee(employee):
-    """Export a single employee to DATEV LODAS."""
+    """Export a single employee to DATEV LODAS, always with all record types."""
+    timer = ExportTimer()
+
     try:
-        settings = frappe.get_single('DATEV Export SUT Settings')
+        # Settings derived once per settings version (client numbers, restrictions, delivery)
+        settings = with_record_types(get_export_context(), ALL_RECORD_TYPES)
         export_email = settings.export_email
 
+        # Opt-in: count the queries of this export per call site
+        if settings.query_accounting:
+            timer.count_queries(settings.query_warning_threshold)
+
         # Get the employee data as a dictionary
-        employee_dict = prepare_employee_dict(employee)
+        with timer.stage('fetch'):
+            employee_dict = prepare_employee_dict(employee)
 
         # Create a structure similar to get_employees_for_export
         employees_by_company = {
@@ -100,58 +415,71 @@ def export_single_employee(employee):
         }
 
         # Validate company mappings
-        validate_company_mapping(settings, employees_by_company)
+        with timer.stage('validate'):
+            validate_company_mapping(settings, employees_by_company)
 
-        # Validate employee data
-        validate_employee_data(employees_by_company)
+            # Validate employee data
+            validate_employee_data(employees_by_company, settings)
 
         # NEW: Apply export restrictions and handle special field logic for single employee too
-        process_export_restrictions(employees_by_company, settings)
+        with timer.stage('restrictions'):
+            process_export_restrictions(employees_by_company, settings)
+
+        # Delta export: compare with the values of the last export
+        if settings.delta_export:
+            with timer.stage('fetch'):
+                attach_export_snapshots(employees_by_company)
 
         # Generate LODAS file for this employee (now with settings parameter for dynamic restrictions)
-        file_paths = generate_single_employee_file(employee_dict, settings)
+        with timer.stage('generate'):
+            file_paths = generate_single_employee_file(employee_dict, settings)
 
         # Send email with attachments
         if file_paths:
-            send_export_email(export_email, file_paths)
+            with timer.stage('email'):
+                send_export_email(export_email, file_paths)
+
+            with timer.stage('writeback'):
+                # Store the exported values for the next delta export; committed with the writeback
+                save_export_snapshots(file_paths[0]['snapshots'])
 
-            # Record export in history
-            record_export_history(settings, file_paths)
+                # Update stored value and reset export flag after successful single employee export
+                write_back_exported_employees([employee_dict])
 
-            # NEW: Update stored values after successful single employee export
-            update_employee_stored_values([employee_dict])
+            # Record the export run
+            export_run = record_export_run(file_paths, 'Single', timer)
 
-            frappe.db.set_value("Employee", employee, "custom_for_next_export", 0, update_modified=False)
-            frappe.db.commit()
             # Return success with children count
             children_count = file_paths[0].get('children_count', 0)
             return {
                 "count": 1,
                 "children_count": children_count,
-                "email": export_email
+                "email": export_email,
+                "export_run": export_run,
+                "timings": timer.as_dict(1)
             }
         else:
             frappe.throw(_("No files were generated. Check error logs."))
 
     except Exception as e:
         # frappe.log_error(frappe.get_traceback(), "DATEV Export Error")
+        record_failed_export_run('Single', timer, str(e))
         frappe.throw(_("Export failed: {0}").format(str(e)))
 
+    finally:
+        timer.stop()
+
 # NEW FUNCTIONS FOR DYNAMIC EXPORT RESTRICTIONS
 def process_export_restrictions(employees_by_company, settings):
-    """Process export restrictions and special field logic for all employees."""
+    """Process the special field logic for all employees.
+
+    The restrictions of `mehrfach_export_unterdruecken` are not applied to the employee data
+    here; they are compiled into suppressed LODAS columns once per settings version (see
+    export_context) and left empty by the serializer.
+    """
     try:
-        # Get export restrictions from child table
-        export_restrictions = get_export_restrictions(settings)
-        
-        # Debug: Log what we found
-        # frappe.log_error(f"Processing export restrictions: {export_restrictions}", "DATEV Export Debug")
-        
         for company, employees in employees_by_company.items():
             for employee in employees:
-                # Apply export restrictions
-                apply_export_restrictions(employee, export_restrictions)
-                
                 # Handle special field logic for az_wtl_indiv
                 handle_special_field_logic(employee)
                 
@@ -159,31 +487,6 @@ def process_export_restrictions(employees_by_company, settings):
         # frappe.log_error(f"Error in process_export_restrictions: {str(e)}", "DATEV Export Error")
         raise
 
-def get_export_restrictions(settings):
-    """Get export restrictions from the child table."""
-    restrictions = {}
-    try:
-        if hasattr(settings, 'mehrfach_export_unterdruecken'):
-            for restriction in settings.mehrfach_export_unterdruecken:
-                restrictions[restriction.field_name] = restriction.no_export
-    except Exception as e:pass
-        # frappe.log_error(f"Error getting export restrictions: {str(e)}", "DATEV Export Error")
-    
-    return restrictions
-
-def apply_export_restrictions(employee, restrictions):
-    """Apply export restrictions to employee data."""
-    try:
-        for field_name, no_export in restrictions.items():
-            if no_export and field_name in employee:
-                # Set field to empty if export is restricted
-                original_value = employee[field_name]
-                employee[field_name] = ""
-                # frappe.log_error(f"Field {field_name} restricted for employee {employee.get('name', 'Unknown')}: '{original_value}' -> ''", 
-                #                 "DATEV Export Restriction")
-    except Exception as e:pass
-        # frappe.log_error(f"Error applying export restrictions: {str(e)}", "DATEV Export Error")
-
 def handle_special_field_logic(employee):
     """Handle special logic for az_wtl_indiv field based on stored value comparison."""
     try:
@@ -218,19 +521,7 @@ def handle_special_field_logic(employee):
 def update_employee_stored_values(employees):
     """Update stored values after successful export."""
     try:
-        for employee in employees:
-            employee_name = employee.get('name')
-            if not employee_name:
-                continue
-                
-            current_value = employee.get('custom_summe_wochenarbeitszeit')
-            
-            # Update the stored value to match current value
-            frappe.db.set_value('Employee', employee_name, 
-                              'custom_stored_value_of_summe_wochenarbeitszeit', 
-                              current_value, update_modified=False)
-            
-        frappe.db.commit()
+        write_back_exported_employees(employees, reset_flags=False)
         # frappe.log_error(f"Updated stored values for {len(employees)} employees", "DATEV Export Success")
         
     except Exception as e:pass
@@ -242,44 +533,11 @@ def prepare_employee_dict(employee_id):
     try:
         # FIXED: Use the SAME logic as get_employees_for_export() to ensure consistency
         
-        # Get basic employee data with ALL required fields (same as bulk export)
+        # Get basic employee data with ALL required fields (same as bulk export, see EMPLOYEE_FIELDS)
         employee_data = frappe.get_all(
             'Employee',
             filters={'name': employee_id},
-            fields=[
-                # Standard fields always needed
-                'name', 'company', 'employee_name', 'designation',
-                
-                # All employee fields needed for DATEV export following Excel mapping
-                'custom_land', 'custom_anschriftenzusatz', 'custom_befristung_arbeitserlaubnis',
-                'custom_arbeitsverhältnis', 'custom_befristung_aufenthaltserlaubnis', 'relieving_date',
-                'date_of_joining', 'personal_email', 'custom_ersteintritt_ins_unternehmen_',
-                'last_name', 'date_of_birth', 'gender', 'custom_hausnummer',
-                'custom_höchste_berufsausbildung', 'custom_höchster_schulabschluss',
-                'custom_steueridentnummer', 'custom_summe_wochenarbeitszeit', 
-                'custom_ort', 'employee_number', 'custom_plz', 
-                'custom_befristung_gdb_bescheid', 'custom_schwerbehinderung',
-                'custom_straße', 'cell_number', 'first_name', 'custom_summe_gehalt',
-                'employment_type',
-                
-                # NEW: Add the stored value field for comparison
-                'custom_stored_value_of_summe_wochenarbeitszeit',
-                
-                # Wage type fields - only include if they exist
-                'custom_lohnart_gg', 'custom_lohnart_p1', 'custom_lohnart_p2', 
-                'custom_lohnart_p3', 'custom_lohnart_p4', 'custom_lohnart_z1', 
-                'custom_lohnart_z2',
-                
-                # CRITICAL: Add the wage amount fields from Employee DocType
-                'custom_gehalt_des_grundvertrags',
-                'custom_gehalt_projekt_1', 'custom_gehalt_projekt_2', 
-                'custom_gehalt_projekt_3', 'custom_gehalt_projekt_4',
-                'custom_zulage_zulage_1', 'custom_zulage_zulage_2',
-                'custom_ist_zusätzliche_vergütung_zum_grundgehalt',
-                'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1',
-                'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2',
-                'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3'
-            ]
+            fields=list(EMPLOYEE_FIELDS)
         )
 
         if not employee_data:
@@ -288,19 +546,15 @@ def prepare_employee_dict(employee_id):
         employee_dict = employee_data[0]
 
         # FIXED: Use the SAME Personalerfassungsbogen logic as bulk export
-        from sut_app_datev_export.sut_app_datev_export.utils.employee_data import get_personalerfassungsbogen_data
+        from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+            get_personalerfassungsbogen_data_bulk,
+            merge_personalerfassungsbogen_data
+        )
         
-        personalerfassungsbogen_data = get_personalerfassungsbogen_data(employee_id)
+        personalerfassungsbogen_by_employee = get_personalerfassungsbogen_data_bulk([employee_id])
         
         # Add Personalerfassungsbogen data to employee (same as bulk export)
-        if personalerfassungsbogen_data:
-            for field, value in personalerfassungsbogen_data.items():
-                if field != 'kinder_tabelle':
-                    employee_dict[field] = value
-            
-            # Add children data if available
-            if 'kinder_tabelle' in personalerfassungsbogen_data and personalerfassungsbogen_data['kinder_tabelle']:
-                employee_dict['children'] = personalerfassungsbogen_data['kinder_tabelle']
+        merge_personalerfassungsbogen_data(employee_dict, personalerfassungsbogen_by_employee.get(employee_id))
 
         # # DEBUG: Log what we got for comparison
         # frappe.log_error(f"Single employee data for {employee_id}:", "DATEV Export Debug")
@@ -323,7 +577,7 @@ def prepare_employee_dict(employee_id):
 def validate_company_mapping(settings, employees_by_company):
     """Validate that all relevant companies have client number mappings."""
     # Get mapped companies
-    mapped_companies = {m.company: m.client_number for m in settings.company_client_mapping}
+    mapped_companies = get_export_context(settings).client_numbers
 
     # Find unmapped companies
     unmapped = []
@@ -337,26 +591,75 @@ def validate_company_mapping(settings, employees_by_company):
             "Please add these mappings in DATEV Export SUT Settings."
         ).format(", ".join(unmapped)))
 
-def record_export_history(settings, file_paths):
-    """Record export in history table - FIXED: Use correct timezone."""
+def record_export_run(file_paths, export_type, timer, status='Success', message=None, record_types=ALL_RECORD_TYPES,
+        export_filter=None):
+    """Record the export as DATEV Export Run with one row per company file.
+
+    Replaces the export history table of the settings, so the Single document does not
+    grow with every export. The stage timings, total duration and (if enabled) query
+    accounting are taken from the ExportTimer `timer`. A partial selection of
+    `record_types` and the `export_filter` are noted in the message. Returns the name of the run.
+    """
+    # Don't count the queries of recording the run
+    timer.stop()
+
     total_employees = sum(f.get('employee_count', 0) for f in file_paths)
     total_children = sum(f.get('children_count', 0) for f in file_paths)
 
-    # FIXED: Use now_datetime() which respects Frappe's timezone settings
-    current_time = now_datetime()
-
-    settings.append('export_history', {
-        'export_date': current_time,  # FIXED: Use timezone-aware datetime
+    if message is None:
+        message = f"Exported {total_employees} employees and {total_children} children from {len(file_paths)} companies"
+        if record_types != ALL_RECORD_TYPES:
+            message += f" (record types {', '.join(str(number) for number in sorted(record_types))})"
+        if export_filter:
+            message += " (filter: " + "; ".join(
+                f"{key} {', '.join(values)}" for key, values in export_filter.items() if isinstance(values, list)
+            ) + ")"
+
+    # Warn if the export needed more queries per employee than configured
+    if timer.queries:
+        query_warning = timer.queries.check_threshold(total_employees)
+        if query_warning:
+            message = f"{message}\n{query_warning}"
+
+    export_run = frappe.get_doc({
+        'doctype': 'DATEV Export Run',
+        'export_date': now_datetime(),  # Respects Frappe's timezone settings
+        'export_type': export_type,
+        'status': status,
         'employee_count': total_employees,
-        'status': 'Success',
-        'message': f"Exported {total_employees} employees and {total_children} children from {len(file_paths)} companies"
+        'children_count': total_children,
+        'company_count': len(file_paths),
+        'total_bytes': sum(f.get('file_size', 0) for f in file_paths),
+        'message': message,
+        'companies': [{
+            'company': f['company'],
+            'client_number': f.get('client_number'),
+            'status': status,
+            'employee_count': f.get('employee_count', 0),
+            'children_count': f.get('children_count', 0),
+            'file_size': f.get('file_size', 0),
+            'duration': f.get('duration', 0),
+            'filename': f.get('filename'),
+            'file': f.get('file_url')
+        } for f in file_paths]
     })
-    settings.save()
+    export_run.update(timer.as_run_fields(total_employees))
+    export_run.insert(ignore_permissions=True)
+    return export_run.name
+
+def record_failed_export_run(export_type, timer, error):
+    """Record a failed export run.
+
+    Rolls back the partial export first and commits the run, so it is kept although
+    the export raises afterwards.
+    """
+    try:
+        frappe.db.rollback()
+        record_export_run([], export_type, timer, status='Error', message=error)
+        frappe.db.commit()
+    except Exception as e:pass
+        # frappe.log_error(f"Error recording failed export run: {str(e)}", "DATEV Export Error")
 
 def reset_export_flags(employees):
     """Reset export flags for all exported employees."""
-    for employee in employees:
-        frappe.db.set_value('Employee', employee.name, 'custom_for_next_export', 0, update_modified=False)
-        # frappe.db.set_value('Employee', employee.name, 'custom_bereits_exportiert', 1, update_modified=False)
-
-    frappe.db.commit()
\ No newline at end of file
+    write_back_exported_employees(employees, update_stored_values=False)
@@ -1,9 +1,159 @@
 # Copyright (c) 2025, ahmad900mohammad@gmail.com and Contributors
 # See license.txt
 
-# import frappe
+import datetime
+from unittest import mock
+
+import frappe
+from erpnext.setup.doctype.employee.test_employee import make_employee
 from frappe.tests.utils import FrappeTestCase
 
+from sut_app_datev_export.sut_app_datev_export.golden.corpus import make_corpus
+from sut_app_datev_export.sut_app_datev_export.golden.runner import (
+	STREAMED_CHUNK_SIZE,
+	check_golden_files,
+	frozen_environment,
+	get_settings
+)
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+	get_employee_validation_errors,
+	get_lodas_fingerprint,
+	parse_export_filter
+)
+from sut_app_datev_export.sut_app_datev_export.utils.export_context import get_export_context
+from sut_app_datev_export.sut_app_datev_export.utils.export_plan import get_export_plan
+from sut_app_datev_export.sut_app_datev_export.utils.export_restrictions import (
+	compile_suppressed_columns,
+	validate_export_restrictions
+)
+from sut_app_datev_export.sut_app_datev_export.utils.export_writeback import write_back_exported_employees
+from sut_app_datev_export.sut_app_datev_export.utils.file_builder import (
+	generate_employee_data,
+	generate_festbezuege_records,
+	generate_record_description
+)
+
 
 class TestDATEVExportSUTSettings(FrappeTestCase):
-	pass
+	def test_lodas_files_match_golden_files(self):
+		failures = check_golden_files()
+		self.assertFalse(failures, "\n".join(failures))
+
+	def test_streamed_lodas_files_match_golden_files(self):
+		failures = check_golden_files(chunk_size=STREAMED_CHUNK_SIZE)
+		self.assertFalse(failures, "\n".join(failures))
+
+	def test_restrictions_are_validated_against_the_record_spec(self):
+		validate_export_restrictions([frappe._dict(field_name="st_klasse"), frappe._dict(field_name="iban")])
+		self.assertRaises(
+			frappe.ValidationError, validate_export_restrictions, [frappe._dict(field_name="no_lodas_field")]
+		)
+
+	def test_values_longer_than_their_column_are_reported_not_cut(self):
+		employee = frappe._dict(
+			name="HR-EMP-1", last_name="Müller", first_name="Jörg", date_of_birth="1985-03-07", gender="Male",
+			date_of_joining="2024-02-29", custom_steueridentnummer="123456789012"
+		)
+		settings = get_settings()
+
+		errors = get_employee_validation_errors({"Golden GmbH": [employee]}, settings)
+		self.assertEqual(
+			errors, ["Employee HR-EMP-1: custom_steueridentnummer has 12 characters, identifikationsnummer allows 11"]
+		)
+
+		# Restricted columns are left empty, their length does not matter
+		settings.mehrfach_export_unterdruecken = [frappe._dict(field_name="identifikationsnummer", no_export=1)]
+		self.assertEqual(get_employee_validation_errors({"Golden GmbH": [employee]}, settings), [])
+
+	def test_lodas_fingerprint_changes_only_with_the_exported_values(self):
+		fields = ("last_name", "custom_summe_wochenarbeitszeit", "date_of_birth")
+		child = frappe._dict(kind_nummer=1, vorname_personaldaten_kinderdaten_allgemeine_angaben="Lena")
+		doc = frappe._dict(
+			last_name="Müller", custom_summe_wochenarbeitszeit=40, date_of_birth=datetime.date(1985, 3, 7),
+			kinder_tabelle=[child], bio="not exported"
+		)
+		fingerprint = get_lodas_fingerprint(doc, fields, "kinder_tabelle")
+
+		# Normalized values and fields outside `fields` do not change it
+		same = frappe._dict(doc, custom_summe_wochenarbeitszeit=40.0, date_of_birth="1985-03-07", bio="changed")
+		self.assertEqual(get_lodas_fingerprint(same, fields, "kinder_tabelle"), fingerprint)
+
+		self.assertNotEqual(get_lodas_fingerprint(frappe._dict(doc, last_name="Meier"), fields, "kinder_tabelle"), fingerprint)
+		self.assertNotEqual(get_lodas_fingerprint(frappe._dict(doc, kinder_tabelle=[]), fields, "kinder_tabelle"), fingerprint)
+		self.assertNotEqual(get_lodas_fingerprint(doc, fields), fingerprint)
+
+	def test_restricted_wage_fields_are_left_out_of_the_festbezuege(self):
+		validate_export_restrictions([frappe._dict(field_name="betrag"), frappe._dict(field_name="custom_gehalt_projekt_1")])
+		settings = get_settings()
+		settings.mehrfach_export_unterdruecken = [frappe._dict(field_name="custom_gehalt_projekt_1", no_export=1)]
+		employee = frappe._dict(custom_lohnart_p1="200", custom_gehalt_projekt_1=1500, custom_gehalt_projekt_2=800)
+
+		records = generate_festbezuege_records(employee, {"pnr": "1001"}, get_export_context(settings)).splitlines()
+
+		self.assertEqual(records[1], '12;"1001";2;200;0,00;0;0;')
+		self.assertEqual(records[2], '12;"1001";3;999;800,00;0;0;')
+
+	def test_lodas_and_employee_field_names_suppress_the_same_column(self):
+		self.assertEqual(compile_suppressed_columns({"iban"}), compile_suppressed_columns({"ma_iban"}))
+
+	def test_export_plan_prunes_fields_of_suppressed_columns(self):
+		plan = get_export_plan(compile_suppressed_columns({"iban", "gender", "az_wtl_indiv"}))
+		pruned = {field for field, _reason in plan.pruned_fields}
+		self.assertIn("iban", pruned)
+		self.assertNotIn("iban", plan.personalerfassungsbogen_fields)
+		self.assertIn("bic", plan.personalerfassungsbogen_fields)
+		# Still needed for the validation and the working time writeback
+		self.assertIn("gender", plan.employee_fields)
+		self.assertIn("custom_summe_wochenarbeitszeit", plan.employee_fields)
+
+	def test_only_selected_record_types_are_written_and_described(self):
+		settings = get_settings()
+		settings.export_record_types = "1,5"
+		context = get_export_context(settings)
+		employees = next(iter(make_corpus().values()))
+
+		with frozen_environment():
+			stammdaten = generate_employee_data(employees, context)
+		description = generate_record_description(context.record_types)
+
+		self.assertEqual({line.split(";")[0] for line in stammdaten.splitlines()[1:]}, {"1", "5"})
+		self.assertEqual([line.split(";")[0] for line in description.splitlines()[1:] if line], ["1", "5"])
+
+	def test_export_filter_is_parsed_and_unknown_keys_are_rejected(self):
+		self.assertEqual(
+			parse_export_filter('{"companies": "Firma B, Firma A", "employees": [], "employment_types": ["Intern"]}'),
+			{"companies": ["Firma A", "Firma B"], "employment_types": ["Intern"]}
+		)
+		self.assertIsNone(parse_export_filter({"departments": []}))
+		self.assertRaises(frappe.ValidationError, parse_export_filter, {"designation": ["Manager"]})
+
+	def test_writeback_stores_the_exported_values_per_employee(self):
+		names = [make_employee(f"datev-writeback-{index}@example.com") for index in range(3)]
+
+		def export(hours, **kwargs):
+			for name in names:
+				frappe.db.set_value("Employee", name, "custom_for_next_export", 1, update_modified=False)
+			employees = [frappe._dict(name=name, custom_summe_wochenarbeitszeit=value) for name, value in zip(names, hours)]
+			return write_back_exported_employees(employees, commit=False, **kwargs)
+
+		def stored():
+			return [
+				frappe.db.get_value(
+					"Employee", name, ["custom_for_next_export", "custom_stored_value_of_summe_wochenarbeitszeit"]
+				)
+				for name in names
+			]
+
+		# Two chunks: one CASE per chunk must only assign the values of its own employees
+		with mock.patch(
+			"sut_app_datev_export.sut_app_datev_export.utils.export_writeback.IN_CLAUSE_CHUNK_SIZE", 2
+		):
+			stats = export((40, 20.5, 0))
+		self.assertEqual((stats["rows"], stats["statements"]), (3, 2))
+		self.assertEqual(stored(), [(0, 40), (0, 20.5), (0, 0)])
+
+		export((38, 30, 12), reset_flags=False)
+		self.assertEqual(stored(), [(1, 38), (1, 30), (1, 12)])
+
+		export((10, 10, 10), update_stored_values=False)
+		self.assertEqual(stored(), [(0, 38), (0, 30), (0, 12)])
@@ -0,0 +1,182 @@
+"""Synthetic employee corpus for the golden LODAS files.
+
+The corpus is fully deterministic and independent of the benchmark data (see
+benchmarks/synthetic.py), so the expected files only change when the export does:
+
+- employees 0..COVERAGE_COUNT-1 cycle through every key of every DIED table used by
+  the export, in the original, upper and title case spelling
+- the remaining employees cover empty, missing and unknown values
+- children (0-4, incl. empty and incomplete rows), disability data and all wage
+  component combinations (set, empty, zero, missing Lohnart) are spread over the corpus
+"""
+from datetime import date
+
+from sut_app_datev_export.sut_app_datev_export.utils.died_mappings import DIED_MAPPINGS
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+    CHILD_FIELDS,
+    DATE,
+    DIED,
+    EMPLOYEE_FIELDS,
+    LODAS_FIELD_MAPPING,
+    PERSONALERFASSUNGSBOGEN_FIELDS,
+    PERSONALERFASSUNGSBOGEN_WAGE_FIELDS,
+    VALUE
+)
+
+COMPANIES = ('Golden GmbH', 'Korpus AG', 'Referenz KG')
+
+# Abteilung name -> abteilungscode used instead of the database lookup
+DEPARTMENTS = {
+    '100-Verwaltung': '100',
+    '200-Entwicklung': '200',
+    '300-Vertrieb': '300',
+}
+
+DIED_SOURCE_FIELDS = tuple(source for _, source, conversion in LODAS_FIELD_MAPPING if conversion == DIED)
+DATE_SOURCE_FIELDS = tuple(source for _, source, conversion in LODAS_FIELD_MAPPING if conversion == DATE)
+
+# Lohnart and amount fields of the festbezuege, set per wage combination below
+WAGE_SOURCE_FIELDS = frozenset(PERSONALERFASSUNGSBOGEN_WAGE_FIELDS) | {
+    'custom_lohnart_gg', 'custom_lohnart_p1', 'custom_lohnart_p2', 'custom_lohnart_p3',
+    'custom_lohnart_p4', 'custom_lohnart_z1', 'custom_lohnart_z2', 'custom_summe_gehalt'
+}
+VALUE_SOURCE_FIELDS = tuple(
+    source for _, source, conversion in LODAS_FIELD_MAPPING
+    if conversion == VALUE and source not in WAGE_SOURCE_FIELDS
+)
+
+# Enough employees to reach every key of the largest DIED table
+COVERAGE_COUNT = max(len(DIED_MAPPINGS[field]) for field in DIED_SOURCE_FIELDS)
+EDGE_CASE_COUNT = 24
+CORPUS_SIZE = COVERAGE_COUNT + EDGE_CASE_COUNT
+
+EDGE_VALUES = (None, "", "unbekannter Wert", 0)
+DATE_VALUES = ("1985-03-07", None, "2024-02-29", date(2030, 12, 31), "", "31.12.2020", "2026-01-01")
+TEXT_VALUES = (
+    "Müller", None, "", "Straße 7a", "Ärzte & Söhne", 'Name "in Anführungszeichen"',
+    "Semikolon; im Text", 12345, 38.5, "  Leerzeichen  ", "é à ç", "0"
+)
+DEPARTMENT_VALUES = tuple(DEPARTMENTS) + ('Unbekannte Abteilung', None)
+
+def get_died_value(field, index):
+    """Every key of the field's DIED table in turn, then edge values."""
+    if index >= COVERAGE_COUNT:
+        return EDGE_VALUES[(index + len(field)) % len(EDGE_VALUES)]
+
+    keys = list(DIED_MAPPINGS[field])
+    key = keys[index % len(keys)]
+    spelling = (index // len(keys)) % 3
+    if spelling == 1:
+        return key.upper()
+    if spelling == 2:
+        return key.title()
+    return key
+
+def set_wage_fields(employee, index):
+    """One of 128 wage combinations: amounts set, empty or zero; Lohnart set, empty or missing."""
+    bits = index % 128
+    employee.update({
+        'custom_gehalt_des_grundvertrags': 3500 if bits & 1 else None,
+        'custom_gehalt_projekt_1': "500" if bits & 2 else None,
+        'custom_gehalt_projekt_2': 750.25 if bits & 4 else "0",
+        'custom_gehalt_projekt_3': "1.200,50" if index % 5 == 0 else "",
+        'custom_gehalt_projekt_4': 99 if index % 11 == 0 else None,
+        'custom_zulage_zulage_1': 150.5 if bits & 8 else None,
+        'custom_zulage_zulage_2': "80,00" if bits & 16 else "",
+        'custom_summe_gehalt': 3500 + index,
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt': 1 if bits & 64 else 0,
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1': index % 2,
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2': 0,
+        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3': 1 if index % 7 == 0 else 0,
+    })
+
+    lohnarten = {
+        'custom_lohnart_gg': 200, 'custom_lohnart_p1': 201, 'custom_lohnart_p2': 202,
+        'custom_lohnart_p3': None, 'custom_lohnart_p4': "204", 'custom_lohnart_z1': 300,
+        'custom_lohnart_z2': None if index % 3 else 301
+    }
+    if bits & 32:
+        # Missing Lohnart fields fall back to the default Lohnart of the record
+        for field in lohnarten:
+            employee.pop(field, None)
+    else:
+        employee.update(lohnarten)
+
+def make_children(index, last_name):
+    """0-4 children; every 7th employee also has an empty and an incomplete child row."""
+    children = [
+        {
+            'kind_nummer': number,
+            'vorname_personaldaten_kinderdaten_allgemeine_angaben': f"Kind{number}",
+            'familienname_personaldaten_kinderdaten_allgemeine_angaben': last_name,
+            'geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben': f"201{number}-0{number}-1{number}",
+        }
+        for number in range(1, index % 5 + 1)
+    ]
+    if index % 7 == 0:
+        children.append(dict.fromkeys(CHILD_FIELDS))
+        children.append({'kind_nummer': len(children) + 1, 'vorname_personaldaten_kinderdaten_allgemeine_angaben': "Ohne Datum"})
+    return children
+
+def make_corpus_employee(index):
+    """Build corpus employee `index` in the shape of get_employees_for_export()."""
+    employee = dict.fromkeys(EMPLOYEE_FIELDS + PERSONALERFASSUNGSBOGEN_FIELDS + PERSONALERFASSUNGSBOGEN_WAGE_FIELDS)
+    last_name = f"Golden{index}"
+
+    for position, field in enumerate(VALUE_SOURCE_FIELDS):
+        employee[field] = TEXT_VALUES[(index + position) % len(TEXT_VALUES)]
+    for position, field in enumerate(DATE_SOURCE_FIELDS):
+        employee[field] = DATE_VALUES[(index + position) % len(DATE_VALUES)]
+    for field in DIED_SOURCE_FIELDS:
+        employee[field] = get_died_value(field, index)
+
+    employee.update({
+        'name': f"HR-EMP-G{index:05d}",
+        'company': COMPANIES[index % len(COMPANIES)],
+        'employee_name': f"Jörg {last_name}",
+        'employee_number': None if index == CORPUS_SIZE - 1 else str(1000 + index),
+        'last_name': last_name,
+        'first_name': "Jörg" if index % 4 else "Zoë",
+        'abteilung_datev_lodas': DEPARTMENT_VALUES[index % len(DEPARTMENT_VALUES)],
+        'custom_summe_wochenarbeitszeit': (40, 38.5, 20, None)[index % 4],
+        'custom_stored_value_of_summe_wochenarbeitszeit': (None, 40)[index % 2],
+        '_restrict_az_wtl_indiv': index % 3 == 0,
+    })
+
+    # Disability: card dates and office data on every 4th employee
+    if index % 4 == 1:
+        employee.update({
+            'sb_ausweis_gueltig_ab_tt_mm_jjjj': "2022-05-01",
+            'custom_befristung_gdb_bescheid': "2027-06-30",
+            'ausstellende_dienststelle': "Versorgungsamt",
+            'ort_der_dienststelle': "Köln",
+            'ausweis_nr_aktenzeichen': f"AZ-{index}",
+        })
+
+    set_wage_fields(employee, index)
+
+    children = make_children(index, last_name)
+    if children:
+        employee['children'] = children
+
+    return employee
+
+def make_corpus():
+    """Build the corpus grouped by company, like get_employees_for_export()."""
+    employees_by_company = {}
+    for index in range(CORPUS_SIZE):
+        employee = make_corpus_employee(index)
+        employees_by_company.setdefault(employee['company'], []).append(employee)
+    return employees_by_company
+
+def change_for_delta(employees_by_company):
+    """Change some employees after the first export, for the delta export case."""
+    for employees in employees_by_company.values():
+        for employee in employees:
+            index = int(employee['name'][-5:])
+            if index % 10 == 0:
+                employee['last_name'] = f"Geändert{index}"
+            if index % 15 == 0:
+                employee['custom_gehalt_projekt_1'] = "650"
+            if index % 20 == 0 and employee.get('children'):
+                employee['children'] = employee['children'][:-1]
@@ -0,0 +1,228 @@
+"""Golden-file regression check for the LODAS export, with per-stage time budgets.
+
+Generates the LODAS files of the corpus (see corpus.py) for each case with a frozen
+date and fixed department codes, and compares them byte by byte (cp1252, CRLF) with
+the expected files in golden/expected/<case>/. Also times the export stages on the
+corpus and fails if one exceeds its budget.
+
+Run with (uses the frappe stand-in of the benchmarks if frappe is not installed):
+    python -m sut_app_datev_export.sut_app_datev_export.golden.runner [--update] [--no-budgets] [--budget-factor 2]
+
+--update rewrites the expected files; only use it for intended changes of the output.
+The files of the streamed export (in chunks of STREAMED_CHUNK_SIZE) are checked too.
+On a site the golden files are also checked by the DATEV Export SUT Settings tests;
+the time budgets are only checked here, not in the unit tests.
+"""
+import os
+import shutil
+import sys
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from unittest import mock
+
+from sut_app_datev_export.sut_app_datev_export.benchmarks import frappe_standin
+
+# Must run before the app modules below import frappe
+frappe_standin.install()
+
+import frappe
+
+from sut_app_datev_export.sut_app_datev_export.golden.corpus import (
+    COMPANIES,
+    DEPARTMENTS,
+    change_for_delta,
+    make_corpus
+)
+from sut_app_datev_export.sut_app_datev_export.utils import employee_data, file_builder
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import map_employee_to_lodas
+from sut_app_datev_export.sut_app_datev_export.utils.file_builder import (
+    generate_employee_data,
+    generate_lodas_files,
+    generate_lodas_files_streamed
+)
+
+EXPECTED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'expected')
+
+# Date of the golden files: StammdatenGueltigAb=01.01.2026 and the file timestamps
+GOLDEN_DATE = datetime(2026, 1, 15, 8, 30)
+
+CASES = ('full', 'restricted', 'delta')
+
+# Fields suppressed in the 'restricted' case (field_name, no_export)
+RESTRICTIONS = (('st_klasse', 1), ('iban', 1), ('az_wtl_indiv', 1), ('gebort', 0))
+
+# Seconds per 1000 employees, best of BUDGET_REPEAT runs. Generous, so only real
+# regressions fail; scale with budget_factor on slow machines.
+BUDGETS = {
+    'map_employee_to_lodas': 0.5,
+    'generate_employee_data': 2.5,
+    'generate_lodas_files': 3.0,
+}
+BUDGET_REPEAT = 3
+
+# Smaller than a company of the corpus, so the streamed check writes several chunks per file
+STREAMED_CHUNK_SIZE = 7
+
+def get_settings(case='full'):
+    """Export settings of a case, with a client number for every corpus company."""
+    restrictions = RESTRICTIONS if case == 'restricted' else ()
+    return frappe._dict(
+        consultant_number='123456',
+        company_client_mapping=[
+            frappe._dict(company=company, client_number=f"{20001 + index}")
+            for index, company in enumerate(COMPANIES)
+        ],
+        mehrfach_export_unterdruecken=[
+            frappe._dict(field_name=field_name, no_export=no_export) for field_name, no_export in restrictions
+        ],
+        delta_export=1 if case == 'delta' else 0,
+        parallel_export=0
+    )
+
+def frozen_environment():
+    """Freeze the date and the department codes, so the output does not depend on the site."""
+    stack = ExitStack()
+    stack.enter_context(mock.patch.object(file_builder, 'now_datetime', lambda: GOLDEN_DATE))
+    stack.enter_context(mock.patch.object(employee_data, 'get_department_codes', lambda: dict(DEPARTMENTS)))
+    return stack
+
+def get_expected_name(company):
+    return f"{company.replace(' ', '_')}.txt"
+
+def generate_case(case, chunk_size=None):
+    """Generate the LODAS files of a case; returns {expected file name: bytes}.
+
+    With `chunk_size` the files are written by the streamed export in chunks of that size.
+    """
+    employees_by_company = make_corpus()
+    settings = get_settings(case)
+
+    with frozen_environment():
+        if case == 'delta':
+            # First export for the snapshots, then export the changed corpus as delta
+            file_paths = generate_lodas_files(employees_by_company, get_settings('full'))
+            snapshots = {name: snapshot for f in file_paths for name, snapshot in f['snapshots'].items()}
+            remove_files(file_paths)
+
+            change_for_delta(employees_by_company)
+            for employees in employees_by_company.values():
+                for employee in employees:
+                    employee['_datev_snapshot'] = snapshots.get(employee['name'])
+
+        if chunk_size:
+            file_paths = generate_lodas_files_streamed(
+                ((company, iter_chunks(employees, chunk_size)) for company, employees in employees_by_company.items()),
+                settings
+            )
+        else:
+            file_paths = generate_lodas_files(employees_by_company, settings)
+
+    outputs = {}
+    for file_info in file_paths:
+        with open(file_info['path'], 'rb') as f:
+            outputs[get_expected_name(file_info['company'])] = f.read()
+    remove_files(file_paths)
+    return outputs
+
+def iter_chunks(employees, chunk_size):
+    for start in range(0, len(employees), chunk_size):
+        yield employees[start:start + chunk_size]
+
+def remove_files(file_paths):
+    for file_info in file_paths:
+        os.remove(file_info['path'])
+
+def check_golden_files(cases=CASES, chunk_size=None):
+    """Compare the generated files with the expected files; returns a list of failures."""
+    failures = []
+    for case in cases:
+        case_dir = os.path.join(EXPECTED_DIR, case)
+        outputs = generate_case(case, chunk_size)
+        expected_names = set(os.listdir(case_dir)) if os.path.isdir(case_dir) else set()
+
+        for name in sorted(expected_names - set(outputs)):
+            failures.append(f"{case}/{name}: expected file was not generated")
+
+        for name, content in sorted(outputs.items()):
+            if name not in expected_names:
+                failures.append(f"{case}/{name}: no expected file")
+                continue
+            with open(os.path.join(case_dir, name), 'rb') as f:
+                expected = f.read()
+            if content != expected:
+                failures.append(f"{case}/{name}: {describe_difference(expected, content)}")
+
+    return failures
+
+def describe_difference(expected, actual):
+    """First differing line of two LODAS files."""
+    expected_lines = expected.split(b"\r\n")
+    actual_lines = actual.split(b"\r\n")
+    for number, (expected_line, actual_line) in enumerate(zip(expected_lines, actual_lines), 1):
+        if expected_line != actual_line:
+            return (f"line {number} differs\n  expected: {expected_line.decode('cp1252')}\n"
+                    f"  actual:   {actual_line.decode('cp1252')}")
+    return f"{len(expected_lines)} lines expected, {len(actual_lines)} generated"
+
+def update_golden_files(cases=CASES):
+    """Rewrite the expected files of the cases from the current export."""
+    for case in cases:
+        case_dir = os.path.join(EXPECTED_DIR, case)
+        shutil.rmtree(case_dir, ignore_errors=True)
+        os.makedirs(case_dir)
+        for name, content in generate_case(case).items():
+            with open(os.path.join(case_dir, name), 'wb') as f:
+                f.write(content)
+
+def measure_stages():
+    """Best time of each budgeted stage on the corpus, in seconds per 1000 employees."""
+    employees_by_company = make_corpus()
+    employees = [employee for employees in employees_by_company.values() for employee in employees]
+    settings = get_settings()
+    stages = {
+        'map_employee_to_lodas': lambda: [map_employee_to_lodas(employee) for employee in employees],
+        'generate_employee_data': lambda: generate_employee_data(employees, settings),
+        'generate_lodas_files': lambda: remove_files(generate_lodas_files(employees_by_company, settings)),
+    }
+
+    timings = {}
+    with frozen_environment():
+        for stage, function in stages.items():
+            best = None
+            for _ in range(BUDGET_REPEAT):
+                start = time.perf_counter()
+                function()
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            timings[stage] = best * 1000 / len(employees)
+    return timings
+
+def check_budgets(budget_factor=1.0):
+    """Check the stage timings against BUDGETS; returns a list of failures."""
+    failures = []
+    for stage, seconds in measure_stages().items():
+        budget = BUDGETS[stage] * budget_factor
+        if seconds > budget:
+            failures.append(f"{stage}: {seconds:.3f} s per 1000 employees exceeds the budget of {budget:.3f} s")
+    return failures
+
+def main(args):
+    if '--update' in args:
+        update_golden_files()
+        print(f"Updated the expected files in {EXPECTED_DIR}")
+        return 0
+
+    failures = check_golden_files()
+    failures += [f"streamed {failure}" for failure in check_golden_files(chunk_size=STREAMED_CHUNK_SIZE)]
+    if '--no-budgets' not in args:
+        budget_factor = float(args[args.index('--budget-factor') + 1]) if '--budget-factor' in args else 1.0
+        failures += check_budgets(budget_factor)
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    print(f"{len(failures)} failures" if failures else "All golden files match and all stages are within budget")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -1,7 +1,17 @@
 import frappe
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+    get_lodas_fingerprint,
+    EMPLOYEE_FINGERPRINT_FIELDS
+)
 
-def employee_on_update(doc, method=None):
-    """Set 'for_next_export' flag whenever an employee record is saved."""
-    if not doc.custom_for_next_export:
-        frappe.db.set_value("Employee", doc.name, "custom_for_next_export", 1, update_modified=False)
-        frappe.db.commit()
+def employee_before_save(doc, method=None):
+    """Set 'for_next_export' flag when a field that reaches DATEV has changed.
+    
+    Compares a fingerprint of the exported fields with the stored one and sets the flag
+    on the document before it is written, so it is saved with the employee in the same
+    UPDATE and transaction.
+    """
+    fingerprint = get_lodas_fingerprint(doc, EMPLOYEE_FINGERPRINT_FIELDS)
+    if fingerprint != doc.custom_datev_fingerprint:
+        doc.custom_datev_fingerprint = fingerprint
+        doc.custom_for_next_export = 1
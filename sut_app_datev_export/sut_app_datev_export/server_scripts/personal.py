@@ -1,8 +1,38 @@
 import frappe
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+    get_lodas_fingerprint,
+    PERSONALERFASSUNGSBOGEN_FINGERPRINT_FIELDS
+)
+
+def personal_before_save(doc, method=None):
+    """Store the fingerprint of the exported fields and remember whether it changed."""
+    fingerprint = get_lodas_fingerprint(doc, PERSONALERFASSUNGSBOGEN_FINGERPRINT_FIELDS, 'kinder_tabelle')
+    doc.flags.datev_fingerprint_changed = fingerprint != doc.datev_fingerprint
+    doc.datev_fingerprint = fingerprint
 
 def employee_on_update(doc, method=None):
-    """Set 'for_next_export' flag whenever an personal employee record is saved."""
-    get_emp_doc = frappe.get_doc("Employee" , doc.employee)
-    if not get_emp_doc.custom_for_next_export:
-        get_emp_doc.db_set('custom_for_next_export', 1, update_modified=False)
-        frappe.db.commit()
\ No newline at end of file
+    """Set 'for_next_export' flag when a personal employee record field that reaches DATEV has changed.
+    
+    If the record was moved to another employee, both the previous and the new employee
+    are flagged: the data leaves the one and reaches the other. One conditional UPDATE
+    without loading the Employees; committed with the Personalerfassungsbogen save.
+    """
+    previous = doc.get_doc_before_save()
+    previous_employee = previous.employee if previous else None
+    
+    employees = []
+    if previous_employee != doc.employee:
+        employees = [previous_employee, doc.employee]
+    elif doc.flags.datev_fingerprint_changed:
+        employees = [doc.employee]
+    
+    employees = [employee for employee in employees if employee]
+    if not employees:
+        return
+
+    placeholders = ", ".join(["%s"] * len(employees))
+    frappe.db.sql(
+        f"""UPDATE `tabEmployee` SET `custom_for_next_export` = 1
+        WHERE `name` IN ({placeholders}) AND `custom_for_next_export` = 0""",
+        employees
+    )
@@ -1,5 +1,3 @@
-import frappe
-from frappe import _
 from datetime import datetime
 
 def get_birth_country_mapping():
@@ -668,6 +666,56 @@ DIED_MAPPINGS = {
 }
 
 
+# Date fields formatted as DD.MM.YYYY
+DATE_FIELDS = frozenset([
+    "date_of_birth", "date_of_joining", "relieving_date",
+    "arbeits_ausbildungsbeginn_tt_mm_jjjj", "arbeits_ausbildungsende_tt_mm_jjjj",
+    "custom_befristung_arbeitserlaubnis", "custom_befristung_aufenthaltserlaubnis",
+    "datum_des_todes", "custom_ersteintritt_ins_unternehmen_",
+    "geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben",
+    "sb_ausweis_gueltig_ab_tt_mm_jjjj", "custom_befristung_gdb_bescheid",
+    "tatsaechliches_ende_der_ausbildung", "voraussichtliches_ende_der_ausbildung_gem_vertrag",
+    "studienbescheinigung", "beginn_der_ausbildung"
+])
+
+# Numeric and string fields that don't need mapping (passthrough)
+PASSTHROUGH_FIELDS = frozenset([
+    # Numeric fields
+    "jobticket_hoehe_des_geldwerten_vorteils",
+    "basislohn", "stundenlohn", "stundenlohn_1",
+    "anzahl_kinderfreibeträge",
+    "grundurlaubsanspruch", "urlaubsanspruch_aktuelles_jahr",
+    "custom_summe_wochenarbeitszeit", "kind_nummer",
+
+    # String fields
+    "last_name", "first_name", "personal_email", "cell_number",
+    "custom_straße", "custom_hausnummer", "custom_ort", "custom_plz",
+    "iban", "bic", "geburtsname", "geburtsort", "versicherungsnummer",
+    "ausweis_nr_aktenzeichen", "employee_number", "namenszusatz_geburtsname",
+    "namenszusatz_mitarbeitername", "vorsatzwort_geburtsname", "vorsatzwort_mitarbeitername",
+    "familienname_personaldaten_kinderdaten_allgemeine_angaben",
+    "vorname_personaldaten_kinderdaten_allgemeine_angaben",
+    "ausstellende_dienststelle", "abweichender_kontoinhaber", "abteilung_datev_lodas", "akademischer_grad",
+    "custom_anschriftenzusatz", "ort_der_dienststelle"
+])
+
+def compile_died_mapping(mapping):
+    """Compile a DIED mapping into (lowercased key -> value dict, default value).
+
+    The first key wins if several keys only differ in case, like the linear scan it replaces.
+    """
+    lookup = {}
+    for key, mapped_value in mapping.items():
+        lookup.setdefault(key.lower(), mapped_value)
+    return lookup, mapping.get('', "")
+
+# Precompiled case-insensitive lookup tables, built once at import time
+COMPILED_DIED_MAPPINGS = {
+    field_name: compile_died_mapping(mapping)
+    for field_name, mapping in DIED_MAPPINGS.items()
+}
+
+
 def format_date(date_str):
     """Format date to DD.MM.YYYY format."""
     if not date_str:
@@ -685,73 +733,31 @@ def map_value_to_died(field_name, value):
     if value is None:
         return ""
 
-    # Convert value to lowercase for case-insensitive mapping
-    value_lower = str(value).lower() if value else ""
-
     # Handle special case for date fields
-    if field_name in [
-        "date_of_birth", "date_of_joining", "relieving_date",
-        "arbeits_ausbildungsbeginn_tt_mm_jjjj", "arbeits_ausbildungsende_tt_mm_jjjj",
-        "custom_befristung_arbeitserlaubnis", "custom_befristung_aufenthaltserlaubnis",
-        "datum_des_todes", "custom_ersteintritt_ins_unternehmen_",
-        "geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben",
-        "sb_ausweis_gueltig_ab_tt_mm_jjjj", "custom_befristung_gdb_bescheid",
-        "tatsaechliches_ende_der_ausbildung", "voraussichtliches_ende_der_ausbildung_gem_vertrag",
-        "studienbescheinigung", "beginn_der_ausbildung"
-    ]:
+    if field_name in DATE_FIELDS:
         return format_date(value)
 
-    # Handle numeric fields that don't need mapping (passthrough)
-    if field_name in [
-         "jobticket_hoehe_des_geldwerten_vorteils",
-        "basislohn", "stundenlohn", "stundenlohn_1",
-        "anzahl_kinderfreibeträge",
-        "grundurlaubsanspruch", "urlaubsanspruch_aktuelles_jahr",
-        "custom_summe_wochenarbeitszeit", "kind_nummer"
-    ]:
+    # Handle numeric and string fields that don't need mapping (passthrough)
+    if field_name in PASSTHROUGH_FIELDS:
         return value
 
-    # Handle string fields that don't need mapping (passthrough)
-    if field_name in [
-        "last_name", "first_name", "personal_email", "cell_number",
-        "custom_straße", "custom_hausnummer", "custom_ort", "custom_plz",
-        "iban", "bic", "geburtsname", "geburtsort", "versicherungsnummer",
-        "ausweis_nr_aktenzeichen", "employee_number", "namenszusatz_geburtsname",
-        "namenszusatz_mitarbeitername", "vorsatzwort_geburtsname", "vorsatzwort_mitarbeitername",
-        "familienname_personaldaten_kinderdaten_allgemeine_angaben",
-        "vorname_personaldaten_kinderdaten_allgemeine_angaben",
-        "ausstellende_dienststelle", "abweichender_kontoinhaber", "abteilung_datev_lodas" ,"akademischer_grad",
-        "custom_anschriftenzusatz", "ort_der_dienststelle"
-    ]:
+    # Check if field has a mapping
+    compiled = COMPILED_DIED_MAPPINGS.get(field_name)
+    if compiled is None:
+        # For fields without specific mappings, return the original value
         return value
 
-    # Check if field has a mapping
-    if field_name in DIED_MAPPINGS:
-        mapping = DIED_MAPPINGS[field_name]
-        
-        # Case-insensitive lookup through the dictionary
-        result = ""
-        
-        # First try to find an exact match (case-insensitive)
-        for key, mapped_value in mapping.items():
-            if key.lower() == value_lower:
-                result = mapped_value
-                break
-        
-        # If no mapping found and value is not empty, try to get default
+    lookup, default = compiled
+
+    # Convert value to lowercase for case-insensitive mapping
+    value_lower = str(value).lower() if value else ""
+    result = lookup.get(value_lower, "")
+
+    # If no mapping found, use the default (empty string mapping) and,
+    # for non-empty values without a default, the original value
+    if not result:
+        result = default
         if not result and value_lower:
-            # Look for empty string key as default
-            result = mapping.get('', "")
-            # If no default found, use original value
-            if not result:
-                result = value
-        
-        # If value was empty, get the default (empty string mapping)
-        if not result and not value_lower:
-            result = mapping.get('', "")
-            
-    else:
-        # For fields without specific mappings, return the original value
-        result = value
+            result = value
 
-    return result
\ No newline at end of file
+    return result
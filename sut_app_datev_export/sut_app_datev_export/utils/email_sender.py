@@ -1,5 +1,7 @@
 import frappe
+import hashlib
 import os
+import shutil
 from frappe import _
 
 def send_export_email(recipient, file_paths):
@@ -9,29 +11,13 @@ def send_export_email(recipient, file_paths):
     # Prepare message
     message = format_email_message(file_paths)
 
-    # Create attachments
+    # Create attachments - referenced by File id, so the email queue does not store another copy
     attachments = []
+    folder = create_datev_folder()
     for file_info in file_paths:
-        file_path = file_info['path']
-        filename = file_info['filename']
-        with open(file_path, 'rb') as f:
-            content = f.read()
-
-        # Save file in ERPNext using the File doctype directly
-        folder = create_datev_folder()
-        file_doc = frappe.new_doc("File")
-        file_doc.file_name = filename
-        file_doc.content = content
-        file_doc.folder = folder
-        file_doc.is_private = 1
-        file_doc.attached_to_doctype = "DATEV Export SUT Settings"
-        file_doc.attached_to_name = "DATEV Export SUT Settings"
-        file_doc.save()
-
-        attachments.append({
-            "fname": filename,
-            "fcontent": content
-        })
+        file_doc = save_export_file(file_info, folder)
+        file_info['file_url'] = file_doc.file_url
+        attachments.append({"fid": file_doc.name})
 
     # Send email
     frappe.sendmail(
@@ -43,12 +29,41 @@ def send_export_email(recipient, file_paths):
         reference_name="DATEV Export SUT Settings"
     )
 
-    # Clean up temporary files
-    for file_info in file_paths:
-        try:
-            os.remove(file_info['path'])
-        except:
-            pass
+def save_export_file(file_info, folder):
+    """Move a LODAS file into the private files of the site and save it as File, without loading it into memory.
+
+    The File is created from its URL; the content hash is computed block by block, so
+    Frappe does not read the whole file to compute it.
+    """
+    filename = file_info['filename']
+    target_path = frappe.get_site_path("private", "files", filename)
+    if os.path.exists(target_path):
+        filename = f"{frappe.generate_hash(length=6)}_{filename}"
+        target_path = frappe.get_site_path("private", "files", filename)
+    shutil.move(file_info['path'], target_path)
+    file_info['path'] = target_path
+
+    # Save file in ERPNext using the File doctype directly
+    file_doc = frappe.new_doc("File")
+    file_doc.file_name = filename
+    file_doc.file_url = f"/private/files/{filename}"
+    file_doc.file_size = os.path.getsize(target_path)
+    file_doc.content_hash = get_file_hash(target_path)
+    file_doc.folder = folder
+    file_doc.is_private = 1
+    file_doc.attached_to_doctype = "DATEV Export SUT Settings"
+    file_doc.attached_to_name = "DATEV Export SUT Settings"
+    file_doc.save()
+
+    return file_doc
+
+def get_file_hash(path, block_size=1024 * 1024):
+    """MD5 of a file like frappe.utils.get_content_hash, read block by block."""
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            md5.update(block)
+    return md5.hexdigest()
 
 def format_email_message(file_paths):
     """Format detailed email message."""
@@ -1,326 +1,664 @@
 import frappe
 from frappe import _
+from frappe.utils import cint
+import hashlib
+import json
+from collections import ChainMap, namedtuple
 from datetime import datetime
+from decimal import Decimal
 from sut_app_datev_export.sut_app_datev_export.utils.died_mappings import map_value_to_died, format_date
+from sut_app_datev_export.sut_app_datev_export.utils.export_cache import (
+    get_schema_value,
+    doctype_exists,
+    get_table_columns,
+    get_department_codes
+)
+from sut_app_datev_export.sut_app_datev_export.utils.record_spec import RECORD_SPECS, clean_value
 
-def get_employees_for_export():
-    """Get all employees marked for export, grouped by company."""
+# Maximum number of values passed to a single SQL `IN (...)` clause
+IN_CLAUSE_CHUNK_SIZE = 1000
+
+# Employees fetched, written and released at once by the streamed export (see iter_employees_for_export)
+DEFAULT_EXPORT_CHUNK_SIZE = 500
+
+# Employee fields needed for the export
+EMPLOYEE_FIELDS = (
+    # Standard fields always needed
+    'name', 'company', 'employee_name', 'designation',
+    
+    # All employee fields needed for DATEV export following Excel mapping
+    'custom_land', 'custom_anschriftenzusatz', 'custom_befristung_arbeitserlaubnis',
+    'custom_arbeitsverhältnis', 'custom_befristung_aufenthaltserlaubnis', 'relieving_date',
+    'date_of_joining', 'personal_email', 'custom_ersteintritt_ins_unternehmen_',
+    'last_name', 'date_of_birth', 'gender', 'custom_hausnummer',
+    'custom_höchste_berufsausbildung', 'custom_höchster_schulabschluss',
+    'custom_steueridentnummer', 'custom_summe_wochenarbeitszeit', 
+    'custom_ort', 'employee_number', 'custom_plz', 
+    'custom_befristung_gdb_bescheid', 'custom_schwerbehinderung',
+    'custom_straße', 'cell_number', 'first_name', 'custom_summe_gehalt',
+    'employment_type',
+    
+    # Add the stored value field for comparison
+    'custom_stored_value_of_summe_wochenarbeitszeit',
+    
+    # Wage type fields - only include if they exist
+    'custom_lohnart_gg', 'custom_lohnart_p1', 'custom_lohnart_p2', 
+    'custom_lohnart_p3', 'custom_lohnart_p4', 'custom_lohnart_z1', 
+    'custom_lohnart_z2',
+    
+    # CRITICAL: Add the wage amount fields from Employee DocType
+    'custom_gehalt_des_grundvertrags',
+    'custom_gehalt_projekt_1', 'custom_gehalt_projekt_2', 
+    'custom_gehalt_projekt_3', 'custom_gehalt_projekt_4',
+    'custom_zulage_zulage_1', 'custom_zulage_zulage_2',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3'
+)
+
+# Standard Personalerfassungsbogen fields to always include (following Excel mapping and keeping fields from images)
+PERSONALERFASSUNGSBOGEN_FIELDS = (
+    'abweichender_kontoinhaber', 'akademischer_grad', 'alleinerziehend',
+    'anzahl_kinderfreibeträge', 'arbeits_ausbildungsbeginn_tt_mm_jjjj',
+    'arbeits_ausbildungsende_tt_mm_jjjj', 'arbeitsbescheinigung_im_austrittsmonat_elektr_ueberm',
+    'arbeitszeit_18_std_mit_zulassung_aa', 'ausstellende_dienststelle', 
+    'ausweis_nr_aktenzeichen', 'automatische_loeschung_nach_austritt_unterdruecken',
+    'bescheinigung_nach_313_sgb_iii_elektronisch_ueberm',
+    'bic', 'datum_des_todes', 'eel_meldung_nach_austritt_des_arbeitnehmers',
+    'ehrenamtliche_taetigkeit', 'einmalbezuege_nach_austritt_d_arbeitnehmers_berechnen',
+    'entlohnungsform', 'erstbeschaeftigung', 'ersteintrittsdatum_fuer_aag_und_brutto_netto_verwenden',
+    'geburtsland', 'geburtsname', 'geburtsort', 'grundurlaubsanspruch',
+    'iban', 'jobticket_hoehe_des_geldwerten_vorteils',
+    'kennzeichnung_arbeitgeber_haupt_nebenarbeitgeber',
+    'konfessionszugehoerigkeit_steuerpflichtiger', 
+    'namenszusatz_geburtsname', 'namenszusatz_mitarbeitername',
+    'ort_der_dienststelle', 'pauschalsteuer_berechnen', 'abteilung_datev_lodas',
+    'sb_ausweis_gueltig_ab_tt_mm_jjjj', 'staatsangehoerigkeit',
+    'steuerklasse_personaldaten_steuer_steuerkarte_allgemeine_daten',
+    'studienbescheinigung', 'stundenlohn', 'stundenlohn_1',
+    'tatsaechliches_ende_der_ausbildung', 'urlaubsanspruch_aktuelles_jahr',
+    'verheiratet', 'versicherungsnummer', 'beginn_der_ausbildung' , 'voraussichtliches_ende_der_ausbildung_gem_vertrag',
+    'vorsatzwort_geburtsname', 'vorsatzwort_mitarbeitername'
+)
+
+# Wage fields, included if they exist in the database
+PERSONALERFASSUNGSBOGEN_WAGE_FIELDS = (
+    'custom_gehalt_des_grundvertrags',
+    'custom_gehalt_projekt_1', 'custom_gehalt_projekt_2', 
+    'custom_gehalt_projekt_3', 'custom_gehalt_projekt_4',
+    'custom_zulage_zulage_1', 'custom_zulage_zulage_2',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3'
+)
+
+# Kinder Tabelle fields exported as child records
+CHILD_FIELDS = (
+    'kind_nummer',
+    'vorname_personaldaten_kinderdaten_allgemeine_angaben',
+    'familienname_personaldaten_kinderdaten_allgemeine_angaben',
+    'geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben'
+)
+
+# Keys of an export filter (see parse_export_filter) -> Employee field narrowed with `IN`;
+# departments are a Personalerfassungsbogen field and resolved to employee names
+EXPORT_FILTER_FIELDS = {
+    'companies': 'company',
+    'departments': None,
+    'employment_types': 'employment_type',
+    'employees': 'name',
+}
+
+def get_employees_for_export(plan=None, export_filter=None):
+    """Get all employees marked for export, grouped by company.
+    
+    With an export `plan` (see export_plan.get_export_plan) only the fields it lists are fetched,
+    with an `export_filter` (see parse_export_filter) only the matching employees.
+    """
     employees_by_company = {}
     
     # Get all employees marked for export with their fields
-    employees = frappe.get_all(
-        'Employee',
-        filters={'custom_for_next_export': 1 },
-        fields=[
-            # Standard fields always needed
-            'name', 'company', 'employee_name', 'designation',
-            
-            # All employee fields needed for DATEV export following Excel mapping
-            'custom_land', 'custom_anschriftenzusatz', 'custom_befristung_arbeitserlaubnis',
-            'custom_arbeitsverhältnis', 'custom_befristung_aufenthaltserlaubnis', 'relieving_date',
-            'date_of_joining', 'personal_email', 'custom_ersteintritt_ins_unternehmen_',
-            'last_name', 'date_of_birth', 'gender', 'custom_hausnummer',
-            'custom_höchste_berufsausbildung', 'custom_höchster_schulabschluss',
-            'custom_steueridentnummer', 'custom_summe_wochenarbeitszeit', 
-            'custom_ort', 'employee_number', 'custom_plz', 
-            'custom_befristung_gdb_bescheid', 'custom_schwerbehinderung',
-            'custom_straße', 'cell_number', 'first_name', 'custom_summe_gehalt',
-            'employment_type',
-            
-            # Add the stored value field for comparison
-            'custom_stored_value_of_summe_wochenarbeitszeit',
-            
-            # Wage type fields - only include if they exist
-            'custom_lohnart_gg', 'custom_lohnart_p1', 'custom_lohnart_p2', 
-            'custom_lohnart_p3', 'custom_lohnart_p4', 'custom_lohnart_z1', 
-            'custom_lohnart_z2',
-            
-            # CRITICAL: Add the wage amount fields from Employee DocType
-            'custom_gehalt_des_grundvertrags',
-            'custom_gehalt_projekt_1', 'custom_gehalt_projekt_2', 
-            'custom_gehalt_projekt_3', 'custom_gehalt_projekt_4',
-            'custom_zulage_zulage_1', 'custom_zulage_zulage_2',
-            'custom_ist_zusätzliche_vergütung_zum_grundgehalt',
-            'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1',
-            'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2',
-            'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3'
-        ]
-    )
+    employees = []
+    for filters in get_export_filter_chunks(export_filter):
+        employees.extend(frappe.get_all(
+            'Employee',
+            filters=filters,
+            fields=list(plan.employee_fields if plan else EMPLOYEE_FIELDS)
+        ))
     
+    # Get Personalerfassungsbogen data for all employees at once
+    personalerfassungsbogen_by_employee = get_personalerfassungsbogen_data_bulk(
+        [employee.name for employee in employees],
+        plan.personalerfassungsbogen_fields if plan else None,
+        plan.children if plan else True
+    )
+
     # Group by company
     for employee in employees:
         company = employee.company
         if company not in employees_by_company:
             employees_by_company[company] = []
         
-        # Get Personalerfassungsbogen data for this employee
-        personalerfassungsbogen_data = get_personalerfassungsbogen_data(employee.name)
-        
         # Add Personalerfassungsbogen data to employee
-        if personalerfassungsbogen_data:
-            for field, value in personalerfassungsbogen_data.items():
-                if field != 'kinder_tabelle':
-                    employee[field] = value
-            
-            # Add children data if available
-            if 'kinder_tabelle' in personalerfassungsbogen_data and personalerfassungsbogen_data['kinder_tabelle']:
-                employee['children'] = personalerfassungsbogen_data['kinder_tabelle']
+        merge_personalerfassungsbogen_data(employee, personalerfassungsbogen_by_employee.get(employee.name))
         
         employees_by_company[company].append(employee)
     
     return employees_by_company
 
+def get_export_company_counts(export_filter=None, filter_chunks=None):
+    """Get the number of employees marked for export (and matching `export_filter`) per company, ordered by company.
+    
+    One grouped query per filter chunk (see get_export_filter_chunks); pass the resolved
+    `filter_chunks` to reuse them, e.g. for iter_employees_for_export().
+    """
+    if filter_chunks is None:
+        filter_chunks = get_export_filter_chunks(export_filter)
+    
+    counts = {}
+    for filters in filter_chunks:
+        for row in frappe.get_all(
+            'Employee',
+            filters=filters,
+            fields=['company', 'count(name) as count'],
+            group_by='company',
+            order_by='company asc'
+        ):
+            counts[row.company] = counts.get(row.company, 0) + row.count
+    
+    return dict(sorted(counts.items(), key=lambda item: item[0] or ""))
+
+def iter_employees_for_export(company, chunk_size=DEFAULT_EXPORT_CHUNK_SIZE, plan=None, filter_chunks=None):
+    """Yield the employees of `company` marked for export in chunks of at most `chunk_size`.
+    
+    Each chunk is one keyset-paginated query (`name > last name ORDER BY name LIMIT chunk_size`),
+    so no rows are skipped with OFFSET, and is enriched with the Personalerfassungsbogen data
+    like get_employees_for_export(), also with the fields of the export `plan`. `filter_chunks`
+    are the resolved filters of an export filter (see get_export_filter_chunks), resolved once
+    for all companies; if they name the employees (in chunks of at most `chunk_size`), each
+    chunk is one `name IN (...)` query instead. Only one chunk is alive at a time if the
+    caller drops it.
+    """
+    if filter_chunks is None:
+        filter_chunks = get_export_filter_chunks(None, chunk_size)
+    
+    for filters in filter_chunks:
+        filters = dict(filters, company=company)
+        
+        # At most chunk_size names, one query
+        if 'name' in filters:
+            employees = fetch_employee_chunk(filters, plan)
+            if employees:
+                yield employees
+            continue
+        
+        last_name = None
+        while True:
+            if last_name is not None:
+                filters['name'] = ['>', last_name]
+            
+            employees = fetch_employee_chunk(filters, plan, chunk_size)
+            if not employees:
+                break
+            
+            last_name = employees[-1].name
+            yield employees
+            
+            if len(employees) < chunk_size:
+                break
+
+def fetch_employee_chunk(filters, plan=None, limit=None):
+    """Fetch the employees matching `filters` ordered by name, with their Personalerfassungsbogen data."""
+    employees = frappe.get_all(
+        'Employee',
+        filters=filters,
+        fields=list(plan.employee_fields if plan else EMPLOYEE_FIELDS),
+        order_by='name asc',
+        limit=limit
+    )
+    
+    personalerfassungsbogen_by_employee = get_personalerfassungsbogen_data_bulk(
+        [employee.name for employee in employees],
+        plan.personalerfassungsbogen_fields if plan else None,
+        plan.children if plan else True
+    )
+    for employee in employees:
+        merge_personalerfassungsbogen_data(employee, personalerfassungsbogen_by_employee.get(employee.name))
+    
+    return employees
+
+def parse_export_filter(value):
+    """Parse an export filter (dict or JSON) into a dict of sorted value lists, None if it filters nothing.
+    
+    Keys are companies, departments (Abteilung of the Personalerfassungsbogen), employment_types
+    and employees; values are lists or comma separated strings. Unknown keys are rejected.
+    With `include_unmarked` set, the listed employees are exported even if they are not marked
+    for export, like the single employee export (e.g. the Employee list action).
+    """
+    if isinstance(value, str):
+        value = frappe.parse_json(value) if value.strip() else None
+    if not value:
+        return None
+    
+    unknown = [key for key in value if key not in EXPORT_FILTER_FIELDS and key != 'include_unmarked']
+    if unknown:
+        frappe.throw(_("Unknown export filters: {0}. Use companies, departments, employment_types or employees.").format(
+            ", ".join(unknown)
+        ))
+    
+    export_filter = frappe._dict()
+    for key in EXPORT_FILTER_FIELDS:
+        values = value.get(key) or []
+        if isinstance(values, str):
+            values = values.split(',')
+        values = {str(item).strip() for item in values if item is not None and str(item).strip()}
+        if values:
+            export_filter[key] = sorted(values)
+    
+    # Never export all employees, only explicitly listed ones
+    if cint(value.get('include_unmarked')):
+        if not export_filter.get('employees'):
+            frappe.throw(_("Unmarked employees can only be exported if the employees are listed."))
+        export_filter.include_unmarked = 1
+    
+    return export_filter or None
+
+def get_export_filter_chunks(export_filter=None, size=IN_CLAUSE_CHUNK_SIZE):
+    """Yield the Employee filters of the export: marked employees, narrowed by `export_filter`.
+    
+    Companies and employment types become `IN` conditions of the query, `include_unmarked`
+    drops the export mark condition. Explicit employees
+    and the employees of the departments are passed as `name IN (...)` in chunks of at most
+    `size` names, one filter dict per chunk; nothing is yielded if no employee matches.
+    """
+    filters = {'custom_for_next_export': 1}
+    if not export_filter:
+        yield filters
+        return
+    
+    if export_filter.get('include_unmarked'):
+        del filters['custom_for_next_export']
+    
+    for key, field in EXPORT_FILTER_FIELDS.items():
+        if field and field != 'name' and export_filter.get(key):
+            filters[field] = ['in', export_filter[key]]
+    
+    names = None
+    if export_filter.get('employees'):
+        names = set(export_filter['employees'])
+    if export_filter.get('departments'):
+        in_departments = get_employees_in_departments(export_filter['departments'])
+        names = in_departments if names is None else names & in_departments
+    
+    if names is None:
+        yield filters
+        return
+    
+    for chunk in chunked(sorted(names), size):
+        yield dict(filters, name=['in', chunk])
+
+def get_employees_in_departments(departments):
+    """Get the names of the employees whose latest Personalerfassungsbogen is in one of the `departments`.
+    
+    The latest form (by modified, then name) is the one exported, see get_personalerfassungsbogen_data_bulk.
+    """
+    if not doctype_exists('Personalerfassungsbogen'):
+        return set()
+    
+    candidates = frappe.get_all(
+        'Personalerfassungsbogen',
+        filters={'abteilung_datev_lodas': ['in', list(departments)]},
+        pluck='employee',
+        distinct=True
+    )
+    
+    names = set()
+    for chunk in chunked([name for name in candidates if name], IN_CLAUSE_CHUNK_SIZE):
+        latest = {}
+        for form in frappe.get_all(
+            'Personalerfassungsbogen',
+            filters={'employee': ['in', chunk]},
+            fields=['employee', 'abteilung_datev_lodas'],
+            order_by='modified desc, name desc'
+        ):
+            latest.setdefault(form.employee, form.abteilung_datev_lodas)
+        names.update(name for name, department in latest.items() if department in departments)
+    
+    return names
+
+def merge_personalerfassungsbogen_data(employee, personalerfassungsbogen_data):
+    """Merge Personalerfassungsbogen data (and its children) into an employee dict."""
+    if not personalerfassungsbogen_data:
+        return employee
+    
+    for field, value in personalerfassungsbogen_data.items():
+        if field != 'kinder_tabelle':
+            employee[field] = value
+    
+    # Add children data if available
+    if personalerfassungsbogen_data.get('kinder_tabelle'):
+        employee['children'] = personalerfassungsbogen_data['kinder_tabelle']
+    
+    return employee
+
+def chunked(items, size):
+    """Yield successive slices of at most `size` items."""
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
 def get_personalerfassungsbogen_data(employee_name):
     """Get data from Personalerfassungsbogen DocType for an employee."""
+    return get_personalerfassungsbogen_data_bulk([employee_name]).get(employee_name, {})
+
+def get_personalerfassungsbogen_fields():
+    """Get the Personalerfassungsbogen fields used for the export that exist in the database.
+    
+    The projection is resolved once per worker and schema version (see export_cache).
+    """
+    return get_schema_value('personalerfassungsbogen_fields', _load_personalerfassungsbogen_fields)
+
+def _load_personalerfassungsbogen_fields():
+    """Filter the export fields to those that exist in the database."""
+    db_fields = get_table_columns('Personalerfassungsbogen')
+    return tuple(
+        field for field in PERSONALERFASSUNGSBOGEN_FIELDS + PERSONALERFASSUNGSBOGEN_WAGE_FIELDS
+        if field in db_fields
+    )
+
+def get_personalerfassungsbogen_data_bulk(employee_names, fields=None, children=True):
+    """Get Personalerfassungsbogen data for many employees, keyed by employee name.
+    
+    Fetches all forms with one `employee IN (...)` query and all children with one
+    `parent IN (...)` query per chunk. If an employee has several forms, the latest
+    one (by modified, then name) is used. `fields` limits the export fields fetched,
+    `children=False` skips the children.
+    """
+    employee_names = [name for name in dict.fromkeys(employee_names) if name]
+    if not employee_names:
+        return {}
+    
     # Check if the DocType exists
-    if not frappe.db.exists('DocType', 'Personalerfassungsbogen'):
+    if not doctype_exists('Personalerfassungsbogen'):
         return {}
     
-    # Get fields that exist in Personalerfassungsbogen
-    all_fields = []
-    db_fields = frappe.db.get_table_columns('Personalerfassungsbogen')
-    
-    # Standard fields to always include (following Excel mapping and keeping fields from images)
-    standard_fields = [
-        'abweichender_kontoinhaber', 'akademischer_grad', 'alleinerziehend',
-        'anzahl_kinderfreibeträge', 'arbeits_ausbildungsbeginn_tt_mm_jjjj',
-        'arbeits_ausbildungsende_tt_mm_jjjj', 'arbeitsbescheinigung_im_austrittsmonat_elektr_ueberm',
-        'arbeitszeit_18_std_mit_zulassung_aa', 'ausstellende_dienststelle', 
-        'ausweis_nr_aktenzeichen', 'automatische_loeschung_nach_austritt_unterdruecken',
-        'bescheinigung_nach_313_sgb_iii_elektronisch_ueberm',
-        'bic', 'datum_des_todes', 'eel_meldung_nach_austritt_des_arbeitnehmers',
-        'ehrenamtliche_taetigkeit', 'einmalbezuege_nach_austritt_d_arbeitnehmers_berechnen',
-        'entlohnungsform', 'erstbeschaeftigung', 'ersteintrittsdatum_fuer_aag_und_brutto_netto_verwenden',
-        'geburtsland', 'geburtsname', 'geburtsort', 'grundurlaubsanspruch',
-        'iban', 'jobticket_hoehe_des_geldwerten_vorteils',
-        'kennzeichnung_arbeitgeber_haupt_nebenarbeitgeber',
-        'konfessionszugehoerigkeit_steuerpflichtiger', 
-        'namenszusatz_geburtsname', 'namenszusatz_mitarbeitername',
-        'ort_der_dienststelle', 'pauschalsteuer_berechnen', 'abteilung_datev_lodas',
-        'sb_ausweis_gueltig_ab_tt_mm_jjjj', 'staatsangehoerigkeit',
-        'steuerklasse_personaldaten_steuer_steuerkarte_allgemeine_daten',
-        'studienbescheinigung', 'stundenlohn', 'stundenlohn_1',
-        'tatsaechliches_ende_der_ausbildung', 'urlaubsanspruch_aktuelles_jahr',
-        'verheiratet', 'versicherungsnummer', 'beginn_der_ausbildung' , 'voraussichtliches_ende_der_ausbildung_gem_vertrag',
-        'vorsatzwort_geburtsname', 'vorsatzwort_mitarbeitername'
-    ]
-    
-    # Add wage fields if they exist in the database
-    wage_fields = [
-        'custom_gehalt_des_grundvertrags',
-        'custom_gehalt_projekt_1', 'custom_gehalt_projekt_2', 
-        'custom_gehalt_projekt_3', 'custom_gehalt_projekt_4',
-        'custom_zulage_zulage_1', 'custom_zulage_zulage_2',
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt',
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1',
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2',
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3'
-    ]
-    
-    # Filter fields to only include those that exist in the database
-    for field in standard_fields:
-        if field in db_fields:
-            all_fields.append(field)
-    
-    for field in wage_fields:
-        if field in db_fields:
-            all_fields.append(field)
-    
-    # Always include 'name' for linking to children
-    all_fields.append('name')
-    
-    # Get Personalerfassungsbogen record linked to this employee
+    # Always include 'name' for linking to children and 'employee' for grouping
+    export_fields = get_personalerfassungsbogen_fields()
+    if fields is not None:
+        export_fields = [field for field in export_fields if field in fields]
+    all_fields = list(export_fields) + ['name', 'employee']
+    
+    # Get the latest Personalerfassungsbogen record linked to each employee
+    data_by_employee = {}
     try:
-        personalerfassungsbogen = frappe.get_all(
-            'Personalerfassungsbogen',
-            filters={'employee': employee_name},
-            fields=all_fields
-        )
+        for names in chunked(employee_names, IN_CLAUSE_CHUNK_SIZE):
+            personalerfassungsbogen = frappe.get_all(
+                'Personalerfassungsbogen',
+                filters={'employee': ['in', names]},
+                fields=all_fields,
+                order_by='modified desc, name desc'
+            )
+            for data in personalerfassungsbogen:
+                employee_name = data.pop('employee')
+                if employee_name not in data_by_employee:
+                    data_by_employee[employee_name] = data
     except Exception as e:
-        # frappe.log_error(f"Error fetching Personalerfassungsbogen for {employee_name}: {str(e)}", 
+        # frappe.log_error(f"Error fetching Personalerfassungsbogen: {str(e)}", 
         #                 "DATEV Export Error")
         return {}
     
-    # Return empty dict if no record found
-    if not personalerfassungsbogen:
-        return {}
-        
-    # Get the data
-    data = personalerfassungsbogen[0]
-    peb_name = data.pop('name')
+    # Map form name -> employee name for the children lookup
+    employee_by_peb = {}
+    for employee_name, data in data_by_employee.items():
+        employee_by_peb[data.pop('name')] = employee_name
     
     # Get children data
-    if frappe.db.exists('DocType', 'Kinder Tabelle'):
+    if children and employee_by_peb and doctype_exists('Kinder Tabelle'):
         try:
-            children = frappe.get_all(
-                'Kinder Tabelle',
-                filters={'parent': peb_name},
-                fields=[
-                    'kind_nummer',
-                    'vorname_personaldaten_kinderdaten_allgemeine_angaben',
-                    'familienname_personaldaten_kinderdaten_allgemeine_angaben',
-                    'geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben'
-                ],
-                order_by='kind_nummer asc'
-            )
-            
-            if children:
-                data['kinder_tabelle'] = children
+            for peb_names in chunked(employee_by_peb, IN_CLAUSE_CHUNK_SIZE):
+                child_rows = frappe.get_all(
+                    'Kinder Tabelle',
+                    filters={'parent': ['in', peb_names], 'parenttype': 'Personalerfassungsbogen'},
+                    fields=['parent', *CHILD_FIELDS],
+                    order_by='parent asc, kind_nummer asc, idx asc'
+                )
+                for child in child_rows:
+                    data = data_by_employee[employee_by_peb[child.pop('parent')]]
+                    data.setdefault('kinder_tabelle', []).append(child)
         except Exception as e:pass
-            # frappe.log_error(f"Error fetching children for {employee_name}: {str(e)}", 
+            # frappe.log_error(f"Error fetching children: {str(e)}", 
             #                 "DATEV Export Error")
     
-    return data
-
-def map_employee_to_lodas(employee):
-    """Map ERPNext employee fields to LODAS field format using exact Excel field mappings."""
-    # All field mappings following exact Excel specification
-    fields_to_map = {
-        # Employee identification & basic data - following Excel real field names
-        'pnr': employee.get('employee_number', f"BPNR {employee.get('name', '')}"),  # Personal number
-        'duevo_familienname': employee.get('last_name', ""),                        # Family name
-        'duevo_vorname': employee.get('first_name', ""),                           # First name
-        'geschlecht': map_value_to_died("gender", employee.get('gender')),         # Gender
-        'geburtsdatum_ttmmjj': format_date(employee.get('date_of_birth')),         # Birth date
-        'adresse_nation_kz': map_value_to_died("custom_land", employee.get('custom_land')),  # Country (Excel mapping)
-        'duevo_titel': employee.get('akademischer_grad', ""),                      # Academic title
-        'kz_alleinerziehend': map_value_to_died("alleinerziehend", employee.get('alleinerziehend')),  # Single parent
-        'adresse_anschriftenzusatz': employee.get('custom_anschriftenzusatz', ""), # Address addition
-        'arbeitserlaubnis': format_date(employee.get('custom_befristung_arbeitserlaubnis')),  # Work permit
-        'aufenthaltserlaubnis': format_date(employee.get('custom_befristung_aufenthaltserlaubnis')),  # Residence permit
-        'geburtsland': map_value_to_died("geburtsland", employee.get('geburtsland')),  # Birth country
-        'gebname': employee.get('geburtsname', ""),                                # Birth name
-        'gebort': employee.get('geburtsort', ""),                                  # Birth place
-        'email': employee.get('personal_email', ""),                               # Email
-        'kz_erstbeschaeftigung': map_value_to_died("erstbeschaeftigung", employee.get('erstbeschaeftigung')),  # First employment
-        'ersteintrittsdatum': format_date(employee.get('custom_ersteintritt_ins_unternehmen_')),  # First entry date
-        'verw_ersteintr_elena_bn': map_value_to_died("ersteintrittsdatum_fuer_aag_und_brutto_netto_verwenden", 
-                                                    employee.get('ersteintrittsdatum_fuer_aag_und_brutto_netto_verwenden')),  # Use first entry for AAG
-        'adresse_strasse_nr': employee.get('custom_hausnummer', ""),               # House number
-        'adresse_ort': employee.get('custom_ort', ""),                             # City
-        'adresse_plz': employee.get('custom_plz', ""),                             # Postal code
-        'adresse_strassenname': employee.get('custom_straße', ""),                 # Street name
-        'schwerbeschaedigt': map_value_to_died("custom_schwerbehinderung", employee.get('custom_schwerbehinderung')),  # Disability
-        'staatsangehoerigkeit': map_value_to_died("staatsangehoerigkeit", employee.get('staatsangehoerigkeit')),  # Nationality
-        'telefon': employee.get('cell_number', ""),                                # Phone
-        'url_tage_jhrl': employee.get('urlaubsanspruch_aktuelles_jahr', ""),      # Vacation days yearly
-        'familienstand': map_value_to_died("verheiratet", employee.get('verheiratet')),  # Marital status (keep current)
-        'duevo_namenszusatz': employee.get('namenszusatz_mitarbeitername', ""),    # Name addition
-        'duevo_vorsatzwort': employee.get('vorsatzwort_mitarbeitername', ""),      # Prefix word
-        'nazu_gebname': employee.get('namenszusatz_geburtsname', ""),              # Birth name addition
-        'vorsatzwort_gebname': employee.get('vorsatzwort_geburtsname', ""),        # Birth name prefix
-        'sozialversicherung_nr': employee.get('versicherungsnummer', ""), 
-        'datum_studienbesch': format_date(employee.get('studienbescheinigung')),   # Study certificate date
-        'datum_tod': format_date(employee.get('datum_des_todes')),   # Study certificate date
-        'ausbildungsbeginn': format_date(employee.get('beginn_der_ausbildung')),  
-        'vorr_ausbildungsende': format_date(employee.get('voraussichtliches_ende_der_ausbildung_gem_vertrag')),   
-
-        'loesch_nach_austr_unterdr': map_value_to_died("automatische_loeschung_nach_austritt_unterdruecken", 
-                                                      employee.get('automatische_loeschung_nach_austritt_unterdruecken')),  # Suppress automatic deletion
-        
-        # Job/Activity information - following Excel mapping
-        'berufsbezeichnung': employee.get('designation', ""),                      # Job title  
-        'kst_abteilungs_nr': "",  # Will be filled from department link                        # Department number
-        'schulabschluss': map_value_to_died("custom_höchster_schulabschluss", employee.get('custom_höchster_schulabschluss')),  # School education
-        'ausbildungsabschluss': map_value_to_died("custom_höchste_berufsausbildung", employee.get('custom_höchste_berufsausbildung')),  # Professional education
-        'sba_ausbildungsbeginn': format_date(employee.get('arbeits_ausbildungsbeginn_tt_mm_jjjj')),  # Training start
-        'sba_ausbildungsende': format_date(employee.get('arbeits_ausbildungsende_tt_mm_jjjj')),     # Training end
-        'datum_ben_ergeb_pruef': format_date(employee.get('tatsaechliches_ende_der_ausbildung')),   # Actual training end
-        'ehrenamtliche_taetigkeit': map_value_to_died("ehrenamtliche_taetigkeit", employee.get('ehrenamtliche_taetigkeit')),  # Voluntary work
-        
-        # Employment information - following Excel mapping
-        'arbeitsverhaeltnis': map_value_to_died("custom_arbeitsverhältnis", employee.get('custom_arbeitsverhältnis')),  # Employment type
-        'eintrittdatum': format_date(employee.get('date_of_joining')),             # Entry date
-        'austrittdatum': format_date(employee.get('relieving_date')),              # Exit date
-        'kz_arbbes_nae_abrech_autom': map_value_to_died("arbeitsbescheinigung_im_austrittsmonat_elektr_ueberm", 
-                                                       employee.get('arbeitsbescheinigung_im_austrittsmonat_elektr_ueberm')),  # Work certificate
-        'eel_nach_austritt_kz': map_value_to_died("eel_meldung_nach_austritt_des_arbeitnehmers", 
-                                                 employee.get('eel_meldung_nach_austritt_des_arbeitnehmers')),  # EEL after exit
-        'ebz_nach_austritt_kz': map_value_to_died("einmalbezuege_nach_austritt_d_arbeitnehmers_berechnen", 
-                                                 employee.get('einmalbezuege_nach_austritt_d_arbeitnehmers_berechnen')),  # One-time payments after exit
-        'kz_besch_nebenbesch': map_value_to_died("bescheinigung_nach_313_sgb_iii_elektronisch_ueberm", 
-                                                employee.get('bescheinigung_nach_313_sgb_iii_elektronisch_ueberm')),  # Certificate § 313
-        
-        # Tax information - following Excel mapping
-        'identifikationsnummer': employee.get('custom_steueridentnummer', ""),    # Tax ID
-        'st_klasse': map_value_to_died("steuerklasse_personaldaten_steuer_steuerkarte_allgemeine_daten", 
-                                      employee.get('steuerklasse_personaldaten_steuer_steuerkarte_allgemeine_daten')),  # Tax class
-        'konf_an': map_value_to_died("konfessionszugehoerigkeit_steuerpflichtiger", 
-                                    employee.get('konfessionszugehoerigkeit_steuerpflichtiger')),  # Religion
-        'kfb_anzahl': employee.get('anzahl_kinderfreibeträge', ""),               # Number of child allowances
-        'pausch_einhtl_2': map_value_to_died("pauschalsteuer_berechnen", employee.get('pauschalsteuer_berechnen')),  # Flat tax
-        'els_2_haupt_ag_kz': map_value_to_died("kennzeichnung_arbeitgeber_haupt_nebenarbeitgeber", 
-                                              employee.get('kennzeichnung_arbeitgeber_haupt_nebenarbeitgeber')),  # Main/secondary employer
-        
-        # Bank details - keep current as shown in images
-        'ma_iban': employee.get('iban', ""),
-        'ma_bic': employee.get('bic', ""),
-        'ma_bank_kto_inhaber_abw': employee.get('abweichender_kontoinhaber', ""),
-        
-        # Disability information - following Excel mapping
-        'sba_sb_ausweis_bis': format_date(employee.get('custom_befristung_gdb_bescheid')),  # Disability ID valid until
-        'sba_unter_18_std_aa_kz': map_value_to_died("arbeitszeit_18_std_mit_zulassung_aa", 
-                                                   employee.get('arbeitszeit_18_std_mit_zulassung_aa')),  # Under 18 hours with AA approval
-        'sba_kz_dienststelle': employee.get('ausstellende_dienststelle', ""),     # Issuing authority
-        'sba_az_geschaeftsstelle': employee.get('ausweis_nr_aktenzeichen', ""),   # ID number/file number
-        'sba_ort_dienstelle': employee.get('ort_der_dienststelle', ""),           # Authority location
-        'sba_sb_ausweis_ab': format_date(employee.get('sb_ausweis_gueltig_ab_tt_mm_jjjj')),  # Disability ID valid from
-        
-        # Working time information - NEW: Special logic for az_wtl_indiv
-        'az_wtl_indiv': get_az_wtl_indiv_value(employee),                         # Weekly working hours with special logic
-        'urlaubsanspr_pro_jahr': employee.get('grundurlaubsanspruch', ""),        
-        
-        # Salary information - keep current as shown in images
-        'std_lohn_2': employee.get('stundenlohn_1', ""),                            # Hourly wage 1 (keep current field name)
-        'lfd_brutto_vereinbart': employee.get('custom_summe_gehalt', ""),         # Current gross agreed
-        
-        # Travel subsidy - following Excel mapping
-        'jobticket': employee.get('jobticket_hoehe_des_geldwerten_vorteils', ""), # Job ticket
-        
-        # Special features - following Excel mapping
-        'entlohnungsform': map_value_to_died("entlohnungsform", employee.get('entlohnungsform')),  # Remuneration form
-        
-        # Additional fields for special records
-        'std_lohn_1': employee.get('stundenlohn', ""),  # Standard hourly wage
-        
-        # Default empty values for child information - keep current as shown in images
-        'kind_nr': "",
-        'kind_nachname': "",
-        'kind_vorname': "",
-        'kind_geburtsdatum': "",
-        
-        # Wage type fields (keeping existing names)
-        'custom_lohnart_gg': employee.get('custom_lohnart_gg', ""),
-        'custom_lohnart_p1': employee.get('custom_lohnart_p1', ""),
-        'custom_lohnart_p2': employee.get('custom_lohnart_p2', ""),
-        'custom_lohnart_p3': employee.get('custom_lohnart_p3', ""),
-        'custom_lohnart_p4': employee.get('custom_lohnart_p4', ""),
-        'custom_lohnart_z1': employee.get('custom_lohnart_z1', ""),
-        'custom_lohnart_z2': employee.get('custom_lohnart_z2', ""),
-        
-        # Wage amount fields
-        'custom_gehalt_des_grundvertrags': employee.get('custom_gehalt_des_grundvertrags', ""),
-        'custom_gehalt_projekt_1': employee.get('custom_gehalt_projekt_1', ""),
-        'custom_gehalt_projekt_2': employee.get('custom_gehalt_projekt_2', ""),
-        'custom_gehalt_projekt_3': employee.get('custom_gehalt_projekt_3', ""),
-        'custom_gehalt_projekt_4': employee.get('custom_gehalt_projekt_4', ""),
-        'custom_zulage_zulage_1': employee.get('custom_zulage_zulage_1', ""),
-        'custom_zulage_zulage_2': employee.get('custom_zulage_zulage_2', ""),
-        
-        # Additional wage logic fields
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt': employee.get('custom_ist_zusätzliche_vergütung_zum_grundgehalt', ""),
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1': employee.get('custom_ist_zusätzliche_vergütung_zum_grundgehalt_1', ""),
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2': employee.get('custom_ist_zusätzliche_vergütung_zum_grundgehalt_2', ""),
-        'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3': employee.get('custom_ist_zusätzliche_vergütung_zum_grundgehalt_3', ""),
-    }
+    return data_by_employee
+
+# How a LODAS field is filled from its source field in the (merged) employee data
+VALUE = 'value'  # Copied as is
+DATE = 'date'    # Formatted as DATEV date
+DIED = 'died'    # Mapped to the DIED code of the source field
+
+# LODAS field -> source field following exact Excel field mappings.
+# pnr, kst_abteilungs_nr, az_wtl_indiv and the kind_* fields are set in map_employee_to_lodas().
+LODAS_FIELD_MAPPING = (
+    # Employee identification & basic data - following Excel real field names
+    ('duevo_familienname', 'last_name', VALUE),                                # Family name
+    ('duevo_vorname', 'first_name', VALUE),                                    # First name
+    ('geschlecht', 'gender', DIED),                                            # Gender
+    ('geburtsdatum_ttmmjj', 'date_of_birth', DATE),                            # Birth date
+    ('adresse_nation_kz', 'custom_land', DIED),                                # Country (Excel mapping)
+    ('duevo_titel', 'akademischer_grad', VALUE),                               # Academic title
+    ('kz_alleinerziehend', 'alleinerziehend', DIED),                           # Single parent
+    ('adresse_anschriftenzusatz', 'custom_anschriftenzusatz', VALUE),          # Address addition
+    ('arbeitserlaubnis', 'custom_befristung_arbeitserlaubnis', DATE),          # Work permit
+    ('aufenthaltserlaubnis', 'custom_befristung_aufenthaltserlaubnis', DATE),  # Residence permit
+    ('geburtsland', 'geburtsland', DIED),                                      # Birth country
+    ('gebname', 'geburtsname', VALUE),                                         # Birth name
+    ('gebort', 'geburtsort', VALUE),                                           # Birth place
+    ('email', 'personal_email', VALUE),                                        # Email
+    ('kz_erstbeschaeftigung', 'erstbeschaeftigung', DIED),                     # First employment
+    ('ersteintrittsdatum', 'custom_ersteintritt_ins_unternehmen_', DATE),      # First entry date
+    ('verw_ersteintr_elena_bn', 'ersteintrittsdatum_fuer_aag_und_brutto_netto_verwenden', DIED),  # Use first entry for AAG
+    ('adresse_strasse_nr', 'custom_hausnummer', VALUE),                        # House number
+    ('adresse_ort', 'custom_ort', VALUE),                                      # City
+    ('adresse_plz', 'custom_plz', VALUE),                                      # Postal code
+    ('adresse_strassenname', 'custom_straße', VALUE),                          # Street name
+    ('schwerbeschaedigt', 'custom_schwerbehinderung', DIED),                   # Disability
+    ('staatsangehoerigkeit', 'staatsangehoerigkeit', DIED),                    # Nationality
+    ('telefon', 'cell_number', VALUE),                                         # Phone
+    ('url_tage_jhrl', 'urlaubsanspruch_aktuelles_jahr', VALUE),                # Vacation days yearly
+    ('familienstand', 'verheiratet', DIED),                                    # Marital status (keep current)
+    ('duevo_namenszusatz', 'namenszusatz_mitarbeitername', VALUE),             # Name addition
+    ('duevo_vorsatzwort', 'vorsatzwort_mitarbeitername', VALUE),               # Prefix word
+    ('nazu_gebname', 'namenszusatz_geburtsname', VALUE),                       # Birth name addition
+    ('vorsatzwort_gebname', 'vorsatzwort_geburtsname', VALUE),                 # Birth name prefix
+    ('sozialversicherung_nr', 'versicherungsnummer', VALUE),                   # Insurance number
+    ('datum_studienbesch', 'studienbescheinigung', DATE),                      # Study certificate date
+    ('datum_tod', 'datum_des_todes', DATE),                                    # Date of death
+    ('ausbildungsbeginn', 'beginn_der_ausbildung', DATE),                      # Training start
+    ('vorr_ausbildungsende', 'voraussichtliches_ende_der_ausbildung_gem_vertrag', DATE),  # Expected training end
+    ('loesch_nach_austr_unterdr', 'automatische_loeschung_nach_austritt_unterdruecken', DIED),  # Suppress automatic deletion
+
+    # Job/Activity information - following Excel mapping
+    ('berufsbezeichnung', 'designation', VALUE),                               # Job title
+    ('schulabschluss', 'custom_höchster_schulabschluss', DIED),                # School education
+    ('ausbildungsabschluss', 'custom_höchste_berufsausbildung', DIED),         # Professional education
+    ('sba_ausbildungsbeginn', 'arbeits_ausbildungsbeginn_tt_mm_jjjj', DATE),   # Training start
+    ('sba_ausbildungsende', 'arbeits_ausbildungsende_tt_mm_jjjj', DATE),       # Training end
+    ('datum_ben_ergeb_pruef', 'tatsaechliches_ende_der_ausbildung', DATE),     # Actual training end
+    ('ehrenamtliche_taetigkeit', 'ehrenamtliche_taetigkeit', DIED),            # Voluntary work
+
+    # Employment information - following Excel mapping
+    ('arbeitsverhaeltnis', 'custom_arbeitsverhältnis', DIED),                  # Employment type
+    ('eintrittdatum', 'date_of_joining', DATE),                                # Entry date
+    ('austrittdatum', 'relieving_date', DATE),                                 # Exit date
+    ('kz_arbbes_nae_abrech_autom', 'arbeitsbescheinigung_im_austrittsmonat_elektr_ueberm', DIED),  # Work certificate
+    ('eel_nach_austritt_kz', 'eel_meldung_nach_austritt_des_arbeitnehmers', DIED),  # EEL after exit
+    ('ebz_nach_austritt_kz', 'einmalbezuege_nach_austritt_d_arbeitnehmers_berechnen', DIED),  # One-time payments after exit
+    ('kz_besch_nebenbesch', 'bescheinigung_nach_313_sgb_iii_elektronisch_ueberm', DIED),  # Certificate § 313
+
+    # Tax information - following Excel mapping
+    ('identifikationsnummer', 'custom_steueridentnummer', VALUE),              # Tax ID
+    ('st_klasse', 'steuerklasse_personaldaten_steuer_steuerkarte_allgemeine_daten', DIED),  # Tax class
+    ('konf_an', 'konfessionszugehoerigkeit_steuerpflichtiger', DIED),          # Religion
+    ('kfb_anzahl', 'anzahl_kinderfreibeträge', VALUE),                         # Number of child allowances
+    ('pausch_einhtl_2', 'pauschalsteuer_berechnen', DIED),                     # Flat tax
+    ('els_2_haupt_ag_kz', 'kennzeichnung_arbeitgeber_haupt_nebenarbeitgeber', DIED),  # Main/secondary employer
+
+    # Bank details - keep current as shown in images
+    ('ma_iban', 'iban', VALUE),
+    ('ma_bic', 'bic', VALUE),
+    ('ma_bank_kto_inhaber_abw', 'abweichender_kontoinhaber', VALUE),
+
+    # Disability information - following Excel mapping
+    ('sba_sb_ausweis_bis', 'custom_befristung_gdb_bescheid', DATE),            # Disability ID valid until
+    ('sba_unter_18_std_aa_kz', 'arbeitszeit_18_std_mit_zulassung_aa', DIED),   # Under 18 hours with AA approval
+    ('sba_kz_dienststelle', 'ausstellende_dienststelle', VALUE),               # Issuing authority
+    ('sba_az_geschaeftsstelle', 'ausweis_nr_aktenzeichen', VALUE),             # ID number/file number
+    ('sba_ort_dienstelle', 'ort_der_dienststelle', VALUE),                     # Authority location
+    ('sba_sb_ausweis_ab', 'sb_ausweis_gueltig_ab_tt_mm_jjjj', DATE),           # Disability ID valid from
+
+    # Working time information
+    ('urlaubsanspr_pro_jahr', 'grundurlaubsanspruch', VALUE),                  # Basic vacation entitlement
+
+    # Salary information - keep current as shown in images
+    ('std_lohn_1', 'stundenlohn', VALUE),                                      # Standard hourly wage
+    ('std_lohn_2', 'stundenlohn_1', VALUE),                                    # Hourly wage 1 (keep current field name)
+    ('lfd_brutto_vereinbart', 'custom_summe_gehalt', VALUE),                   # Current gross agreed
+
+    # Travel subsidy - following Excel mapping
+    ('jobticket', 'jobticket_hoehe_des_geldwerten_vorteils', VALUE),           # Job ticket
+
+    # Special features - following Excel mapping
+    ('entlohnungsform', 'entlohnungsform', DIED),                              # Remuneration form
+
+    # Wage type fields (keeping existing names)
+    ('custom_lohnart_gg', 'custom_lohnart_gg', VALUE),
+    ('custom_lohnart_p1', 'custom_lohnart_p1', VALUE),
+    ('custom_lohnart_p2', 'custom_lohnart_p2', VALUE),
+    ('custom_lohnart_p3', 'custom_lohnart_p3', VALUE),
+    ('custom_lohnart_p4', 'custom_lohnart_p4', VALUE),
+    ('custom_lohnart_z1', 'custom_lohnart_z1', VALUE),
+    ('custom_lohnart_z2', 'custom_lohnart_z2', VALUE),
+
+    # Wage amount fields
+    ('custom_gehalt_des_grundvertrags', 'custom_gehalt_des_grundvertrags', VALUE),
+    ('custom_gehalt_projekt_1', 'custom_gehalt_projekt_1', VALUE),
+    ('custom_gehalt_projekt_2', 'custom_gehalt_projekt_2', VALUE),
+    ('custom_gehalt_projekt_3', 'custom_gehalt_projekt_3', VALUE),
+    ('custom_gehalt_projekt_4', 'custom_gehalt_projekt_4', VALUE),
+    ('custom_zulage_zulage_1', 'custom_zulage_zulage_1', VALUE),
+    ('custom_zulage_zulage_2', 'custom_zulage_zulage_2', VALUE),
+
+    # Additional wage logic fields
+    ('custom_ist_zusätzliche_vergütung_zum_grundgehalt', 'custom_ist_zusätzliche_vergütung_zum_grundgehalt', VALUE),
+    ('custom_ist_zusätzliche_vergütung_zum_grundgehalt_1', 'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1', VALUE),
+    ('custom_ist_zusätzliche_vergütung_zum_grundgehalt_2', 'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2', VALUE),
+    ('custom_ist_zusätzliche_vergütung_zum_grundgehalt_3', 'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3', VALUE),
+)
+
+# All source fields that reach the LODAS file: the mapping above, the fields used by
+# map_employee_to_lodas() directly, and which employee and company file a record belongs to
+LODAS_SOURCE_FIELDS = tuple(dict.fromkeys(
+    [source for _key, source, _conversion in LODAS_FIELD_MAPPING]
+    + ['employee_number', 'abteilung_datev_lodas', 'custom_summe_wochenarbeitszeit', 'company', 'employee']
+))
+
+# Kinder Tabelle fields copied to the child record (11), see map_child_to_lodas()
+CHILD_SOURCE_FIELDS = {
+    'kind_vorname': 'vorname_personaldaten_kinderdaten_allgemeine_angaben',
+    'kind_nachname': 'familienname_personaldaten_kinderdaten_allgemeine_angaben',
+}
+
+# A LODAS column with a max length: its (record number, column index), LODAS field,
+# source field and max length
+LengthLimit = namedtuple('LengthLimit', ['column', 'field', 'source', 'max_length'])
+
+def build_length_limits():
+    """List the columns with a max length whose value is copied as is from a source field.
+    
+    The department number (kst_abteilungs_nr) is the code of the linked Abteilung.
+    """
+    sources = {key: source for key, source, conversion in LODAS_FIELD_MAPPING if conversion == VALUE}
+    sources.update(CHILD_SOURCE_FIELDS)
+    sources['kst_abteilungs_nr'] = 'abteilung_datev_lodas'
+    
+    limits = []
+    for record in RECORD_SPECS:
+        for index, field in enumerate(record.fields):
+            key = field.source or field.name
+            if field.max_length and field.value is None and key in sources:
+                limits.append(LengthLimit((record.number, index), field.name, sources[key], field.max_length))
+    return tuple(limits)
+
+LENGTH_LIMITS = build_length_limits()
+
+# Fields of each DocType whose changes reach the LODAS file (see get_lodas_fingerprint)
+EMPLOYEE_FINGERPRINT_FIELDS = tuple(field for field in LODAS_SOURCE_FIELDS if field in EMPLOYEE_FIELDS)
+PERSONALERFASSUNGSBOGEN_FINGERPRINT_FIELDS = tuple(
+    field for field in LODAS_SOURCE_FIELDS
+    if field in PERSONALERFASSUNGSBOGEN_FIELDS + PERSONALERFASSUNGSBOGEN_WAGE_FIELDS + ('employee',)
+)
+
+def get_lodas_fingerprint(doc, fields, child_table=None):
+    """Compute a compact fingerprint of the `fields` of `doc` (and its `child_table` rows).
+    
+    Only reads the document, no queries. Values are normalized, so 40 and 40.0 or a date
+    and its string give the same fingerprint; any remaining difference only leads to one
+    export too many, never to a missed one.
+    """
+    values = [_normalize_fingerprint_value(doc.get(field)) for field in fields]
+    if child_table:
+        for child in doc.get(child_table) or []:
+            values.append([_normalize_fingerprint_value(child.get(field)) for field in CHILD_FIELDS])
+    
+    return hashlib.blake2b(json.dumps(values, ensure_ascii=False).encode(), digest_size=8).hexdigest()
+
+def _normalize_fingerprint_value(value):
+    """Normalize a field value for the fingerprint."""
+    if value is None:
+        return ""
+    if isinstance(value, (int, float, Decimal)):
+        return float(value)
+    return str(value)
+
+def map_employee_to_lodas(employee, department_codes=None, mapping=LODAS_FIELD_MAPPING):
+    """Map ERPNext employee fields to LODAS field format using exact Excel field mappings.
+    
+    `department_codes` (Abteilung name -> code) defaults to the cached lookup; pass it
+    explicitly to map without accessing the cache, e.g. in worker processes. `mapping`
+    defaults to all of LODAS_FIELD_MAPPING; the export passes the part of it written to
+    the selected records (see export_plan), unmapped keys are exported empty.
+    """
+    # Personal number
+    fields_to_map = {'pnr': employee.get('employee_number', f"BPNR {employee.get('name', '')}")}
+    
+    # All field mappings following exact Excel specification (see LODAS_FIELD_MAPPING)
+    for key, source, conversion in mapping:
+        if conversion == DIED:
+            fields_to_map[key] = map_value_to_died(source, employee.get(source))
+        elif conversion == DATE:
+            fields_to_map[key] = format_date(employee.get(source))
+        else:
+            fields_to_map[key] = employee.get(source, "")
+    
+    # Working time - NEW: Special logic for az_wtl_indiv
+    fields_to_map['az_wtl_indiv'] = get_az_wtl_indiv_value(employee)
+    
+    # Department number, filled from department link below
+    fields_to_map['kst_abteilungs_nr'] = ""
     
-    # Fetch department code from linked Abteilung DocType
+    # Default empty values for child information - keep current as shown in images
+    fields_to_map['kind_nr'] = ""
+    fields_to_map['kind_nachname'] = ""
+    fields_to_map['kind_vorname'] = ""
+    fields_to_map['kind_geburtsdatum'] = ""
+    
+    # Fetch department code from the cached Abteilung lookup
     if employee.get('abteilung_datev_lodas'):
-        try:
-            department_doc = frappe.get_doc("Abteilung fuer DATEV Lodas Export", employee['abteilung_datev_lodas'])
-            fields_to_map['kst_abteilungs_nr'] = department_doc.abteilungscode
-        except Exception as e:pass
-            # frappe.log_error(f"Could not fetch Abteilung fields: {str(e)}", "DATEV Export Error")
+        if department_codes is None:
+            department_codes = get_department_codes()
+        fields_to_map['kst_abteilungs_nr'] = department_codes.get(employee['abteilung_datev_lodas'], "")
 
     return fields_to_map
 
@@ -337,27 +675,56 @@ def get_az_wtl_indiv_value(employee):
         # frappe.log_error(f"Error in get_az_wtl_indiv_value: {str(e)}", "DATEV Export Error")
         return ""
 
-def map_child_to_lodas(employee, child):
-    """Create a mapping specifically for a child record - keep current logic as shown in images."""
+def map_child_to_lodas(employee, child, mapped_data=None):
+    """Create a mapping specifically for a child record - keep current logic as shown in images.
+    
+    Pass the employee's `mapped_data` to avoid remapping the employee for every child; only
+    the four kind_* fields are overlaid on it (the employee mapping itself is not modified).
+    """
     # Start with the employee's basic data
-    child_mapping = map_employee_to_lodas(employee)
+    if mapped_data is None:
+        mapped_data = map_employee_to_lodas(employee)
     
-    # Update with child specific information following Excel mapping
-    child_mapping.update({
+    # Overlay child specific information following Excel mapping
+    child_fields = {
         'kind_nr': child.get('kind_nummer', ""),                                   # Child number
         'kind_nachname': child.get('familienname_personaldaten_kinderdaten_allgemeine_angaben', ""),  # Child last name
         'kind_vorname': child.get('vorname_personaldaten_kinderdaten_allgemeine_angaben', ""),        # Child first name
         'kind_geburtsdatum': format_date(child.get('geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben')),  # Child birth date
-    })
+    }
     
-    return child_mapping
+    return ChainMap(child_fields, mapped_data)
 
-def validate_employee_data(employees_by_company):
+def validate_employee_data(employees_by_company, settings=None):
     """Validate that essential employee data is complete for LODAS export."""
+    validation_errors = get_employee_validation_errors(employees_by_company, settings)
+    if validation_errors:
+        throw_employee_validation_errors(validation_errors)
+
+def get_employee_validation_errors(employees_by_company, settings=None):
+    """Get the validation errors of the employees, e.g. to collect them over the chunks of a streamed export.
+    
+    Values longer than their LODAS column are errors, they are not cut. With `settings`
+    columns left empty by the restrictions or not in the selected records are not checked.
+    """
     validation_errors = []
+    length_limits = get_length_limits(settings)
+    department_codes = None
     
     for company, employees in employees_by_company.items():
         for employee in employees:
+            for limit in length_limits:
+                if limit.column[0] == 11:
+                    continue
+                value = employee.get(limit.source)
+                if limit.field == 'beschaeft_nr' and value:
+                    if department_codes is None:
+                        department_codes = get_department_codes()
+                    value = department_codes.get(value)
+                error = get_length_error(limit, value)
+                if error:
+                    validation_errors.append(f"Employee {employee.get('name', 'Unknown')}: {error}")
+            
             # Check for essential fields (add more as needed)
             if not employee.get('last_name'):
                 validation_errors.append(f"Employee {employee.get('name', 'Unknown')}: Missing last name")
@@ -388,7 +755,35 @@ def validate_employee_data(employees_by_company):
                         
                     if not child.get('geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben'):
                         validation_errors.append(f"Employee {employee.get('name', 'Unknown')}: Child {i+1} missing birth date")
+                    
+                    for limit in length_limits:
+                        error = limit.column[0] == 11 and get_length_error(limit, child.get(limit.source))
+                        if error:
+                            validation_errors.append(f"Employee {employee.get('name', 'Unknown')}: Child {i+1} {error}")
     
+    return validation_errors
+
+def get_length_limits(settings=None):
+    """The length limits of the columns written under the restrictions and record types of `settings`."""
+    if settings is None:
+        return LENGTH_LIMITS
+    
+    # Imported here, export_context imports this module
+    from sut_app_datev_export.sut_app_datev_export.utils.export_context import get_export_context
+    context = get_export_context(settings)
+    return tuple(
+        limit for limit in LENGTH_LIMITS
+        if limit.column[0] in context.record_types and limit.column not in context.suppressed_columns
+    )
+
+def get_length_error(limit, value):
+    """Describe a value longer than its LODAS column, None if it fits."""
+    length = len(clean_value(value))
+    if length > limit.max_length:
+        return f"{limit.source} has {length} characters, {limit.field} allows {limit.max_length}"
+
+def throw_employee_validation_errors(validation_errors):
+    """Stop the export with the first validation errors."""
     if validation_errors:
         error_message = "\n".join(validation_errors)
         # frappe.log_error(f"Employee data validation errors:\n{error_message}", 
@@ -399,4 +794,4 @@ def validate_employee_data(employees_by_company):
         if len(validation_errors) > 5:
             user_message += "\n..."
         
-        frappe.throw(_("Some employees have incomplete data:\n{0}\n\nSee error log for details.").format(user_message))
\ No newline at end of file
+        frappe.throw(_("Some employees have incomplete or invalid data:\n{0}\n\nSee error log for details.").format(user_message))
\ No newline at end of file
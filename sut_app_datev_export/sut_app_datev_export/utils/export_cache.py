@@ -0,0 +1,63 @@
+import frappe
+
+# DocTypes whose schema the export depends on
+SCHEMA_DOCTYPES = ('Employee', 'Personalerfassungsbogen', 'Kinder Tabelle')
+
+# Redis key holding the current schema version; bumping it invalidates every worker
+SCHEMA_VERSION_CACHE_KEY = 'sut_datev_export_schema_version'
+
+# Per-process cache: {site: {'version': ..., 'values': {key: value}}}
+_schema_cache = {}
+
+# Redis key holding the Abteilung name -> abteilungscode lookup
+DEPARTMENT_CODES_CACHE_KEY = 'sut_datev_export_department_codes'
+
+def get_schema_value(key, generator):
+    """Get a schema-derived value, computing it only once per worker and schema version."""
+    values = _get_site_schema_cache()
+    if key not in values:
+        values[key] = generator()
+    return values[key]
+
+def doctype_exists(doctype):
+    """Check whether a DocType exists, cached per worker."""
+    return get_schema_value(('doctype_exists', doctype), lambda: bool(frappe.db.exists('DocType', doctype)))
+
+def get_table_columns(doctype):
+    """Get the database columns of a DocType as a frozenset, cached per worker."""
+    return get_schema_value(('table_columns', doctype), lambda: frozenset(frappe.db.get_table_columns(doctype)))
+
+def clear_schema_cache():
+    """Invalidate the schema cache in this and all other workers (used as after_migrate hook)."""
+    _schema_cache.pop(frappe.local.site, None)
+    frappe.cache.set_value(SCHEMA_VERSION_CACHE_KEY, frappe.generate_hash(length=12))
+
+def clear_schema_cache_on_change(doc, method=None):
+    """Invalidate the schema cache when a relevant DocType or Custom Field is saved or deleted."""
+    doctype = doc.dt if doc.doctype == 'Custom Field' else doc.name
+    if doctype in SCHEMA_DOCTYPES:
+        clear_schema_cache()
+
+def get_department_codes():
+    """Get a dict of Abteilung name -> abteilungscode, loaded with one query and shared via Redis."""
+    return frappe.cache.get_value(DEPARTMENT_CODES_CACHE_KEY, _load_department_codes)
+
+def clear_department_codes(doc=None, method=None, *args):
+    """Invalidate the department code lookup (doc_event on the Abteilung DocType)."""
+    frappe.cache.delete_value(DEPARTMENT_CODES_CACHE_KEY)
+
+def _load_department_codes():
+    """Load all department codes in one query."""
+    departments = frappe.get_all(
+        'Abteilung fuer DATEV Lodas Export',
+        fields=['name', 'abteilungscode']
+    )
+    return {department.name: department.abteilungscode for department in departments}
+
+def _get_site_schema_cache():
+    """Get the value dict for the current site, resetting it if the schema version changed."""
+    version = frappe.cache.get_value(SCHEMA_VERSION_CACHE_KEY)
+    site_cache = _schema_cache.get(frappe.local.site)
+    if site_cache is None or site_cache['version'] != version:
+        site_cache = _schema_cache[frappe.local.site] = {'version': version, 'values': {}}
+    return site_cache['values']
@@ -0,0 +1,106 @@
+from collections import namedtuple
+from types import MappingProxyType
+
+import frappe
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import DEFAULT_EXPORT_CHUNK_SIZE
+from sut_app_datev_export.sut_app_datev_export.utils.export_restrictions import compile_suppressed_columns
+from sut_app_datev_export.sut_app_datev_export.utils.record_spec import ALL_RECORD_TYPES, parse_record_types
+
+# Redis key holding the export context of the saved settings
+EXPORT_CONTEXT_CACHE_KEY = 'sut_datev_export_context'
+
+EXPORT_CONTEXT_FIELDS = (
+    'consultant_number',
+    'client_numbers',           # read-only mapping company -> client number
+    'restricted_fields',        # frozenset of the LODAS fields with no_export set
+    'suppressed_columns',       # frozenset of the (record number, column index) positions left empty
+    'record_types',             # frozenset of the record numbers written, all by default
+    'export_email',
+    'delta_export',
+    'export_chunk_size',        # employees per chunk of the streamed export, 0 = all at once
+    'parallel_export',
+    'parallel_export_workers',
+    'query_accounting',
+    'query_warning_threshold'
+)
+
+class ExportContext(namedtuple('ExportContext', EXPORT_CONTEXT_FIELDS)):
+    """Immutable values derived from the DATEV Export SUT Settings for one export.
+
+    Built once per settings version (see get_export_context) instead of rebuilding the
+    client number mapping and the restriction lookup per file or per employee.
+    """
+    __slots__ = ()
+
+    def __reduce__(self):
+        # The mapping proxy can't be pickled (Redis cache, worker processes); rebuild it from a dict
+        values = self._asdict()
+        values['client_numbers'] = dict(self.client_numbers)
+        return (_restore_export_context, (values,))
+
+def _restore_export_context(values):
+    values['client_numbers'] = MappingProxyType(values['client_numbers'])
+    return ExportContext(**values)
+
+def get_export_context(settings=None):
+    """Get the export context.
+
+    Without `settings` the context of the saved settings is taken from the cache, so it is
+    derived only once per settings version. An ExportContext is returned as is; other
+    settings (a document or a dict, e.g. in tests and benchmarks) are converted uncached.
+    """
+    if isinstance(settings, ExportContext):
+        return settings
+    if settings is not None:
+        return build_export_context(settings)
+    return frappe.cache.get_value(EXPORT_CONTEXT_CACHE_KEY, _load_export_context)
+
+def build_export_context(settings):
+    """Derive the export context from a settings document or dict."""
+    client_numbers = {}
+    for mapping in settings.get('company_client_mapping') or []:
+        client_numbers[mapping.get('company')] = mapping.get('client_number')
+
+    # Later rows for the same field win, like the restriction dict did before
+    restrictions = {}
+    for restriction in settings.get('mehrfach_export_unterdruecken') or []:
+        restrictions[restriction.get('field_name')] = restriction.get('no_export')
+
+    restricted_fields = frozenset(field for field, no_export in restrictions.items() if no_export)
+
+    # Not yet saved on existing sites: use the default of the field
+    export_chunk_size = settings.get('export_chunk_size')
+    if export_chunk_size is None:
+        export_chunk_size = DEFAULT_EXPORT_CHUNK_SIZE
+
+    # Invalid selections are rejected when the settings are saved
+    try:
+        record_types = parse_record_types(settings.get('export_record_types'))
+    except ValueError:
+        record_types = ALL_RECORD_TYPES
+
+    return ExportContext(
+        consultant_number=settings.get('consultant_number'),
+        client_numbers=MappingProxyType(client_numbers),
+        restricted_fields=restricted_fields,
+        suppressed_columns=compile_suppressed_columns(restricted_fields),
+        record_types=record_types,
+        export_email=settings.get('export_email'),
+        delta_export=settings.get('delta_export'),
+        export_chunk_size=int(export_chunk_size),
+        parallel_export=settings.get('parallel_export'),
+        parallel_export_workers=settings.get('parallel_export_workers'),
+        query_accounting=settings.get('query_accounting'),
+        query_warning_threshold=settings.get('query_warning_threshold')
+    )
+
+def with_record_types(context, record_types):
+    """The export context with another selection of record types, e.g. for one export run."""
+    return context._replace(record_types=parse_record_types(record_types))
+
+def clear_export_context(doc=None, method=None, *args):
+    """Invalidate the cached export context in all workers (settings on_update, after_migrate)."""
+    frappe.cache.delete_value(EXPORT_CONTEXT_CACHE_KEY)
+
+def _load_export_context():
+    return build_export_context(frappe.get_single('DATEV Export SUT Settings'))
@@ -0,0 +1,169 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import frappe
+
+# Timed stages of an export, in order. Each stage is stored in the field
+# `<stage>_seconds` of the DATEV Export Run.
+EXPORT_STAGES = (
+    'fetch',         # get_employees_for_export / prepare_employee_dict, delta snapshots
+    'validate',      # company mapping and validate_employee_data
+    'restrictions',  # process_export_restrictions
+    'generate',      # generate_lodas_files / generate_single_employee_file
+    'email',         # send_export_email
+    'writeback'      # export snapshots and write_back_exported_employees
+)
+
+class ExportTimer:
+    """Lightweight wall clock timers for the stages of one export.
+
+    Usage:
+        timer = ExportTimer()
+        with timer.stage('fetch'):
+            employees_by_company = get_employees_for_export()
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.timings = dict.fromkeys(EXPORT_STAGES, 0.0)
+        self.queries = None
+        self._nested = []  # seconds spent in nested stages, per active stage
+
+    def count_queries(self, warning_threshold=None):
+        """Start the query accounting (see QueryAccounting) until stop() is called."""
+        self.queries = QueryAccounting(warning_threshold)
+        self.queries.start()
+
+    def stop(self):
+        """Stop the query accounting, so later queries (e.g. recording the run) are not counted."""
+        if self.queries:
+            self.queries.stop()
+
+    @contextmanager
+    def stage(self, name):
+        """Add the time spent inside the block to stage `name` (also if it raises).
+
+        Stages can be nested, e.g. fetching the next chunk while generating the files of the
+        streamed export; the time of a nested stage only counts for the nested stage.
+        """
+        start = time.perf_counter()
+        self._nested.append(0.0)
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            nested = self._nested.pop()
+            self.timings[name] = self.timings.get(name, 0.0) + seconds - nested
+            if self._nested:
+                self._nested[-1] += seconds
+
+    def total(self):
+        """Seconds since the timer was created."""
+        return time.perf_counter() - self.start
+
+    def as_dict(self, employee_count=None):
+        """Stage timings and total in seconds, rounded for the response."""
+        timings = {stage: round(seconds, 3) for stage, seconds in self.timings.items()}
+        timings['total'] = round(self.total(), 3)
+        if self.queries:
+            timings['queries'] = self.queries.report(employee_count)
+        return timings
+
+    def as_run_fields(self, employee_count=None):
+        """Timings (and query accounting, if active) as values of the DATEV Export Run fields."""
+        fields = {f"{stage}_seconds": seconds for stage, seconds in self.timings.items()}
+        fields['duration'] = self.total()
+
+        if self.queries:
+            report = self.queries.report(employee_count)
+            fields.update({
+                'query_count': report['count'],
+                'db_seconds': report['seconds'],
+                'queries_per_employee': report['per_employee'],
+                'query_report': json.dumps(report['call_sites'], indent=1)
+            })
+        return fields
+
+# Modules of this app; the first frame from one of them is the call site of a query
+APP_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class QueryAccounting:
+    """Opt-in accounting of frappe.db.sql calls during an export.
+
+    While active, frappe.db.sql of the current connection is wrapped to count the queries
+    and their time, grouped by call site: the innermost function of this app that issued
+    the query, directly or through frappe (get_all, get_value, bulk_insert, ...).
+    """
+
+    def __init__(self, warning_threshold=None):
+        self.warning_threshold = warning_threshold
+        self.call_sites = {}  # call site -> [count, seconds]
+        self._db = None
+        self._sql = None
+
+    def start(self):
+        if self._db is not None:
+            return
+        self._db = frappe.db
+        self._sql = self._db.sql
+        self._db.sql = self._counted_sql
+
+    def stop(self):
+        if self._db is None:
+            return
+        # Remove the instance attribute, so the class method is used again
+        del self._db.sql
+        self._db = None
+        self._sql = None
+
+    def _counted_sql(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._sql(*args, **kwargs)
+        finally:
+            entry = self.call_sites.setdefault(get_call_site(), [0, 0.0])
+            entry[0] += 1
+            entry[1] += time.perf_counter() - start
+
+    def report(self, employee_count=None):
+        """Totals, queries per employee and the call sites, most queries first."""
+        count = sum(entry[0] for entry in self.call_sites.values())
+        return {
+            'count': count,
+            'seconds': round(sum(entry[1] for entry in self.call_sites.values()), 3),
+            'per_employee': round(count / employee_count, 2) if employee_count else 0,
+            'call_sites': {
+                site: {'count': entry[0], 'seconds': round(entry[1], 3)}
+                for site, entry in sorted(self.call_sites.items(), key=lambda item: -item[1][0])
+            }
+        }
+
+    def check_threshold(self, employee_count):
+        """Log a warning if the queries per employee exceed the threshold; returns the warning."""
+        if not self.warning_threshold or not employee_count:
+            return None
+
+        report = self.report(employee_count)
+        if report['per_employee'] <= self.warning_threshold:
+            return None
+
+        top = ", ".join(f"{site}: {entry['count']}" for site, entry in list(report['call_sites'].items())[:5])
+        warning = (f"DATEV export issued {report['count']} queries for {employee_count} employees "
+                   f"({report['per_employee']} per employee, threshold {self.warning_threshold}). "
+                   f"Top call sites: {top}")
+        frappe.log_error(title="DATEV Export Query Warning", message=warning)
+        return warning
+
+def get_call_site():
+    """Name (module.function) of the innermost function of this app on the stack."""
+    frame = sys._getframe(2)
+    while frame:
+        filename = frame.f_code.co_filename
+        if filename.startswith(APP_PATH) and filename != __file__:
+            module = os.path.splitext(os.path.basename(filename))[0]
+            return f"{module}.{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "other"
@@ -0,0 +1,129 @@
+from collections import namedtuple
+from functools import lru_cache
+
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import (
+    EMPLOYEE_FIELDS,
+    LODAS_FIELD_MAPPING,
+    PERSONALERFASSUNGSBOGEN_FIELDS,
+    PERSONALERFASSUNGSBOGEN_WAGE_FIELDS
+)
+from sut_app_datev_export.sut_app_datev_export.utils.export_restrictions import EXTRA_SOURCE_FIELDS
+from sut_app_datev_export.sut_app_datev_export.utils.record_spec import ALL_RECORD_TYPES, RECORD_SPECS, RECORDS_BY_NUMBER
+
+# Fields read by the festbezuege records (12) directly from the employee, not from the mapped data
+FESTBEZUEGE_FIELDS = (
+    'custom_lohnart_gg', 'custom_lohnart_p1', 'custom_lohnart_p2', 'custom_lohnart_p3',
+    'custom_lohnart_p4', 'custom_lohnart_z1', 'custom_lohnart_z2'
+) + PERSONALERFASSUNGSBOGEN_WAGE_FIELDS
+
+# Fields always fetched, whatever the restrictions: field -> why
+REQUIRED_FIELDS = {
+    'name': "identifies the employee",
+    'company': "selects the company file",
+    'employee_number': "personnel number (pnr) of every record",
+    'last_name': "checked before the export",
+    'first_name': "checked before the export",
+    'date_of_birth': "checked before the export",
+    'gender': "checked before the export",
+    'date_of_joining': "checked before the export",
+    'custom_summe_wochenarbeitszeit': "compared with the stored working time and written back",
+    'custom_stored_value_of_summe_wochenarbeitszeit': "compared with the working time",
+}
+
+# Fields read directly from the employee by a record type, only fetched if it is selected
+RECORD_TYPE_FIELDS = {
+    12: dict.fromkeys(FESTBEZUEGE_FIELDS, "read by the festbezuege records (12)"),
+}
+
+# A compiled projection: the fields to fetch per DocType, the (field, reason) pairs left out,
+# the part of LODAS_FIELD_MAPPING to map and whether the children (record 11) are fetched
+ExportPlan = namedtuple(
+    'ExportPlan',
+    ['employee_fields', 'personalerfassungsbogen_fields', 'pruned_fields', 'lodas_mapping', 'children']
+)
+
+def build_source_columns():
+    """Map every ERPNext source field to the (record number, column index) positions it fills."""
+    columns_by_key = {}
+    for record in RECORD_SPECS:
+        for index, field in enumerate(record.fields):
+            if field.value is None:
+                columns_by_key.setdefault(field.source or field.name, set()).add((record.number, index))
+
+    source_columns = {}
+    for key, source in [(key, source) for key, source, _conversion in LODAS_FIELD_MAPPING] + list(EXTRA_SOURCE_FIELDS):
+        source_columns.setdefault(source, set()).update(columns_by_key.get(key, ()))
+    return {source: frozenset(columns) for source, columns in source_columns.items()}
+
+SOURCE_COLUMNS = build_source_columns()
+
+def get_field_decision(field, suppressed_columns, record_types=ALL_RECORD_TYPES):
+    """Return (fetch, reason) for one source field under the suppressed columns and selected record types."""
+    if field in REQUIRED_FIELDS:
+        return True, REQUIRED_FIELDS[field]
+
+    for number, fields in RECORD_TYPE_FIELDS.items():
+        if field in fields:
+            if number in record_types:
+                return True, fields[field]
+            return False, f"record {number} not selected"
+
+    columns = SOURCE_COLUMNS.get(field, frozenset())
+    if not columns:
+        return False, "not written to any record"
+
+    selected = sorted(column for column in columns if column[0] in record_types)
+    if not selected:
+        return False, "record not selected: " + ", ".join(describe_column(column) for column in sorted(columns))
+
+    exported = [column for column in selected if column not in suppressed_columns]
+    if not exported:
+        return False, "suppressed: " + ", ".join(describe_column(column) for column in selected)
+    return True, ", ".join(describe_column(column) for column in exported)
+
+def describe_column(column):
+    number, index = column
+    return f"{number}:{RECORDS_BY_NUMBER[number].fields[index].name}"
+
+# The fields of each DocType the export can fetch, in fetch order
+PROJECTION_FIELDS = (
+    ('Employee', EMPLOYEE_FIELDS),
+    ('Personalerfassungsbogen', PERSONALERFASSUNGSBOGEN_FIELDS + PERSONALERFASSUNGSBOGEN_WAGE_FIELDS),
+)
+
+@lru_cache(maxsize=16)
+def get_export_plan(suppressed_columns=frozenset(), record_types=ALL_RECORD_TYPES):
+    """Compile the minimal Employee and Personalerfassungsbogen projection of an export.
+
+    A field is fetched if it is required outside of the record columns (see REQUIRED_FIELDS),
+    read by a selected record type, or fills at least one column of the selected `record_types`
+    that is not in `suppressed_columns`; fields whose values can never reach the file are left
+    out, and only their mapping is kept. Compiled once per restrictions and selection.
+    """
+    rows = explain_export_plan(suppressed_columns, record_types)
+    fetched = {row['field'] for row in rows if row['fetched']}
+    return ExportPlan(
+        employee_fields=tuple(row['field'] for row in rows if row['doctype'] == 'Employee' and row['fetched']),
+        personalerfassungsbogen_fields=tuple(
+            row['field'] for row in rows if row['doctype'] == 'Personalerfassungsbogen' and row['fetched']
+        ),
+        pruned_fields=tuple(dict.fromkeys((row['field'], row['reason']) for row in rows if not row['fetched'])),
+        lodas_mapping=tuple(
+            (key, source, conversion) for key, source, conversion in LODAS_FIELD_MAPPING
+            if source in fetched and SOURCE_COLUMNS.get(source)
+        ),
+        children=11 in record_types
+    )
+
+def explain_export_plan(suppressed_columns=frozenset(), record_types=ALL_RECORD_TYPES):
+    """List every field of the export projection with whether it is fetched and why.
+
+    Returns one dict per DocType field: doctype, field, fetched and reason (the columns it
+    fills, why it is required, or why it is pruned).
+    """
+    rows = []
+    for doctype, fields in PROJECTION_FIELDS:
+        for field in fields:
+            fetched, reason = get_field_decision(field, suppressed_columns, record_types)
+            rows.append({'doctype': doctype, 'field': field, 'fetched': fetched, 'reason': reason})
+    return rows
@@ -1,13 +1,112 @@
 import frappe
+from collections import ChainMap
 from frappe import _
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import LODAS_FIELD_MAPPING
+from sut_app_datev_export.sut_app_datev_export.utils.record_spec import MAIN_RECORD_NUMBERS, RECORDS_BY_NUMBER
+
+# ERPNext fields mapped to a LODAS field outside of LODAS_FIELD_MAPPING (see map_employee_to_lodas)
+EXTRA_SOURCE_FIELDS = (
+    ('kst_abteilungs_nr', 'abteilung_datev_lodas'),
+    ('az_wtl_indiv', 'custom_summe_wochenarbeitszeit'),
+)
+
+# Records whose columns can be suppressed: the main records and the festbezuege (12)
+RESTRICTABLE_RECORD_NUMBERS = MAIN_RECORD_NUMBERS + (12,)
+
+# Columns identifying the employee or the salary component, never suppressed
+IDENTIFYING_FIELDS = ('pnr', 'festbez_id')
+
+# Employee fields read directly by the festbezuege records (12) -> LODAS column they fill.
+# Restricting one only leaves its own value out (see file_builder.generate_festbezuege_records):
+# a restricted amount is exported as 0, a restricted wage flag no longer decides the basic salary.
+FESTBEZUEGE_SOURCE_FIELDS = {
+    'custom_lohnart_gg': 'lohnart_nr',
+    'custom_lohnart_p1': 'lohnart_nr', 'custom_lohnart_p2': 'lohnart_nr',
+    'custom_lohnart_p3': 'lohnart_nr', 'custom_lohnart_p4': 'lohnart_nr',
+    'custom_lohnart_z1': 'lohnart_nr', 'custom_lohnart_z2': 'lohnart_nr',
+    'custom_gehalt_des_grundvertrags': 'betrag',
+    'custom_gehalt_projekt_1': 'betrag', 'custom_gehalt_projekt_2': 'betrag',
+    'custom_gehalt_projekt_3': 'betrag', 'custom_gehalt_projekt_4': 'betrag',
+    'custom_zulage_zulage_1': 'betrag', 'custom_zulage_zulage_2': 'betrag',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt': 'betrag',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_1': 'betrag',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_2': 'betrag',
+    'custom_ist_zusätzliche_vergütung_zum_grundgehalt_3': 'betrag',
+}
+
+def build_restrictable_columns():
+    """Map every field name accepted in `mehrfach_export_unterdruecken` to the columns it suppresses.
+
+    A field name is the LODAS column name of a main record (1-10) or of the festbezuege (12),
+    the key of the mapped employee data feeding the column, or the ERPNext field it is mapped
+    from. Columns are (record number, column index) positions. The personnel number and the
+    festbezug id identify the record and fixed values never change, so none can be suppressed.
+    The Employee fields of the festbezuege suppress no whole column, see FESTBEZUEGE_SOURCE_FIELDS.
+    """
+    columns_by_key = {}
+    restrictable = {}
+    for number in RESTRICTABLE_RECORD_NUMBERS:
+        for index, field in enumerate(RECORDS_BY_NUMBER[number].fields):
+            if field.name in IDENTIFYING_FIELDS or field.value is not None:
+                continue
+            key = field.source or field.name
+            columns_by_key.setdefault(key, set()).add((number, index))
+            restrictable.setdefault(field.name, set()).add((number, index))
+
+    for key, columns in columns_by_key.items():
+        restrictable.setdefault(key, set()).update(columns)
+
+    # ERPNext fields suppress the columns of the LODAS field they are mapped to
+    source_fields = [(key, source) for key, source, _conversion in LODAS_FIELD_MAPPING] + list(EXTRA_SOURCE_FIELDS)
+    for key, source in source_fields:
+        if key in columns_by_key:
+            restrictable.setdefault(source, set()).update(columns_by_key[key])
+
+    return {name: frozenset(columns) for name, columns in restrictable.items()}
+
+RESTRICTABLE_COLUMNS = build_restrictable_columns()
+
+def compile_suppressed_columns(restricted_fields):
+    """Compile restricted field names into the frozenset of suppressed (record number, column index) positions.
+
+    Unknown names are ignored here; they are rejected when the settings are saved.
+    """
+    suppressed = set()
+    for field_name in restricted_fields:
+        suppressed.update(RESTRICTABLE_COLUMNS.get(field_name, ()))
+    return frozenset(suppressed)
+
+def is_restrictable_field(field_name):
+    """True if `field_name` names a LODAS column or a field exported to one (see build_restrictable_columns)."""
+    return field_name in RESTRICTABLE_COLUMNS or field_name in FESTBEZUEGE_SOURCE_FIELDS
+
+def mask_festbezuege_fields(employee, restricted_fields):
+    """The employee with its restricted festbezuege fields read as empty, without changing it."""
+    restricted = [field for field in FESTBEZUEGE_SOURCE_FIELDS if field in restricted_fields]
+    if not restricted:
+        return employee
+    return ChainMap(dict.fromkeys(restricted, ""), employee)
+
+def validate_export_restrictions(restrictions):
+    """Throw if a row of `mehrfach_export_unterdruecken` names no LODAS field of the record spec."""
+    unknown = [
+        restriction.field_name for restriction in restrictions
+        if restriction.field_name and not is_restrictable_field(restriction.field_name)
+    ]
+    if unknown:
+        frappe.throw(_(
+            "Unknown fields in Mehrfach Export unterdruecken: {0}. "
+            "Use the LODAS field name (e.g. st_klasse) or the Employee field it is exported from (e.g. iban)."
+        ).format(", ".join(unknown)))
 
 def get_export_restrictions_dict(settings):
-    """Get export restrictions as a dictionary for quick lookup."""
+    """Get export restrictions as a dictionary for quick lookup (restricted fields only, see export_context)."""
+    # Imported here, export_context compiles the restrictions with this module
+    from sut_app_datev_export.sut_app_datev_export.utils.export_context import get_export_context
+    
     restrictions = {}
     try:
-        if hasattr(settings, 'mehrfach_export_unterdruecken'):
-            for restriction in settings.mehrfach_export_unterdruecken:
-                restrictions[restriction.field_name] = restriction.no_export
+        restrictions = dict.fromkeys(get_export_context(settings).restricted_fields, 1)
     except Exception as e:
         frappe.log_error(f"Error getting export restrictions: {str(e)}", "DATEV Export Error")
     
@@ -15,11 +114,13 @@ def get_export_restrictions_dict(settings):
 
 def should_export_field_value(field_name, field_value, settings):
     """Check if a specific field value should be exported based on restrictions."""
+    from sut_app_datev_export.sut_app_datev_export.utils.export_context import get_export_context
+    
     try:
-        restrictions = get_export_restrictions_dict(settings)
+        restricted_fields = get_export_context(settings).restricted_fields
         
         # If field is in restrictions and no_export is True, return empty
-        if field_name in restrictions and restrictions[field_name]:
+        if field_name in restricted_fields:
             return ""
         
         # Otherwise return the original value
@@ -31,11 +132,13 @@ def should_export_field_value(field_name, field_value, settings):
 
 def apply_field_restrictions(mapped_data, settings):
     """Apply export restrictions to all fields in mapped data."""
+    from sut_app_datev_export.sut_app_datev_export.utils.export_context import get_export_context
+    
     try:
-        restrictions = get_export_restrictions_dict(settings)
+        restricted_fields = get_export_context(settings).restricted_fields
         
-        for field_name, no_export in restrictions.items():
-            if no_export and field_name in mapped_data:
+        for field_name in restricted_fields:
+            if field_name in mapped_data:
                 mapped_data[field_name] = ""
                 
     except Exception as e:
@@ -0,0 +1,128 @@
+import hashlib
+import json
+from itertools import islice
+
+import frappe
+from frappe.utils import now
+
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import chunked, IN_CLAUSE_CHUNK_SIZE
+from sut_app_datev_export.sut_app_datev_export.utils.record_spec import (
+    RECORDS_BY_NUMBER,
+    RECORD_FORMATTERS,
+    join_record
+)
+
+SNAPSHOT_DOCTYPE = 'DATEV Export Snapshot'
+
+# Columns compared per record: (column index, snapshot key). The personnel number in the
+# first column identifies the employee and fixed values never change, so both are always sent.
+DELTA_COLUMNS = {
+    number: tuple(
+        (index, f"{number}.{field.name}")
+        for index, field in enumerate(record.fields)
+        if index and field.value is None
+    )
+    for number, record in RECORDS_BY_NUMBER.items()
+}
+
+def hash_value(value):
+    """Short, stable hash of an exported value."""
+    return hashlib.blake2b(value.encode(), digest_size=8).hexdigest()
+
+def serialize_main_record(record_number, mapped_data, snapshot, previous=None, formatters=RECORD_FORMATTERS):
+    """Serialize a record 1-10 and store the hash of each column in `snapshot`.
+
+    With the `previous` snapshot of the employee (delta export), unchanged columns are left
+    empty and the record is skipped if no column is left to send. `formatters` are the
+    column formatters to use, e.g. with restricted columns suppressed (see get_record_formatters).
+    """
+    values = formatters[record_number](mapped_data)
+    send = previous is None
+
+    for index, key in DELTA_COLUMNS[record_number]:
+        digest = hash_value(values[index])
+        snapshot[key] = digest
+        if previous is not None:
+            if previous.get(key) == digest:
+                values[index] = ""
+            elif values[index]:
+                send = True
+
+    return join_record(record_number, values) if send else ""
+
+def serialize_record_group(record_number, lines, snapshot, previous=None):
+    """Store the hash of all lines of a record type (children, festbezuege) in `snapshot`.
+
+    With the `previous` snapshot of the employee (delta export), the lines are left out
+    if they did not change.
+    """
+    key = str(record_number)
+    digest = hash_value(lines)
+    snapshot[key] = digest
+
+    if previous is not None and previous.get(key) == digest:
+        return ""
+    return lines
+
+def attach_export_snapshots(employees_by_company):
+    """Attach the last exported snapshot to each employee as `_datev_snapshot` (None if never exported)."""
+    employees = [employee for employees in employees_by_company.values() for employee in employees]
+    snapshots = get_export_snapshots([employee.get('name') for employee in employees])
+
+    for employee in employees:
+        employee['_datev_snapshot'] = snapshots.get(employee.get('name'))
+
+def get_export_snapshots(employee_names):
+    """Load the snapshots of the given employees, keyed by employee name."""
+    employee_names = [name for name in dict.fromkeys(employee_names) if name]
+    snapshots = {}
+
+    for names in chunked(employee_names, IN_CLAUSE_CHUNK_SIZE):
+        rows = frappe.get_all(
+            SNAPSHOT_DOCTYPE,
+            filters={'employee': ['in', names]},
+            fields=['employee', 'snapshot']
+        )
+        for row in rows:
+            snapshots[row.employee] = frappe.parse_json(row.snapshot) or {}
+
+    return snapshots
+
+def save_export_snapshots(snapshots):
+    """Replace the snapshots of the exported employees (employee name -> snapshot).
+
+    Deletes and bulk inserts per chunk without committing, so the snapshots are committed
+    together with the export writeback after a successful run.
+    """
+    timestamp = now()
+    user = frappe.session.user
+
+    for names in chunked(sorted(snapshots), IN_CLAUSE_CHUNK_SIZE):
+        frappe.db.delete(SNAPSHOT_DOCTYPE, {'employee': ['in', names]})
+        frappe.db.bulk_insert(
+            SNAPSHOT_DOCTYPE,
+            fields=['name', 'employee', 'snapshot', 'creation', 'modified', 'owner', 'modified_by'],
+            values=[
+                (name, name, json.dumps(snapshots[name], separators=(',', ':')), timestamp, timestamp, user, user)
+                for name in names
+            ]
+        )
+
+def spool_export_snapshots(f, snapshots):
+    """Append snapshots (employee name -> snapshot) to the text stream `f`, one JSON line each.
+
+    Used by the streamed export, so the snapshots need not be kept in memory until the
+    export succeeded; see save_spooled_export_snapshots.
+    """
+    for name, snapshot in snapshots.items():
+        f.write(json.dumps([name, snapshot], separators=(',', ':')))
+        f.write("\n")
+
+def save_spooled_export_snapshots(path):
+    """Save the snapshots spooled to the file `path` (see spool_export_snapshots), one chunk at a time."""
+    with open(path, encoding='utf-8') as f:
+        while True:
+            lines = list(islice(f, IN_CLAUSE_CHUNK_SIZE))
+            if not lines:
+                break
+            save_export_snapshots(dict(json.loads(line) for line in lines))
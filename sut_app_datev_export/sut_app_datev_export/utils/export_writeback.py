@@ -0,0 +1,61 @@
+import time
+
+import frappe
+
+from sut_app_datev_export.sut_app_datev_export.utils.employee_data import chunked, IN_CLAUSE_CHUNK_SIZE
+
+def write_back_exported_employees(employees, reset_flags=True, update_stored_values=True, commit=True):
+    """Write the export result back to the exported employees with chunked bulk UPDATEs.
+
+    Per chunk one statement resets `custom_for_next_export` and stores the exported
+    `custom_summe_wochenarbeitszeit` in `custom_stored_value_of_summe_wochenarbeitszeit`
+    (CASE over the employee names). All chunks run in one transaction with one commit
+    (`commit=False` leaves the transaction open, e.g. for benchmarks that roll back).
+
+    Returns the number of rows, statements and the seconds between the first UPDATE
+    and the commit, i.e. how long the row locks on `tabEmployee` were held.
+    """
+    # Sorted by name, so concurrent writers lock rows in the same order
+    values_by_name = {}
+    for employee in employees:
+        if employee.get('name'):
+            values_by_name[employee['name']] = employee.get('custom_summe_wochenarbeitszeit')
+    names = sorted(values_by_name)
+
+    stats = {'rows': len(names), 'statements': 0, 'lock_seconds': 0.0}
+    if not names or not (reset_flags or update_stored_values):
+        return stats
+
+    start = time.perf_counter()
+    for chunk in chunked(names, IN_CLAUSE_CHUNK_SIZE):
+        query, values = build_writeback_query(chunk, values_by_name, reset_flags, update_stored_values)
+        frappe.db.sql(query, values)
+        stats['statements'] += 1
+
+    if commit:
+        frappe.db.commit()
+    stats['lock_seconds'] = time.perf_counter() - start
+    return stats
+
+def build_writeback_query(names, values_by_name, reset_flags=True, update_stored_values=True):
+    """Build the UPDATE statement and its values for one chunk of employee names."""
+    assignments = []
+    values = []
+
+    if reset_flags:
+        assignments.append("`custom_for_next_export` = 0")
+
+    if update_stored_values:
+        cases = []
+        for name in names:
+            cases.append("WHEN %s THEN %s")
+            values.extend((name, values_by_name[name]))
+        assignments.append(
+            f"`custom_stored_value_of_summe_wochenarbeitszeit` = CASE `name` {' '.join(cases)} END"
+        )
+
+    placeholders = ", ".join(["%s"] * len(names))
+    values.extend(names)
+
+    query = f"UPDATE `tabEmployee` SET {', '.join(assignments)} WHERE `name` IN ({placeholders})"
+    return query, values
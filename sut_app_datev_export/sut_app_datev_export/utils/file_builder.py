@@ -1,47 +1,91 @@
 import frappe
 from frappe.utils import now_datetime, format_datetime  # Add these imports for timezone handling
+import io
+import multiprocessing
 import os
 import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from sut_app_datev_export.sut_app_datev_export.utils.employee_data import map_employee_to_lodas, map_child_to_lodas
+from sut_app_datev_export.sut_app_datev_export.utils.export_cache import get_department_codes
+from sut_app_datev_export.sut_app_datev_export.utils.export_context import get_export_context
+from sut_app_datev_export.sut_app_datev_export.utils.export_plan import get_export_plan
+from sut_app_datev_export.sut_app_datev_export.utils.export_restrictions import mask_festbezuege_fields
+from sut_app_datev_export.sut_app_datev_export.utils.export_snapshot import (
+    serialize_main_record,
+    serialize_record_group,
+    spool_export_snapshots
+)
+from sut_app_datev_export.sut_app_datev_export.utils.record_spec import (
+    ALL_RECORD_TYPES,
+    MAIN_RECORD_NUMBERS,
+    RECORD_SERIALIZERS,
+    clean_value,
+    format_field,
+    format_numeric_value,
+    get_record_description,
+    get_record_formatters,
+    get_record_serializers
+)
 from frappe import _
 
-def generate_lodas_files(employees_by_company, settings):
-    """Generate LODAS files for each company - FIXED: Use correct timezone for filenames."""
-    consultant_number = settings.consultant_number
+# Mapped keys of the disability record (6), in column order after the personnel number
+DISABILITY_FIELDS = (
+    "sba_sb_ausweis_bis",
+    "sba_unter_18_std_aa_kz",
+    "sba_kz_dienststelle",
+    "sba_az_geschaeftsstelle",
+    "sba_ort_dienstelle",
+    "sba_sb_ausweis_ab"
+)
+
+# Buffer size of the LODAS file stream
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+def generate_lodas_files(employees_by_company, settings, progress_callback=None):
+    """Generate LODAS files for each company - FIXED: Use correct timezone for filenames.
+    
+    `progress_callback(company, index)` is called after each written file (index starting at 1).
+    Each file also reports its size and the seconds until it was written (in parallel mode
+    including the wait for its worker).
+    """
+    # Consultant number, client number mapping and restrictions, derived once (see export_context)
+    context = get_export_context(settings)
+    consultant_number = context.consultant_number
     
     # Store file paths for later email attachment
     file_paths = []
     
     # Get company to client number mapping
-    client_numbers = {}
-    for mapping in settings.company_client_mapping:
-        client_numbers[mapping.company] = mapping.client_number
+    client_numbers = context.client_numbers
+    
+    # Skip companies without a client number mapping
+    companies = [company for company in employees_by_company if company in client_numbers]
+    
+    # Opt-in: serialize the companies in worker processes, in the same order
+    workers = get_parallel_worker_count(context, len(companies))
+    if workers > 1:
+        stammdaten_by_company = serialize_companies_in_parallel(
+            [employees_by_company[company] for company in companies], context, workers
+        )
     
     # Generate file for each company
-    for company, employees in employees_by_company.items():
-        # Skip if no mapping exists
-        if company not in client_numbers:
-            # frappe.log_error(f"No client number mapping for company: {company}", 
-            #                "DATEV Export Error")
-            continue
-        
+    for company in companies:
+        start = time.perf_counter()
+        employees = employees_by_company[company]
         client_number = client_numbers[company]
         
-        # Generate file content - NEW: Pass settings for dynamic restrictions
-        content = generate_lodas_file_header(consultant_number, client_number)
-        content += generate_record_description()
-        content += generate_employee_data(employees, settings)
-        
         # Create temporary file with correct timezone timestamp
-        # FIXED: Use now_datetime() and format with correct timezone
-        current_time = now_datetime()
-        timestamp = format_datetime(current_time, "yyyyMMddHHmmss")
-        filename = f"DATEV_LODAS_{company.replace(' ', '_')}_{timestamp}.txt"
-        temp_path = os.path.join(tempfile.gettempdir(), filename)
+        filename, temp_path = get_lodas_file_path(company)
         
-        with open(temp_path, 'w', encoding='cp1252', newline='\r\n') as f:
-            f.write(content)
+        if workers > 1:
+            # Write the content serialized by the worker
+            stammdaten, snapshots = next(stammdaten_by_company)
+            write_lodas_file_content(temp_path, consultant_number, client_number, stammdaten, context.record_types)
+        else:
+            # Stream the file content - NEW: Pass settings for dynamic restrictions
+            snapshots = write_lodas_file(temp_path, consultant_number, client_number, employees, context)
         
         # Count total employees including those with child records
         total_employees = len(employees)
@@ -51,12 +95,165 @@ def generate_lodas_files(employees_by_company, settings):
             'path': temp_path,
             'filename': filename,
             'company': company,
+            'client_number': client_number,
             'employee_count': total_employees,
-            'children_count': children_count
+            'children_count': children_count,
+            'file_size': os.path.getsize(temp_path),
+            'duration': time.perf_counter() - start,
+            'snapshots': snapshots
         })
+        
+        if progress_callback:
+            progress_callback(company, len(file_paths))
     
     return file_paths
 
+def generate_lodas_files_streamed(company_chunks, settings, progress_callback=None, snapshot_file=None):
+    """Generate the LODAS file of each company from chunks of employees, one chunk at a time.
+    
+    `company_chunks` yields (company, chunks), `chunks` being an iterable of employee lists
+    (see employee_data.iter_employees_for_export). Each chunk is serialized, written and
+    released before the next one is fetched, so memory use is bounded by the chunk size.
+    Only the name and exported working time of each employee are kept (as `exported`, for
+    the writeback); the export snapshots are appended to the text stream `snapshot_file`
+    (see export_snapshot.spool_export_snapshots). Returns the files like generate_lodas_files.
+    If writing fails, e.g. fetching a chunk raises, the files written so far are removed.
+    """
+    context = get_export_context(settings)
+    file_paths = []
+    written_paths = []
+    
+    try:
+        for company, chunks in company_chunks:
+            # Skip companies without a client number mapping
+            client_number = context.client_numbers.get(company)
+            if client_number is None:
+                continue
+            
+            start = time.perf_counter()
+            filename, temp_path = get_lodas_file_path(company)
+            written_paths.append(temp_path)
+            employee_count = 0
+            children_count = 0
+            exported = []
+            
+            with open(temp_path, 'w', encoding='cp1252', newline='\r\n', buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(generate_lodas_file_header(context.consultant_number, client_number))
+                f.write(generate_record_description(context.record_types))
+                f.write("[Stammdaten]\n")
+                
+                for employees in chunks:
+                    snapshots = write_employee_records(f, employees, context)
+                    if snapshot_file is not None:
+                        spool_export_snapshots(snapshot_file, snapshots)
+                    
+                    employee_count += len(employees)
+                    children_count += sum(len(emp.get('children', [])) for emp in employees)
+                    exported.extend(
+                        {'name': emp.get('name'), 'custom_summe_wochenarbeitszeit': emp.get('custom_summe_wochenarbeitszeit')}
+                        for emp in employees
+                    )
+            
+            file_paths.append({
+                'path': temp_path,
+                'filename': filename,
+                'company': company,
+                'client_number': client_number,
+                'employee_count': employee_count,
+                'children_count': children_count,
+                'file_size': os.path.getsize(temp_path),
+                'duration': time.perf_counter() - start,
+                'exported': exported
+            })
+            
+            if progress_callback:
+                progress_callback(company, len(file_paths))
+    except Exception:
+        # Don't leave the files of a failed export (including the one being written) in the temp dir
+        for path in written_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    
+    return file_paths
+
+def get_lodas_file_path(company):
+    """Get the file name and temporary path of a company's LODAS file."""
+    # FIXED: Use now_datetime() and format with correct timezone
+    current_time = now_datetime()
+    timestamp = format_datetime(current_time, "yyyyMMddHHmmss")
+    filename = f"DATEV_LODAS_{company.replace(' ', '_')}_{timestamp}.txt"
+    return filename, os.path.join(tempfile.gettempdir(), filename)
+
+def write_lodas_file(path, consultant_number, client_number, employees, settings):
+    """Write a complete LODAS file, streaming each employee's records as they are serialized.
+    
+    The file is written through a buffered cp1252 stream with CRLF line endings, so memory
+    use does not grow with the number of employees. Returns the export snapshots (see
+    write_employee_data).
+    """
+    context = get_export_context(settings)
+    with open(path, 'w', encoding='cp1252', newline='\r\n', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(generate_lodas_file_header(consultant_number, client_number))
+        f.write(generate_record_description(context.record_types))
+        return write_employee_data(f, employees, context)
+
+def write_lodas_file_content(path, consultant_number, client_number, stammdaten, record_types=ALL_RECORD_TYPES):
+    """Write a LODAS file from an already serialized [Stammdaten] section."""
+    with open(path, 'w', encoding='cp1252', newline='\r\n', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(generate_lodas_file_header(consultant_number, client_number))
+        f.write(generate_record_description(record_types))
+        f.write(stammdaten)
+
+def get_parallel_worker_count(context, company_count):
+    """Get the number of worker processes for the export, 1 if parallel export is off."""
+    if not context.parallel_export or company_count < 2:
+        return 1
+    
+    workers = context.parallel_export_workers or os.cpu_count() or 1
+    return max(1, min(int(workers), company_count))
+
+def serialize_companies_in_parallel(employee_lists, context, workers):
+    """Serialize the [Stammdaten] section of each employee list in a process pool.
+    
+    Yields (section, snapshots) in input order. Workers only receive plain data (employees,
+    the export context and department codes), so they never touch the database or cache.
+    """
+    department_codes = get_department_codes()
+    
+    # Fork, so the workers inherit the employee data instead of receiving it pickled;
+    # only the company index is sent and the serialized section returned
+    fork_context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=fork_context,
+        initializer=_init_serialize_worker,
+        initargs=(employee_lists, context, department_codes)
+    ) as executor:
+        yield from executor.map(serialize_company_employees, range(len(employee_lists)))
+
+# Data of the current worker process, set by _init_serialize_worker
+_worker_data = {}
+
+def _init_serialize_worker(employee_lists, context, department_codes):
+    """Keep the inherited export data in the worker process."""
+    _worker_data.update(
+        employee_lists=employee_lists,
+        context=context,
+        department_codes=department_codes
+    )
+
+def serialize_company_employees(index):
+    """Serialize the [Stammdaten] section and snapshots for one company (runs in a worker process)."""
+    buffer = io.StringIO()
+    snapshots = write_employee_data(
+        buffer,
+        _worker_data['employee_lists'][index],
+        _worker_data['context'],
+        _worker_data['department_codes']
+    )
+    return buffer.getvalue(), snapshots
+
 def generate_lodas_file_header(consultant_number, client_number):
     """Generate the [Allgemein] section of the LODAS file - FIXED: Use correct timezone."""
     header = "[Allgemein]\n"
@@ -80,137 +277,112 @@ def generate_lodas_file_header(consultant_number, client_number):
     
     return header
 
-def generate_record_description():
-    """Generate the [Satzbeschreibung] section following exact Excel mapping."""
-    description = "[Satzbeschreibung]\n"
-    
-    # Record 1: u_lod_psd_mitarbeiter (Main employee data - following Excel mapping) - small change
-    description += "1;u_lod_psd_mitarbeiter;pnr#psd;duevo_familienname#psd;duevo_vorname#psd;"
-    description += "geschlecht#psd;geburtsdatum_ttmmjj#psd;adresse_nation_kz#psd;duevo_titel#psd;"
-    description += "kz_alleinerziehend#psd;adresse_anschriftenzusatz#psd;arbeitserlaubnis#psd;"
-    description += "aufenthaltserlaubnis#psd;geburtsland#psd;gebname#psd;gebort#psd;"
-    description += "email#psd;ersteintrittsdatum#psd;"
-    description += "verw_ersteintr_elena_bn#psd;adresse_strasse_nr#psd;adresse_ort#psd;"
-    description += "adresse_plz#psd;adresse_strassenname#psd;schwerbeschaedigt#psd;"
-    description += "staatsangehoerigkeit#psd;telefon#psd;familienstand#psd;"
-    description += "duevo_namenszusatz#psd;duevo_vorsatzwort#psd;nazu_gebname#psd;"
-    description += "vorsatzwort_gebname#psd;datum_studienbesch#psd;loesch_nach_austr_unterdr#psd;sozialversicherung_nr#psd;sba_ausbildungsbeginn#psd;sba_ausbildungsende#psd;ebz_nach_austritt_kz#psd;datum_tod#psd;\n"
-    
-    # Record 2: u_lod_psd_taetigkeit (Job/Activity - FIXED: Added additional field for fixed value 1)
-    description += "2;u_lod_psd_taetigkeit;pnr#psd;berufsbezeichnung#psd;beschaeft_nr#psd;kst_abteilungs_nr#psd;"
-    description += "schulabschluss#psd;ausbildungsabschluss#psd;ausbildungsbeginn#psd;vorr_ausbildungsende#psd;"
-    description += "datum_ben_ergeb_pruef#psd;ehrenamtliche_taetigkeit#psd;kz_erstbeschaeftigung#psd;kz_besch_nebenbesch#psd;\n"
-    
-    # Record 3: u_lod_psd_beschaeftigung (Employment - following Excel mapping)
-    description += "3;u_lod_psd_beschaeftigung;pnr#psd;arbeitsverhaeltnis#psd;eintrittdatum#psd;"
-    description += "austrittdatum#psd;eel_nach_austritt_kz#psd;\n"
-    
-    # Record 4: u_lod_psd_steuer (Tax - following Excel mapping)
-    description += "4;u_lod_psd_steuer;pnr#psd;identifikationsnummer#psd;st_klasse#psd;"
-    description += "konf_an#psd;kfb_anzahl#psd;pausch_einhtl_2#psd;els_2_haupt_ag_kz#psd;\n"
-    
-    # Record 5: u_lod_psd_ma_bank (Bank - keep current as shown in images)
-    description += "5;u_lod_psd_ma_bank;pnr#psd;ma_iban#psd;ma_bic#psd;"
-    description += "ma_bank_kto_inhaber_abw#psd;\n"
-    
-    # Record 6: u_lod_psd_schwerbeh (Disability - following Excel mapping)
-    description += "6;u_lod_psd_schwerbeh;pnr#psd;sba_sb_ausweis_bis#psd;sba_unter_18_std_aa_kz#psd;"
-    description += "sba_kz_dienststelle#psd;sba_az_geschaeftsstelle#psd;sba_ort_dienstelle#psd;"
-    description += "sba_sb_ausweis_ab#psd;\n"
-    
-    # Record 7: u_lod_psd_arbeitszeit_regelm (Working time - following Excel mapping)
-    description += "7;u_lod_psd_arbeitszeit_regelm;pnr#psd;az_wtl_indiv#psd;url_tage_jhrl#psd;urlaubsanspr_pro_jahr#psd;\n"
-    
-    # Record 8: u_lod_psd_lohn_gehalt_bezuege (Salary - keep current as shown in images)
-    description += "8;u_lod_psd_lohn_gehalt_bezuege;pnr#psd;std_lohn_1#psd;std_lohn_2#psd;lfd_brutto_vereinbart#psd;\n"
-    
-    # Record 9: u_lod_psd_fahrtkostenzuschuss (Travel subsidy - following Excel mapping)
-    description += "9;u_lod_psd_fahrtkostenzuschuss;pnr#psd;jobticket#psd;\n"
-    
-    # Record 10: u_lod_psd_besonderheiten (Special features - following Excel mapping)
-    description += "10;u_lod_psd_besonderheiten;pnr#psd;entlohnungsform#psd;\n"
-    
-    # Record 11: u_lod_psd_kindergeld (Children - keep current as shown in images)
-    description += "11;u_lod_psd_kindergeld;pnr#psd;kind_nr#psd;kind_vorname#psd;"
-    description += "kind_nachname#psd;kind_geburtsdatum#psd;\n"
-    
-    # Record 12: u_lod_psd_festbezuege (Fixed salary - keep current as shown in images)
-    description += "12;u_lod_psd_festbezuege;pnr#psd;festbez_id#psd;lohnart_nr#psd;betrag#psd;"
-    description += "intervall#psd;kuerzung#psd;\n"
-
-    description += "\n"
-    return description
-
-def format_numeric_value(value):
-    """Format numeric values to use comma instead of dot for decimal separator."""
-    if value is None or value == "" or str(value).lower() == "none":
-        return ""
-    
-    # Convert to string if not already
-    str_value = str(value)
+def generate_record_description(record_types=ALL_RECORD_TYPES):
+    """Generate the [Satzbeschreibung] section following exact Excel mapping (see record_spec).
     
-    # If it's a number, format it properly
-    try:
-        # Try to convert to float to check if it's numeric
-        float_value = float(str_value)
-        # Format with 2 decimal places and replace dot with comma
-        formatted = f"{float_value:.2f}".replace('.', ',')
-        return formatted
-    except (ValueError, TypeError):
-        # If it's not a number, return empty
-        return ""
+    Only the selected `record_types` are described, matching the records written.
+    """
+    return get_record_description(record_types)
 
-def clean_value(value):
-    """Clean values - replace 'None' and empty strings with empty."""
-    if value is None or value == "" or str(value).lower() == "none":
-        return ""
-    return str(value)
+def generate_employee_data(employees, settings, department_codes=None):
+    """Generate the [Stammdaten] section of the LODAS file as a string - NEW: with settings parameter."""
+    buffer = io.StringIO()
+    write_employee_data(buffer, employees, settings, department_codes)
+    return buffer.getvalue()
 
-def format_field(value, is_numeric=False, needs_quotes=True):
-    """Format field values according to DATEV requirements."""
-    if is_numeric:
-        cleaned = format_numeric_value(value)
-    else:
-        cleaned = clean_value(value)
-    
-    if cleaned == "":
-        return ""  # Empty field, no quotes
-    elif needs_quotes:
-        return f'"{cleaned}"'
-    else:
-        return cleaned
+def write_employee_data(f, employees, settings, department_codes=None):
+    """Write the [Stammdaten] section of the LODAS file to the text stream `f`.
+    
+    Returns the snapshot of the exported values per employee name (see export_snapshot).
+    """
+    f.write("[Stammdaten]\n")
+    return write_employee_records(f, employees, settings, department_codes)
 
-def generate_employee_data(employees, settings):
-    """Generate the [Stammdaten] section of the LODAS file - NEW: with settings parameter."""
-    data = "[Stammdaten]\n"
+def write_employee_records(f, employees, settings, department_codes=None):
+    """Write the records of the employees to the text stream `f`, without the section header.
+    
+    Returns the snapshot of the exported values per employee name (see export_snapshot).
+    """
+    snapshots = {}
+    
+    # Derive the restrictions once for all employees
+    context = get_export_context(settings)
+    
+    # Only map the fields written to the selected records (see export_plan)
+    mapping = get_export_plan(context.suppressed_columns, context.record_types).lodas_mapping
     
     for employee in employees:
         try:
             # Generate all records for this employee in correct order - NEW: Pass settings
-            data += generate_complete_employee_records(employee, settings)
+            records = generate_complete_employee_records(employee, context, department_codes, snapshots, mapping)
         except Exception as e:
             # frappe.log_error(f"Error generating records for employee {employee.get('name', 'Unknown')}: {str(e)}", 
             #               "DATEV Export Error")
             # Continue with next employee rather than failing the entire export
             continue
+        
+        f.write(records)
     
-    return data
+    return snapshots
 
-def generate_complete_employee_records(employee, settings):
-    """Generate all records for an employee following Excel structure - NEW: with settings parameter."""
+def generate_complete_employee_records(employee, settings, department_codes=None, snapshots=None, mapping=None):
+    """Generate all records for an employee following Excel structure - NEW: with settings parameter.
+    
+    Only the record types selected in the settings are written. If a `snapshots` dict is
+    passed, the snapshot of the exported values is stored in it under the employee name;
+    records not selected keep the values of the employee's last snapshot (`_datev_snapshot`).
+    With delta export enabled, values unchanged since that snapshot are left out. `mapping`
+    limits the mapped fields (see export_plan), by default all fields are mapped.
+    """
     data = ""
     
     try:
+        context = get_export_context(settings)
+        record_types = context.record_types
+        
+        # Map the employee once; all records below share the mapped data
+        if mapping is None:
+            mapped_data = map_employee_to_lodas(employee, department_codes)
+        else:
+            mapped_data = map_employee_to_lodas(employee, department_codes, mapping)
+        
+        # Snapshot of this export and the previous one for the delta export
+        snapshot = {} if snapshots is not None else None
+        previous = None
+        if snapshot is not None:
+            stored = employee.get('_datev_snapshot')
+            if context.delta_export:
+                previous = stored
+            if stored and record_types != ALL_RECORD_TYPES:
+                # DATEV still has the last exported values of the records not written now
+                snapshot.update(
+                    (key, digest) for key, digest in stored.items()
+                    if int(key.split('.')[0]) not in record_types
+                )
+        
         # Main employee records (records 1-10 + additional records) - NEW: Pass settings
-        data += generate_main_employee_records(employee, settings)
+        data += generate_main_employee_records(employee, context, mapped_data, snapshot, previous)
         
         # Child records (record 11) - ONLY if child data exists
-        if has_child_data(employee):
+        children = ""
+        if 11 in record_types and has_child_data(employee):
             for child in employee['children']:
-                data += generate_child_record(employee, child)
+                children += generate_child_record(employee, child, mapped_data)
         
         # Fixed salary components (record 12)
-        data += generate_festbezuege_records(employee)
+        festbezuege = ""
+        if 12 in record_types:
+            festbezuege = generate_festbezuege_records(employee, mapped_data, context)
+        
+        # Children and festbezuege are compared as a whole
+        if snapshot is not None:
+            if 11 in record_types:
+                children = serialize_record_group(11, children, snapshot, previous)
+            if 12 in record_types:
+                festbezuege = serialize_record_group(12, festbezuege, snapshot, previous)
+            snapshots[employee['name']] = snapshot
+        
+        data += children + festbezuege
         
     except Exception as e:
         # frappe.log_error(f"Error in generate_complete_employee_records for {employee.get('name', 'Unknown')}: {str(e)}", 
@@ -234,18 +406,20 @@ def has_child_data(employee):
     
     return False
 
-def has_disability_data(employee):
-    """Check if employee has any disability data to export."""
-    mapped_data = map_employee_to_lodas(employee)
+def has_disability_data(employee, mapped_data=None, suppressed_columns=frozenset()):
+    """Check if employee has any disability data to export.
+    
+    Columns of record 6 in `suppressed_columns` (export restrictions) don't count, so the
+    record is left out if only restricted fields have data.
+    """
+    if mapped_data is None:
+        mapped_data = map_employee_to_lodas(employee)
     
     # Check all disability-related fields
     disability_fields = [
-        mapped_data.get("sba_sb_ausweis_bis", ""),
-        mapped_data.get("sba_unter_18_std_aa_kz", ""),
-        mapped_data.get("sba_kz_dienststelle", ""),
-        mapped_data.get("sba_az_geschaeftsstelle", ""),
-        mapped_data.get("sba_ort_dienstelle", ""),
-        mapped_data.get("sba_sb_ausweis_ab", "")
+        mapped_data.get(key, "")
+        for index, key in enumerate(DISABILITY_FIELDS, 1)
+        if (6, index) not in suppressed_columns
     ]
     
     # Return True if any field has data
@@ -255,197 +429,37 @@ def has_disability_data(employee):
     
     return False
 
-# NEW FUNCTION: Apply dynamic export restrictions
-def apply_dynamic_export_restrictions(mapped_data, settings):
-    """Apply export restrictions dynamically to ALL fields based on child table settings."""
-    try:
-        # Get export restrictions from child table
-        restrictions = {}
-        if hasattr(settings, 'mehrfach_export_unterdruecken'):
-            for restriction in settings.mehrfach_export_unterdruecken:
-                restrictions[restriction.field_name] = restriction.no_export
-        
-        # Debug: Log what restrictions we found
-        # frappe.log_error(f"Found export restrictions: {restrictions}", "DATEV Export Debug")
-        
-        # Apply restrictions to any field that exists in mapped_data
-        for field_name, no_export in restrictions.items():
-            if no_export and field_name in mapped_data:
-                original_value = mapped_data[field_name]
-                mapped_data[field_name] = ""
-                # frappe.log_error(f"Field {field_name} restricted: '{original_value}' -> ''", "DATEV Export Dynamic Restriction")
-        
-        # Debug: Log the final mapped data for key fields
-        # debug_fields = ['st_klasse', 'duevo_familienname', 'duevo_vorname']
-        # for field in debug_fields:
-        #     if field in mapped_data:
-        #         frappe.log_error(f"Final {field} value: '{mapped_data[field]}'", "DATEV Export Debug")
-        
-        return mapped_data
-        
-    except Exception as e:
-        # frappe.log_error(f"Error applying dynamic export restrictions: {str(e)}", "DATEV Export Error")
-        return mapped_data  # Return original data on error
-
-def generate_main_employee_records(employee, settings):
-    """Generate records 1-10 following exact Excel field mapping with NEW: dynamic export restrictions."""
-    data = ""
-    mapped_data = map_employee_to_lodas(employee)
-    
-    # NEW: Apply dynamic export restrictions to ALL fields
-    mapped_data = apply_dynamic_export_restrictions(mapped_data, settings)
+def generate_main_employee_records(employee, settings, mapped_data=None, snapshot=None, previous=None):
+    """Generate records 1-10 following exact Excel field mapping with NEW: dynamic export restrictions.
     
-    try:
-        # Record type 1: Main employee data
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["duevo_familienname"], False, True),  # Last name (quoted) - NOW DYNAMICALLY RESTRICTED
-            format_field(mapped_data["duevo_vorname"], False, True),  # First name (quoted) - NOW DYNAMICALLY RESTRICTED
-            format_field(mapped_data["geschlecht"], False, False),  # Gender (no quotes)
-            format_field(mapped_data["geburtsdatum_ttmmjj"], False, False),  # Birth date (no quotes)
-            format_field(mapped_data["adresse_nation_kz"], False, False),  # Country (no quotes)
-            format_field(mapped_data["duevo_titel"], False, True),  # Academic title (quoted)
-            format_field(mapped_data["kz_alleinerziehend"], False, False),  # Single parent (no quotes)
-            format_field(mapped_data["adresse_anschriftenzusatz"], False, True),  # Address addition (quoted)
-            format_field(mapped_data["arbeitserlaubnis"], False, False),  # Work permit (no quotes)
-            format_field(mapped_data["aufenthaltserlaubnis"], False, False),  # Residence permit (no quotes)
-            format_field(mapped_data["geburtsland"], False, False),  # Birth country (no quotes)
-            format_field(mapped_data["gebname"], False, True),  # Birth name (quoted)
-            format_field(mapped_data["gebort"], False, True),  # Birth place (quoted)
-            format_field(mapped_data["email"], False, True),  # Email (quoted)
-            
-            format_field(mapped_data["ersteintrittsdatum"], False, False),  # First entry date (no quotes)
-            format_field(mapped_data["verw_ersteintr_elena_bn"], False, False),  # Use first entry for AAG (no quotes)
-            format_field(mapped_data["adresse_strasse_nr"], False, True),  # House number (quoted)
-            format_field(mapped_data["adresse_ort"], False, True),  # City (quoted)
-            format_field(mapped_data["adresse_plz"], False, False),  # Postal code (no quotes)
-            format_field(mapped_data["adresse_strassenname"], False, True),  # Street name (quoted)
-            format_field(mapped_data["schwerbeschaedigt"], False, False),  # Disability (no quotes)
-            format_field(mapped_data["staatsangehoerigkeit"], False, False),  # Nationality (no quotes)
-            format_field(mapped_data["telefon"], False, True),  # Phone (quoted)
-            format_field(mapped_data["familienstand"], False, False),  # Marital status (no quotes)
-            format_field(mapped_data["duevo_namenszusatz"], False, True),  # Name addition (quoted)
-            format_field(mapped_data["duevo_vorsatzwort"], False, True),  # Prefix word (quoted)
-            format_field(mapped_data["nazu_gebname"], False, True),  # Birth name addition (quoted)
-            format_field(mapped_data["vorsatzwort_gebname"], False, True),  # Birth name prefix (quoted)
-            format_field(mapped_data["datum_studienbesch"], False, False),  # Study certificate date (no quotes)
-            format_field(mapped_data["loesch_nach_austr_unterdr"], False, False),  # Suppress automatic deletion (no quotes)
-            format_field(mapped_data["sozialversicherung_nr"], False, True),  # Insurance number (quoted)
-            format_field(mapped_data["sba_ausbildungsbeginn"], False, False),  # Training start (no quotes)
-            format_field(mapped_data["sba_ausbildungsende"], False, False),  # Training end (no quotes)
-            format_field(mapped_data["ebz_nach_austritt_kz"], False, False),  # One-time payments after exit (no quotes)
-            format_field(mapped_data["datum_tod"], False, False),  # Date of death (no quotes)
-        ]
-        data += f'1;{";".join(fields)};\n'
-        
-        # Record type 2: Job/Activity
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["berufsbezeichnung"], False, True),  # Job title (quoted)
-            format_field(mapped_data["kst_abteilungs_nr"], False, True),  # Department number (quoted)
-            "1",  # Fixed value 1 as required
-            format_field(mapped_data["schulabschluss"], False, False),  # School education (no quotes)
-            format_field(mapped_data["ausbildungsabschluss"], False, False),  # Professional education (no quotes)
-            format_field(mapped_data["ausbildungsbeginn"], False, False),  # Training start (no quotes)
-            format_field(mapped_data["vorr_ausbildungsende"], False, False),  # Expected training end (no quotes)
-            format_field(mapped_data["datum_ben_ergeb_pruef"], False, False),  # Actual training end (no quotes)
-            format_field(mapped_data["ehrenamtliche_taetigkeit"], False, False) , # Voluntary work (no quotes)
-            format_field(mapped_data["kz_erstbeschaeftigung"], False, False),  # First employment (no quotes)
-            format_field(mapped_data["kz_besch_nebenbesch"], False, False)  # Certificate § 313 (no quotes)
-        ]
-        data += f'2;{";".join(fields)};\n'
-        
-        # Record type 3: Employment
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["arbeitsverhaeltnis"], False, False),  # Employment type (no quotes)
-            format_field(mapped_data["eintrittdatum"], False, False),  # Entry date (no quotes)
-            format_field(mapped_data["austrittdatum"], False, False),  # Exit date (no quotes)
-            # format_field(mapped_data["kz_arbbes_nae_abrech_autom"], False, False),  # Work certificate (no quotes)
-            format_field(mapped_data["eel_nach_austritt_kz"], False, False),  # EEL after exit (no quotes)
-        ]
-        data += f'3;{";".join(fields)};\n'
-        
-        # Record type 4: Tax - All restrictions applied dynamically above
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["identifikationsnummer"], False, True),  # Tax ID (quoted)
-            format_field(mapped_data["st_klasse"], False, False),  # Tax class (no quotes) - NOW DYNAMICALLY RESTRICTED
-            format_field(mapped_data["konf_an"], False, False),  # Religion (no quotes)
-            format_field(mapped_data["kfb_anzahl"], True, False),  # Number of child allowances (numeric, no quotes)
-            format_field(mapped_data["pausch_einhtl_2"], False, False),  # Flat tax (no quotes)
-            format_field(mapped_data["els_2_haupt_ag_kz"], False, False)  # Main/secondary employer (no quotes)
-        ]
-        data += f'4;{";".join(fields)};\n'
-        
-        # Record type 5: Bank
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["ma_iban"], False, True),  # IBAN (quoted)
-            format_field(mapped_data["ma_bic"], False, True),  # BIC (quoted)
-            format_field(mapped_data["ma_bank_kto_inhaber_abw"], False, True)  # Account holder (quoted)
-        ]
-        data += f'5;{";".join(fields)};\n'
-        
-        # Record type 6: Disability - ONLY if disability data exists
-        if has_disability_data(employee):
-            fields = [
-                format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-                format_field(mapped_data["sba_sb_ausweis_bis"], False, False),  # Disability ID valid until (no quotes)
-                format_field(mapped_data["sba_unter_18_std_aa_kz"], False, False),  # Under 18 hours with AA approval (no quotes)
-                format_field(mapped_data["sba_kz_dienststelle"], False, True),  # Issuing authority (quoted)
-                format_field(mapped_data["sba_az_geschaeftsstelle"], False, True),  # ID number/file number (quoted)
-                format_field(mapped_data["sba_ort_dienstelle"], False, True),  # Authority location (quoted)
-                format_field(mapped_data["sba_sb_ausweis_ab"], False, False)  # Disability ID valid from (no quotes)
-            ]
-            data += f'6;{";".join(fields)};\n'
-        
-        # Record type 7: Working time - All restrictions applied dynamically above
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["az_wtl_indiv"], True, False),  # Weekly working hours (numeric, no quotes) - NOW DYNAMICALLY RESTRICTED
-            format_field(mapped_data["url_tage_jhrl"], True, False),  # Vacation days yearly (numeric, no quotes)
-            format_field(mapped_data.get("urlaubsanspr_pro_jahr", ""), True, False)  # MPD working time (numeric, no quotes)
-        ]
-        data += f'7;{";".join(fields)};\n'
-        
-        # Record type 8: Salary
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data.get("std_lohn_1", ""), True, False) , # Standard hourly wage (numeric, no quotes)
-            format_field(mapped_data["std_lohn_2"], True, False),  # Hourly wage 1 (numeric, no quotes)
-            format_field(mapped_data["lfd_brutto_vereinbart"], True, False)  # Current gross agreed (numeric, no quotes)
-        ]
-        data += f'8;{";".join(fields)};\n'
-        
-        # Record type 9: Travel subsidy
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["jobticket"], True, False)  # Job ticket (numeric, no quotes)
-        ]
-        data += f'9;{";".join(fields)};\n'
-        
-        # Record type 10: Special features
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["entlohnungsform"], False, False)  # Remuneration form (no quotes)
-        ]
-        data += f'10;{";".join(fields)};\n'
-        
-    except KeyError as e:
-        # frappe.log_error(f"Missing key in employee data: {str(e)} for employee {employee.get('name', 'Unknown')}", 
-        #               "DATEV Export Error")
-        # Create a placeholder for the missing field
-        mapped_data[str(e).strip("'")] = ""
-        # Try again recursively with the fixed data
-        return generate_main_employee_records(employee, settings)
-    except Exception as e:
-        # frappe.log_error(f"Error in generate_main_employee_records: {str(e)}", "DATEV Export Error")
-        raise
+    With a `snapshot` dict the column hashes are stored in it; with the `previous` snapshot
+    unchanged columns are left empty (see export_snapshot.serialize_main_record).
+    """
+    data = ""
+    if mapped_data is None:
+        mapped_data = map_employee_to_lodas(employee)
+    
+    # NEW: Export restrictions are compiled into serializers that leave the restricted
+    # columns empty, so the mapped data is neither copied nor changed per employee
+    context = get_export_context(settings)
+    suppressed_columns = context.suppressed_columns
+    serializers = get_record_serializers(suppressed_columns)
+    formatters = get_record_formatters(suppressed_columns)
+    
+    # Records 1-10 of the selection - record 6 ONLY if disability data exists
+    for record_number in MAIN_RECORD_NUMBERS:
+        if record_number not in context.record_types:
+            continue
+        if record_number == 6 and not has_disability_data(employee, mapped_data, suppressed_columns):
+            continue
+        if snapshot is None:
+            data += serializers[record_number](mapped_data)
+        else:
+            data += serialize_main_record(record_number, mapped_data, snapshot, previous, formatters)
     
     return data
 
-def generate_child_record(employee, child):
+def generate_child_record(employee, child, mapped_data=None):
     """Generate a child record (type 11) - only if child has data."""
     data = ""
     
@@ -457,17 +471,10 @@ def generate_child_record(employee, child):
                 child.get('geburtsdatum_personaldaten_kinderdaten_allgemeine_angaben')):
             return ""  # Skip this child if no data
         
-        mapped_data = map_child_to_lodas(employee, child)
+        mapped_data = map_child_to_lodas(employee, child, mapped_data)
         
         # Record type 11: Child information
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field(mapped_data["kind_nr"], False, False),  # Child number (no quotes)
-            format_field(mapped_data["kind_vorname"], False, True),  # Child first name (quoted)
-            format_field(mapped_data["kind_nachname"], False, True),  # Child last name (quoted)
-            format_field(mapped_data["kind_geburtsdatum"], False, False)  # Child birth date (no quotes)
-        ]
-        data += f'11;{";".join(fields)};\n'
+        data += RECORD_SERIALIZERS[11](mapped_data)
         
     except Exception as e:
         # frappe.log_error(f"Error generating child record for employee {employee.get('name', 'Unknown')}: {str(e)}", 
@@ -477,10 +484,21 @@ def generate_child_record(employee, child):
     
     return data
 
-def generate_festbezuege_records(employee):
-    """Generate festbezuege records (type 12) with festbez_id field."""
+def generate_festbezuege_records(employee, mapped_data=None, settings=None):
+    """Generate festbezuege records (type 12) with festbez_id field.
+    
+    With `settings` the export restrictions apply: restricted wage fields of the employee are
+    read as empty and restricted columns (lohnart_nr, betrag) are left empty.
+    """
     data = ""
-    mapped_data = map_employee_to_lodas(employee)
+    if mapped_data is None:
+        mapped_data = map_employee_to_lodas(employee)
+    
+    serializer = RECORD_SERIALIZERS[12]
+    if settings is not None:
+        context = get_export_context(settings)
+        employee = mask_festbezuege_fields(employee, context.restricted_fields)
+        serializer = get_record_serializers(context.suppressed_columns)[12]
     
     try:
         # DEBUG: Log employee data for salary records
@@ -493,15 +511,7 @@ def generate_festbezuege_records(employee):
         amount = "0" if not basic_salary else basic_salary
         # frappe.log_error(f"Grundgehalt (ID 1): lohnart_gg={lohnart_gg}, basic_salary={basic_salary}, amount={amount}", "DATEV Export Debug")
         
-        fields = [
-            format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-            format_field("1", False, False),  # FIXED: festbez_id = 1 (no quotes)
-            format_field(lohnart_gg, False, False),  # Lohnart number (no quotes)
-            format_field(amount, True, False),  # Amount (numeric, no quotes)
-            format_field("0", False, False),  # Interval (no quotes)
-            format_field("0", False, False)  # Reduction (no quotes)
-        ]
-        data += f'12;{";".join(fields)};\n'
+        data += serialize_festbezug(mapped_data["pnr"], "1", lohnart_gg, amount, serializer)  # FIXED: festbez_id = 1
         
         # 2-5. Project salaries (P1-P4) - festbez_id = 2, 3, 4, 5
         for i in range(1, 5):
@@ -519,15 +529,7 @@ def generate_festbezuege_records(employee):
             
             # frappe.log_error(f"Project {i} (ID {festbez_id}): {field_name}={lohnart_nummer}, {project_salary_field}={project_salary_value}, amount={amount}", "DATEV Export Debug")
             
-            fields = [
-                format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-                format_field(festbez_id, False, False),  # FIXED: festbez_id (no quotes)
-                format_field(lohnart_nummer, False, False),  # Lohnart number (no quotes)
-                format_field(amount, True, False),  # Amount (numeric, no quotes)
-                format_field("0", False, False),  # Interval (no quotes)
-                format_field("0", False, False)  # Reduction (no quotes)
-            ]
-            data += f'12;{";".join(fields)};\n'
+            data += serialize_festbezug(mapped_data["pnr"], festbez_id, lohnart_nummer, amount, serializer)
         
         # 6-7. Supplementary salaries (Z1-Z2) - festbez_id = 6, 7
         for i in range(1, 3):
@@ -545,15 +547,7 @@ def generate_festbezuege_records(employee):
             
             # frappe.log_error(f"Supplement {i} (ID {festbez_id}): {field_name}={lohnart_nummer}, {supplement_field}={supplement_value}, amount={amount}", "DATEV Export Debug")
             
-            fields = [
-                format_field(mapped_data["pnr"], False, True),  # Employee number (quoted)
-                format_field(festbez_id, False, False),  # FIXED: festbez_id (no quotes)
-                format_field(lohnart_nummer, False, False),  # Lohnart number (no quotes)
-                format_field(amount, True, False),  # Amount (numeric, no quotes)
-                format_field("0", False, False),  # Interval (no quotes)
-                format_field("0", False, False)  # Reduction (no quotes)
-            ]
-            data += f'12;{";".join(fields)};\n'
+            data += serialize_festbezug(mapped_data["pnr"], festbez_id, lohnart_nummer, amount, serializer)
             
     except Exception as e:
         # frappe.log_error(f"Error in generate_festbezuege_records for employee {employee.get('name', 'Unknown')}: {str(e)}", 
@@ -563,6 +557,15 @@ def generate_festbezuege_records(employee):
     
     return data
 
+def serialize_festbezug(pnr, festbez_id, lohnart_nummer, amount, serializer=None):
+    """Serialize one festbezuege record (type 12); interval and reduction are always 0 (see record_spec)."""
+    return (serializer or RECORD_SERIALIZERS[12])({
+        'pnr': pnr,
+        'festbez_id': festbez_id,
+        'lohnart_nr': lohnart_nummer,
+        'betrag': amount
+    })
+
 def determine_basic_salary(employee):
     """Determine the basic salary - keep current logic as shown in images."""
     try:
@@ -638,12 +641,11 @@ def determine_basic_salary(employee):
 
 def generate_single_employee_file(employee, settings):
     """Generate LODAS file for a single employee - FIXED: Use correct timezone for filename and NEW: with settings parameter."""
-    consultant_number = settings.consultant_number
+    context = get_export_context(settings)
+    consultant_number = context.consultant_number
     
     # Get company to client number mapping
-    client_numbers = {}
-    for mapping in settings.company_client_mapping:
-        client_numbers[mapping.company] = mapping.client_number
+    client_numbers = context.client_numbers
     
     # Skip if no mapping exists for the employee's company
     if employee['company'] not in client_numbers:
@@ -654,11 +656,6 @@ def generate_single_employee_file(employee, settings):
     # REMOVED: Duplicate Personalerfassungsbogen logic (now handled in prepare_employee_dict)
     # Data consistency is now ensured by using the same logic as bulk export
     
-    # Generate file content - NEW: Pass settings for dynamic restrictions
-    content = generate_lodas_file_header(consultant_number, client_number)
-    content += generate_record_description()
-    content += generate_employee_data([employee], settings)
-    
     # Create temporary file with correct timezone timestamp
     # FIXED: Use now_datetime() and format with correct timezone
     current_time = now_datetime()
@@ -666,8 +663,9 @@ def generate_single_employee_file(employee, settings):
     filename = f"DATEV_LODAS_Single_{employee['name']}_{timestamp}.txt"
     temp_path = os.path.join(tempfile.gettempdir(), filename)
     
-    with open(temp_path, 'w', encoding='cp1252', newline='\r\n') as f:
-        f.write(content)
+    # Write file content - NEW: Pass settings for dynamic restrictions
+    start = time.perf_counter()
+    snapshots = write_lodas_file(temp_path, consultant_number, client_number, [employee], context)
     
     # Count children
     children_count = len(employee.get('children', []))
@@ -681,6 +679,10 @@ def generate_single_employee_file(employee, settings):
         'path': temp_path,
         'filename': filename,
         'company': employee['company'],
+        'client_number': client_number,
         'employee_count': 1,
-        'children_count': children_count
+        'children_count': children_count,
+        'file_size': os.path.getsize(temp_path),
+        'duration': time.perf_counter() - start,
+        'snapshots': snapshots
     }]
\ No newline at end of file
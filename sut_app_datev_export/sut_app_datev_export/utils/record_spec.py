@@ -0,0 +1,346 @@
+from collections import namedtuple
+from functools import lru_cache
+
+# Field types
+TEXT = 'text'      # String, written in quotes
+CODE = 'code'      # Codes, dates and identifiers, written without quotes
+NUMBER = 'number'  # Numeric value with two decimals and comma, written without quotes
+
+# A LODAS column: `name` is the column in the [Satzbeschreibung], `source` the key in
+# the mapped employee data (defaults to `name`), `value` a fixed value for the column.
+Field = namedtuple('Field', ['name', 'type', 'source', 'max_length', 'value'], defaults=[None, None, None])
+
+# A LODAS record type: record number, LODAS table and its columns
+Record = namedtuple('Record', ['number', 'table', 'fields'])
+
+# All record types following the Excel mapping. Max lengths follow the length of the source fields.
+RECORD_SPECS = (
+    # Record 1: Main employee data
+    Record(1, 'u_lod_psd_mitarbeiter', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('duevo_familienname', TEXT, max_length=30),    # Last name
+        Field('duevo_vorname', TEXT, max_length=30),         # First name
+        Field('geschlecht', CODE),                           # Gender
+        Field('geburtsdatum_ttmmjj', CODE),                  # Birth date
+        Field('adresse_nation_kz', CODE),                    # Country
+        Field('duevo_titel', TEXT),                          # Academic title
+        Field('kz_alleinerziehend', CODE),                   # Single parent
+        Field('adresse_anschriftenzusatz', TEXT, max_length=40),  # Address addition
+        Field('arbeitserlaubnis', CODE),                     # Work permit
+        Field('aufenthaltserlaubnis', CODE),                 # Residence permit
+        Field('geburtsland', CODE),                          # Birth country
+        Field('gebname', TEXT),                              # Birth name
+        Field('gebort', TEXT),                               # Birth place
+        Field('email', TEXT, max_length=60),                 # Email
+        Field('ersteintrittsdatum', CODE),                   # First entry date
+        Field('verw_ersteintr_elena_bn', CODE),              # Use first entry for AAG
+        Field('adresse_strasse_nr', TEXT, max_length=10),    # House number
+        Field('adresse_ort', TEXT, max_length=34),           # City
+        Field('adresse_plz', CODE, max_length=5),            # Postal code
+        Field('adresse_strassenname', TEXT, max_length=32),  # Street name
+        Field('schwerbeschaedigt', CODE),                    # Disability
+        Field('staatsangehoerigkeit', CODE),                 # Nationality
+        Field('telefon', TEXT),                              # Phone
+        Field('familienstand', CODE),                        # Marital status
+        Field('duevo_namenszusatz', TEXT),                   # Name addition
+        Field('duevo_vorsatzwort', TEXT),                    # Prefix word
+        Field('nazu_gebname', TEXT),                         # Birth name addition
+        Field('vorsatzwort_gebname', TEXT),                  # Birth name prefix
+        Field('datum_studienbesch', CODE),                   # Study certificate date
+        Field('loesch_nach_austr_unterdr', CODE),            # Suppress automatic deletion
+        Field('sozialversicherung_nr', TEXT),                # Insurance number
+        Field('sba_ausbildungsbeginn', CODE),                # Training start
+        Field('sba_ausbildungsende', CODE),                  # Training end
+        Field('ebz_nach_austritt_kz', CODE),                 # One-time payments after exit
+        Field('datum_tod', CODE),                            # Date of death
+    )),
+
+    # Record 2: Job/Activity
+    Record(2, 'u_lod_psd_taetigkeit', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('berufsbezeichnung', TEXT),                    # Job title
+        # The department code has always been exported in the third column and the
+        # fixed value 1 in the fourth; kept as is to not change the generated files
+        Field('beschaeft_nr', TEXT, source='kst_abteilungs_nr', max_length=8),  # Department number
+        Field('kst_abteilungs_nr', CODE, value='1'),         # Fixed value 1 as required
+        Field('schulabschluss', CODE),                       # School education
+        Field('ausbildungsabschluss', CODE),                 # Professional education
+        Field('ausbildungsbeginn', CODE),                    # Training start
+        Field('vorr_ausbildungsende', CODE),                 # Expected training end
+        Field('datum_ben_ergeb_pruef', CODE),                # Actual training end
+        Field('ehrenamtliche_taetigkeit', CODE),             # Voluntary work
+        Field('kz_erstbeschaeftigung', CODE),                # First employment
+        Field('kz_besch_nebenbesch', CODE),                  # Certificate § 313
+    )),
+
+    # Record 3: Employment
+    Record(3, 'u_lod_psd_beschaeftigung', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('arbeitsverhaeltnis', CODE),                   # Employment type
+        Field('eintrittdatum', CODE),                        # Entry date
+        Field('austrittdatum', CODE),                        # Exit date
+        Field('eel_nach_austritt_kz', CODE),                 # EEL after exit
+    )),
+
+    # Record 4: Tax
+    Record(4, 'u_lod_psd_steuer', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('identifikationsnummer', TEXT, max_length=11),  # Tax ID
+        Field('st_klasse', CODE),                            # Tax class
+        Field('konf_an', CODE),                              # Religion
+        Field('kfb_anzahl', NUMBER),                         # Number of child allowances
+        Field('pausch_einhtl_2', CODE),                      # Flat tax
+        Field('els_2_haupt_ag_kz', CODE),                    # Main/secondary employer
+    )),
+
+    # Record 5: Bank
+    Record(5, 'u_lod_psd_ma_bank', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('ma_iban', TEXT),                              # IBAN
+        Field('ma_bic', TEXT),                               # BIC
+        Field('ma_bank_kto_inhaber_abw', TEXT),              # Account holder
+    )),
+
+    # Record 6: Disability - only if disability data exists
+    Record(6, 'u_lod_psd_schwerbeh', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('sba_sb_ausweis_bis', CODE),                   # Disability ID valid until
+        Field('sba_unter_18_std_aa_kz', CODE),               # Under 18 hours with AA approval
+        Field('sba_kz_dienststelle', TEXT),                  # Issuing authority
+        Field('sba_az_geschaeftsstelle', TEXT),              # ID number/file number
+        Field('sba_ort_dienstelle', TEXT),                   # Authority location
+        Field('sba_sb_ausweis_ab', CODE),                    # Disability ID valid from
+    )),
+
+    # Record 7: Working time
+    Record(7, 'u_lod_psd_arbeitszeit_regelm', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('az_wtl_indiv', NUMBER),                       # Weekly working hours
+        Field('url_tage_jhrl', NUMBER),                      # Vacation days yearly
+        Field('urlaubsanspr_pro_jahr', NUMBER),              # Basic vacation entitlement
+    )),
+
+    # Record 8: Salary
+    Record(8, 'u_lod_psd_lohn_gehalt_bezuege', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('std_lohn_1', NUMBER),                         # Standard hourly wage
+        Field('std_lohn_2', NUMBER),                         # Hourly wage 1
+        Field('lfd_brutto_vereinbart', NUMBER),              # Current gross agreed
+    )),
+
+    # Record 9: Travel subsidy
+    Record(9, 'u_lod_psd_fahrtkostenzuschuss', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('jobticket', NUMBER),                          # Job ticket
+    )),
+
+    # Record 10: Special features
+    Record(10, 'u_lod_psd_besonderheiten', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('entlohnungsform', CODE),                      # Remuneration form
+    )),
+
+    # Record 11: Children - one record per child
+    Record(11, 'u_lod_psd_kindergeld', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('kind_nr', CODE),                              # Child number
+        Field('kind_vorname', TEXT, max_length=30),          # Child first name
+        Field('kind_nachname', TEXT, max_length=30),         # Child last name
+        Field('kind_geburtsdatum', CODE),                    # Child birth date
+    )),
+
+    # Record 12: Fixed salary components - one record per component
+    Record(12, 'u_lod_psd_festbezuege', (
+        Field('pnr', TEXT),                                  # Employee number
+        Field('festbez_id', CODE),                           # Component id
+        Field('lohnart_nr', CODE),                           # Lohnart number
+        Field('betrag', NUMBER),                             # Amount
+        Field('intervall', CODE, value='0'),                 # Interval, always 0
+        Field('kuerzung', CODE, value='0'),                  # Reduction, always 0
+    )),
+)
+
+RECORDS_BY_NUMBER = {record.number: record for record in RECORD_SPECS}
+
+# Main records written for every employee, in file order
+MAIN_RECORD_NUMBERS = (1, 2, 3, 4, 5, 6, 7, 8, 9, 10)
+
+# Record types written by a full export
+ALL_RECORD_TYPES = frozenset(RECORDS_BY_NUMBER)
+
+# Characters that would break a record: quotes are doubled inside quoted strings,
+# line breaks are replaced, and unquoted values lose separators and quotes.
+_QUOTED_TRANSLATION = str.maketrans({'"': '""', '\r': ' ', '\n': ' '})
+_UNQUOTED_TRANSLATION = str.maketrans({';': None, '"': None, '\r': None, '\n': None})
+
+def format_numeric_value(value):
+    """Format numeric values to use comma instead of dot for decimal separator."""
+    if value is None or value == "" or str(value).lower() == "none":
+        return ""
+
+    # Convert to string if not already
+    str_value = str(value)
+
+    # If it's a number, format it properly
+    try:
+        # Try to convert to float to check if it's numeric
+        float_value = float(str_value)
+        # Format with 2 decimal places and replace dot with comma
+        formatted = f"{float_value:.2f}".replace('.', ',')
+        return formatted
+    except (ValueError, TypeError):
+        # If it's not a number, return empty
+        return ""
+
+def clean_value(value):
+    """Clean values - replace 'None' and empty strings with empty."""
+    if value is None or value == "" or str(value).lower() == "none":
+        return ""
+    return str(value)
+
+def format_field(value, is_numeric=False, needs_quotes=True):
+    """Format field values according to DATEV requirements."""
+    if is_numeric:
+        cleaned = format_numeric_value(value)
+    else:
+        cleaned = clean_value(value)
+
+    if cleaned == "":
+        return ""  # Empty field, no quotes
+    elif needs_quotes:
+        return f'"{cleaned.translate(_QUOTED_TRANSLATION)}"'
+    else:
+        return cleaned.translate(_UNQUOTED_TRANSLATION)
+
+def build_field_formatter(field):
+    """Build the formatter for one column, resolving its type up front.
+
+    Values are never cut to the max length, longer values are reported by the validation
+    (see employee_data.get_employee_validation_errors).
+    """
+    if field.value is not None:
+        value = field.value
+        return lambda mapped_data: value
+
+    source = field.source or field.name
+
+    if field.type == NUMBER:
+        return lambda mapped_data: format_numeric_value(mapped_data.get(source, ""))
+
+    if field.type == TEXT:
+        def format_text(mapped_data):
+            cleaned = clean_value(mapped_data.get(source, ""))
+            return f'"{cleaned.translate(_QUOTED_TRANSLATION)}"' if cleaned else ""
+        return format_text
+
+    def format_code(mapped_data):
+        return clean_value(mapped_data.get(source, "")).translate(_UNQUOTED_TRANSLATION)
+    return format_code
+
+def format_suppressed(mapped_data):
+    """Formatter of a column suppressed by an export restriction."""
+    return ""
+
+def build_field_formatters(record, suppressed=()):
+    """Formatters of all columns of a record; columns with an index in `suppressed` stay empty."""
+    return tuple(
+        format_suppressed if index in suppressed else build_field_formatter(field)
+        for index, field in enumerate(record.fields)
+    )
+
+def compile_record_formatter(record, suppressed=()):
+    """Compile a record spec into a function turning mapped data into the list of formatted columns."""
+    formatters = build_field_formatters(record, suppressed)
+
+    def format_record(mapped_data):
+        return [formatter(mapped_data) for formatter in formatters]
+
+    return format_record
+
+def join_record(number, values):
+    """Join formatted columns into one LODAS line of record type `number`."""
+    return f"{number};" + ";".join(values) + ";\n"
+
+def compile_record_serializer(record, suppressed=()):
+    """Compile a record spec into a function turning mapped data into one LODAS line.
+
+    Missing keys in the mapped data and the column indexes in `suppressed` are exported as
+    empty fields.
+    """
+    prefix = f"{record.number};"
+    formatters = build_field_formatters(record, suppressed)
+
+    def serialize(mapped_data):
+        return prefix + ";".join([formatter(mapped_data) for formatter in formatters]) + ";\n"
+
+    return serialize
+
+def build_record_description(records=RECORD_SPECS):
+    """Build the [Satzbeschreibung] section for the given record specs."""
+    description = "[Satzbeschreibung]\n"
+    for record in records:
+        description += f"{record.number};{record.table};"
+        description += "".join(f"{field.name}#psd;" for field in record.fields)
+        description += "\n"
+    description += "\n"
+    return description
+
+def parse_record_types(value):
+    """Parse a selection of record types ("5", "1,3", [1, 3]) into a frozenset of record numbers.
+
+    An empty selection means all record types. Raises ValueError for unknown record types.
+    """
+    if not value:
+        return ALL_RECORD_TYPES
+    if isinstance(value, int):
+        value = [value]
+    elif isinstance(value, str):
+        value = value.replace(';', ',').replace(' ', ',').split(',')
+
+    record_types = set()
+    unknown = []
+    for item in value:
+        item = str(item).strip()
+        if not item:
+            continue
+        if item.isdigit() and int(item) in RECORDS_BY_NUMBER:
+            record_types.add(int(item))
+        else:
+            unknown.append(item)
+
+    if unknown:
+        raise ValueError(", ".join(unknown))
+    return frozenset(record_types) or ALL_RECORD_TYPES
+
+@lru_cache(maxsize=16)
+def get_record_description(record_types=ALL_RECORD_TYPES):
+    """The [Satzbeschreibung] section of the selected record types."""
+    if record_types == ALL_RECORD_TYPES:
+        return RECORD_DESCRIPTION
+    return build_record_description([record for record in RECORD_SPECS if record.number in record_types])
+
+def get_suppressed_indexes(number, suppressed_columns):
+    """Column indexes of record `number` in a set of (record number, column index) positions."""
+    return frozenset(index for record_number, index in suppressed_columns if record_number == number)
+
+@lru_cache(maxsize=16)
+def get_record_serializers(suppressed_columns=frozenset()):
+    """Serializers of all record types, with the (record number, column index) positions in
+    `suppressed_columns` left empty; compiled once per set of positions."""
+    return {
+        record.number: compile_record_serializer(record, get_suppressed_indexes(record.number, suppressed_columns))
+        for record in RECORD_SPECS
+    }
+
+@lru_cache(maxsize=16)
+def get_record_formatters(suppressed_columns=frozenset()):
+    """Column formatters of all record types, with the positions in `suppressed_columns` left empty."""
+    return {
+        record.number: compile_record_formatter(record, get_suppressed_indexes(record.number, suppressed_columns))
+        for record in RECORD_SPECS
+    }
+
+# Precompiled serializers, column formatters and description for all record types
+RECORD_SERIALIZERS = get_record_serializers()
+RECORD_FORMATTERS = get_record_formatters()
+RECORD_DESCRIPTION = build_record_description()